@@ -0,0 +1,15 @@
+# Benchmarks of the analysis hot paths (force extraction, umbrella integration, block analysis, placement of the plastic, Bayesian quadrature) on synthetic data.
+# Run from the repo folder:
+# python3 -m benchmarks --save      (times everything and saves the results as the baseline, benchmarks/baseline.json)
+# python3 -m benchmarks             (times everything again and compares with the baseline: slower by more than --tolerance or different results are reported)
+# python3 -m benchmarks -k integrate --sizes small
+# The baseline depends on the machine, so it is not part of the repo: without one, the timings are only printed and a warning says that nothing was compared.
+# The synthetic inputs are generated in a temporary folder (benchmarks/synthetic.py), no simulation output is needed.
+# The placement benchmark needs mdtraj, like put_together.py; benchmarks whose dependencies are missing are skipped.
+
+import os
+import sys
+
+# the scripts of this repo (bpns package, get_force.py, put_together.py) are imported from the repo itself
+repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(repo_path, 'scripts'))
@@ -0,0 +1,95 @@
+# Runs the benchmarks and compares them with the baseline, see benchmarks/__init__.py.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+
+from benchmarks import repo_path
+from benchmarks.cases import cases
+
+baseline_file = os.path.join(repo_path, 'benchmarks', 'baseline.json')
+
+
+def time_case(func, size, repeat):
+    '''Prepares the case in a temporary folder and returns the best time of repeat runs (s) and the result of the last run.'''
+    with tempfile.TemporaryDirectory() as workdir:
+        run = func(workdir, size)
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = run()
+            times.append(time.perf_counter() - started)
+    return min(times), [float(v) for v in np.ravel(np.asarray(result, dtype=np.float64))]
+
+
+def compare(name, current, baseline, tolerance, rtol):
+    '''Returns the problems of one case compared with its baseline (empty if none).'''
+    problems = []
+    ratio = current['time'] / baseline['time']
+    if ratio > tolerance:
+        problems.append(f"{name}: {ratio:.2f}x slower than the baseline ({current['time']:.3f} s vs {baseline['time']:.3f} s)")
+    if len(current['result']) != len(baseline['result']) or not np.allclose(current['result'], baseline['result'], rtol=rtol, atol=1e-12):
+        problems.append(f"{name}: results differ from the baseline")
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the analysis hot paths on synthetic data.')
+    parser.add_argument('-k', '--only', nargs='*', default=list(cases), help='cases to run (default: all)')
+    parser.add_argument('--sizes', choices=['small', 'full'], default='full', help='input sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best time is used')
+    parser.add_argument('--save', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='slowdown factor reported as a regression')
+    parser.add_argument('--rtol', type=float, default=1e-6, help='relative tolerance of the results')
+    parser.add_argument('--baseline', default=baseline_file, help='baseline file')
+    args = parser.parse_args()
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['cases']
+    except FileNotFoundError:
+        baseline = {}
+        if not args.save:
+            print(f"WARNING: no baseline in {args.baseline}, the timings and results are not compared with anything; "
+                  f"run python3 -m benchmarks --save on a reference version first")
+
+    results = {}
+    problems = []
+    for name in args.only:
+        func, sizes = cases[name]
+        for size in sizes[args.sizes]:
+            key = f"{name}[{size}]"
+            try:
+                t, result = time_case(func, size, args.repeat)
+            except ImportError as err:
+                print(f"{key:32s} skipped ({err})")
+                continue
+            except Exception as err:
+                print(f"{key:32s} FAILED: {err!r}")
+                problems.append(f"{key}: failed ({err!r})")
+                continue
+            results[key] = {'time': t, 'result': result}
+            line = f"{key:32s} {t:10.4f} s"
+            if key in baseline:
+                line += f"   baseline {baseline[key]['time']:10.4f} s   ratio {t / baseline[key]['time']:6.2f}"
+                problems += compare(key, results[key], baseline[key], args.tolerance, args.rtol)
+            elif baseline:
+                line += '   not in the baseline, not compared'
+            print(line, flush=True)
+
+    if args.save:
+        # cases which were not run keep their previous baseline
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.node(), 'cases': baseline}, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    elif problems:
+        print('\n'.join(problems))
+        sys.exit(1)
+    elif not baseline:
+        print('WARNING: no comparison was made, regressions cannot be reported without a baseline')
@@ -0,0 +1,217 @@
+# Benchmark cases: each case prepares its synthetic inputs for a given size and returns the function which is timed.
+# The timed function returns numbers (e.g. the force or the free-energy profile) which are compared with the baseline as well,
+# so that an optimisation which changes the results is noticed.
+# Functions defined in the notebooks (integrate, block_analysis, integrate_bayesian1D) are taken from the notebook cells themselves.
+
+import glob
+import json
+import os
+import numpy as np
+
+from benchmarks import repo_path
+from benchmarks.synthetic import write_windows, write_protein_pdb, write_plastic_pdb, force_dataset
+
+
+def notebook_function(notebook, name, namespace):
+    '''Runs the code cell of the notebook (in notebooks/) which defines the function name, in namespace, and returns the function.'''
+    with open(os.path.join(repo_path, 'notebooks', notebook)) as f:
+        cells = json.load(f)['cells']
+    for cell in cells:
+        source = ''.join(cell['source'])
+        if cell['cell_type'] == 'code' and f"def {name}(" in source:
+            exec(source, namespace)
+            return namespace[name]
+    raise ValueError(f"No function {name} in {notebook}")
+
+
+def _plt():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _integration_namespace():
+    from bpns.colvar import load_colvar, restraint_force
+    from bpns.blocks import block_means
+    from bpns.umbrella import load_windows, free_energy, block_size_study, integrate_systems
+    return {'np': np, 'os': os, 'plt': _plt(), 'load_colvar': load_colvar, 'restraint_force': restraint_force, 'block_means': block_means,
+            'load_windows': load_windows, 'free_energy': free_energy, 'block_size_study': block_size_study, 'integrate_systems': integrate_systems}
+
+
+def _remove_caches(folder):
+    # binary copies of the COLVAR files (see bpns.colvar), removed to time the parsing of the text files
+    for path in glob.glob(os.path.join(folder, '**', '.COLVAR.*'), recursive=True):
+        os.remove(path)
+
+
+def _in_folder(folder, func):
+    def run():
+        here = os.getcwd()
+        os.chdir(folder)
+        try:
+            return func()
+        finally:
+            os.chdir(here)
+    return run
+
+
+def extract_force(workdir, n_steps, cached=False):
+    '''get_force.extract_force on one umbrella window with n_steps printed steps; the COLVAR cache is removed before each run unless cached.'''
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('get_force', os.path.join(repo_path, 'scripts/prot_plastic/get_force.py'))
+    get_force = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(get_force)
+
+    dirs = write_windows(workdir, centers=[3.6], n_steps=n_steps)
+    window = os.path.join(workdir, dirs[0])
+    start = min(35000, n_steps // 2)
+
+    def run():
+        if not cached:
+            _remove_caches(window)
+        # extract_force runs in the window folder and goes back one folder at the end, as in the optimiser
+        os.chdir(window)
+        return get_force.extract_force(dirs[0], start=start, end=n_steps)
+
+    # with the cache, the first run (which writes it) is not timed
+    if cached:
+        _in_folder(workdir, run)()
+    return _in_folder(workdir, run)
+
+
+def extract_force_cached(workdir, n_steps):
+    return extract_force(workdir, n_steps, cached=True)
+
+
+def integrate(workdir, n_windows, n_steps=75000):
+    '''Umbrella integration of integration.ipynb over n_windows windows (COLVAR files parsed each time).'''
+    func = notebook_function('integration.ipynb', 'integrate', _integration_namespace())
+    dirs = write_windows(workdir, centers=1.6 + 0.5*np.arange(n_windows), n_steps=n_steps)
+
+    def run():
+        _remove_caches(workdir)
+        return func(dirs, start=min(35000, n_steps // 2), end=n_steps)
+    return _in_folder(workdir, run)
+
+
+def block_analysis(workdir, n_windows, n_steps=75000, npoints=20):
+    '''Block-size sweep of integration.ipynb (including its plots) over n_windows windows.'''
+    namespace = _integration_namespace()
+    notebook_function('integration.ipynb', 'integrate', namespace)
+    func = notebook_function('integration.ipynb', 'block_analysis', namespace)
+    dirs = write_windows(workdir, centers=1.6 + 0.5*np.arange(n_windows), n_steps=n_steps)
+    plt = namespace['plt']
+
+    def run():
+        _remove_caches(workdir)
+        func(dirs, min_len=600, max_len=8000, start_time=min(35000, n_steps // 2), end_time=n_steps, npoints=npoints)
+        plt.close('all')
+        return []
+    return _in_folder(workdir, run)
+
+
+def integrate_systems(workdir, n_systems, n_windows=11, n_steps=75000):
+    '''Aligned profiles of n_systems systems of n_windows windows each (bpns.umbrella.integrate_systems, COLVAR files parsed each time).'''
+    from bpns.umbrella import integrate_systems
+    folders = [os.path.join(workdir, f"ps{i}") for i in range(n_systems)]
+    for i, folder in enumerate(folders):
+        write_windows(folder, centers=1.6 + 0.5*np.arange(n_windows), seed=i, n_steps=n_steps)
+
+    def run():
+        _remove_caches(workdir)
+        return integrate_systems(folders, start=min(35000, n_steps // 2), end=n_steps)['gibbs']
+    return run
+
+
+def bootstrap(workdir, n_windows, n_steps=75000):
+    '''Bootstrap errors (2000 resamples) of the free-energy profile of n_windows windows (bpns.errors.profile_errors).'''
+    from bpns.umbrella import load_windows
+    from bpns.errors import profile_errors
+    write_windows(workdir, centers=1.6 + 0.5*np.arange(n_windows), n_steps=n_steps)
+    cv, forces = load_windows(workdir, start=min(35000, n_steps // 2), end=n_steps)
+
+    def run():
+        return profile_errors(cv, forces, rng=0)[1]
+    return run
+
+
+def overlay(workdir, n_systems, n_windows=12, n_steps=75000):
+    '''Downsampled traces, histograms and window overlaps of n_systems systems of n_windows windows (bpns.overlay, COLVAR files parsed each time).'''
+    from bpns.overlay import load_overlays, overlap
+    folders = [os.path.join(workdir, f"ps{i}") for i in range(n_systems)]
+    for i, folder in enumerate(folders):
+        write_windows(folder, centers=1.6 + 0.5*np.arange(n_windows), seed=i, n_steps=n_steps)
+
+    def run():
+        _remove_caches(workdir)
+        overlays = load_overlays(folders)
+        return [value for folder in folders for _, _, value in overlap(overlays[folder])]
+    return run
+
+
+def placement(workdir, n_residues, n_atoms=None):
+    '''Placement of the plastic next to the protein (put_together.place_plastic) for a protein of 2 x n_residues residues.'''
+    import mdtraj as md
+    from prot_plastic.put_together import place_plastic
+    write_protein_pdb(os.path.join(workdir, 'protein.pdb'), n_residues)
+    write_plastic_pdb(os.path.join(workdir, 'plastic.pdb'), n_atoms or 2*n_residues)
+    protein = md.load(os.path.join(workdir, 'protein.pdb'))
+    plastic = md.load(os.path.join(workdir, 'plastic.pdb'))
+
+    def run():
+        length, coords = place_plastic(protein, plastic, rng=np.random.default_rng(0))
+        return [length]
+    return run
+
+
+def quadrature1d(workdir, n_coms):
+    '''integrate_bayesian1D of quadrature.ipynb for one force profile with n_coms COM values.'''
+    from bpns.quadrature import integrate_profiles
+    func = notebook_function('quadrature.ipynb', 'integrate_bayesian1D', {'np': np, 'integrate_profiles': integrate_profiles})
+    coms = np.linspace(1.6, 7.1, n_coms)[:, None]
+    forces = (25 - 6*(coms - 3.5)**2) * (coms < 5)
+
+    def run():
+        return func(coms, forces, interval=coms[1, 0] - coms[0, 0])
+    return run
+
+
+def quadrature2d(workdir, n_points):
+    '''Free-energy profiles of all lengths (0-40) from the 2D model fitted to n_points points (bpns.quadrature.ProductRBFQuadrature, inducing points above 300).'''
+    from bpns.quadrature import ProductRBFQuadrature
+    from bpns.surface import slope_mean, slope_mean_integral
+    x, y = force_dataset(n_points)
+
+    def run():
+        model = ProductRBFQuadrature(x, y, lengthscale=[10, 0.5], mean=slope_mean, mean_integral=slope_mean_integral)
+        return model.profiles(np.arange(0, 41), np.arange(2.1, 5.61, 0.1))[0][::10, -1]
+    return run
+
+
+def surrogate(workdir, n_points):
+    '''Fitting the bpns surrogate to n_points (length, COM, force) points and asking for a batch of 4 points.'''
+    from bpns.surrogate import Surrogate
+    x, y = force_dataset(n_points)
+
+    def run():
+        opt = Surrogate([(0, 40), (2.1, 5.6)], integer=[True, False], random_state=0)
+        opt.tell(x.tolist(), y.tolist())
+        return np.ravel(opt.ask(4))
+    return run
+
+
+# sizes of each case: small for a quick check, full for the complete scaling
+cases = {
+    'extract_force': (extract_force, {'small': [50000], 'full': [50000, 200000, 1000000]}),
+    'extract_force_cached': (extract_force_cached, {'small': [50000], 'full': [50000, 200000, 1000000]}),
+    'integrate': (integrate, {'small': [11], 'full': [11, 22, 44]}),
+    'block_analysis': (block_analysis, {'small': [11], 'full': [11, 22]}),
+    'integrate_systems': (integrate_systems, {'small': [4], 'full': [4, 16]}),
+    'bootstrap': (bootstrap, {'small': [11], 'full': [11, 44]}),
+    'overlay': (overlay, {'small': [1], 'full': [1, 4, 16]}),
+    'placement': (placement, {'small': [100], 'full': [100, 400, 1600]}),
+    'quadrature1d': (quadrature1d, {'small': [11], 'full': [11, 101, 1001]}),
+    'quadrature2d': (quadrature2d, {'small': [32], 'full': [32, 1000, 10000]}),
+    'surrogate': (surrogate, {'small': [32], 'full': [32, 300, 1000]}),
+}
@@ -0,0 +1,78 @@
+# Generators of synthetic inputs for the benchmarks:
+# - COLVAR files of umbrella windows (same columns as written by PLUMED with plumed_files, see scripts/bpns/synthetic.py), with a configurable number of steps, stride, force constant and number of windows
+# - protein (two chains) and plastic PDB files of growing size, in the format expected by put_together.py
+# - (length, COM separation, force) datasets like the ones collected by the optimiser
+
+import os
+import numpy as np
+
+# the COLVAR writer is shared with the synthetic simulation backend of the optimiser
+from bpns.synthetic import write_colvar
+
+
+def write_windows(folder, centers=np.arange(1.6, 7.1, 0.5), seed=0, **kwargs):
+    '''Writes one folder per umbrella window, named after its centre (e.g. 2.1/COLVAR); returns the folder names, sorted.'''
+    rng = np.random.default_rng(seed)
+    dirs = []
+    for c in centers:
+        d = f"{c:.1f}"
+        os.makedirs(os.path.join(folder, d), exist_ok=True)
+        write_colvar(os.path.join(folder, d, 'COLVAR'), c, rng=rng, **kwargs)
+        dirs.append(d)
+    return sorted(dirs)
+
+
+def _pdb_line(serial, name, resname, chain, resseq, xyz, element):
+    # coordinates in nm (as in mdtraj) converted to Angstrom
+    x, y, z = 10 * np.asarray(xyz)
+    return f"ATOM  {serial:5d} {name:<4s} {resname:3s} {chain}{resseq:4d}    {x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00          {element:>2s}\n"
+
+
+def write_protein_pdb(path, n_residues=200, seed=0):
+    '''
+    Writes a protein of two chains (n_residues each, alanine backbone + CB) as two compact random coils next to each other.
+    The residues used by put_together.py to define the placement plane (resid 4 and 17) exist for n_residues >= 18.
+    '''
+    rng = np.random.default_rng(seed)
+    lines = ['TITLE     synthetic protein\n', 'REMARK    benchmark input\n', 'CRYST1  200.000  200.000  200.000  90.00  90.00  90.00 P 1           1\n']
+    serial = 1
+    for chain, offset in (('A', np.zeros(3)), ('B', np.array([3.0, 0.0, 0.0]))):
+        # random walk of the CA atoms with 0.38 nm steps, kept compact by pulling towards the chain centre
+        ca = np.zeros((n_residues, 3))
+        for i in range(1, n_residues):
+            step = rng.normal(size=3)
+            ca[i] = ca[i-1] + 0.38 * step / np.linalg.norm(step) - 0.02 * ca[i-1]
+        ca += offset
+        for r, pos in enumerate(ca, start=1):
+            for name, element, shift in (('N', 'N', (-0.1, 0.05, 0)), ('CA', 'C', (0, 0, 0)), ('C', 'C', (0.1, 0.05, 0)),
+                                         ('O', 'O', (0.15, 0.15, 0)), ('CB', 'C', (0, -0.12, 0.05))):
+                lines.append(_pdb_line(serial, name, 'ALA', chain, r, pos + shift, element))
+                serial += 1
+        lines.append('TER\n')
+    lines.append('END\n')
+    with open(path, 'w') as f:
+        f.writelines(lines)
+
+
+def write_plastic_pdb(path, n_atoms=400, seed=1):
+    '''Writes a plastic molecule of n_atoms carbon atoms along a random chain (0.15 nm bonds), in one residue.'''
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(size=(n_atoms, 3))
+    xyz = np.cumsum(0.15 * steps / np.linalg.norm(steps, axis=1)[:, None], axis=0)
+    lines = ['TITLE     synthetic plastic\n', 'REMARK    benchmark input\n', 'CRYST1  200.000  200.000  200.000  90.00  90.00  90.00 P 1           1\n']
+    lines += [_pdb_line(i + 1, 'C', 'PS', 'X', 1, p, 'C') for i, p in enumerate(xyz)]
+    lines.append('END\n')
+    with open(path, 'w') as f:
+        f.writelines(lines)
+
+
+def force_dataset(n_points, seed=0, noise=1.0):
+    '''
+    Synthetic optimiser data: points (plastic length 0-40, COM separation 2.1-5.6 nm) and forces following the mean function of the 2D model with a length-dependent scale.
+    Returns X (n x 2) and y (n).
+    '''
+    rng = np.random.default_rng(seed)
+    x = np.column_stack([rng.integers(0, 41, n_points), rng.uniform(2.1, 5.6, n_points)]).astype(np.float64)
+    com = x[:, 1]
+    y = np.where(com < 5, 25 - 6 * (com - 3.5)**2, 0.0) * (1 - x[:, 0] / 80) + rng.normal(0, noise, n_points)
+    return x, y
@@ -2,62 +2,89 @@
 
 # This script generates overlayed work and bias plot for each umbrella
 # Useful in cases where full free-energy profiles are determined (not relevant for optimiser-determined points)
-
+# The windows of all the given folders (e.g. the umbrella folders of every plastic length) are read in parallel and each trace is downsampled
+# with a min/max reduction that keeps the peaks (scripts/bpns/overlay.py), so even 12 windows of 75 ns are plotted in seconds.
+# For each folder, umb_bias.png (saved in the folder) has four panels drawn from the same arrays:
+# - COM separation and centre of the restraint against time
+# - histograms of the COM separation after the pulling, with the overlap of neighbouring windows
+# - work and bias of the restraint against time
+# The overlap of neighbouring windows is printed as well; pairs below --min-overlap are marked, they need an extra window in between.
+# Usage:
+# - ./overlay_work.py: plots the windows in ./umbrella (as before)
+# - ./overlay_work.py ps*/prot_pl/plumed -j 8: plots the windows of several folders, reading the windows with 8 processes
+
+import argparse
+import os
+import sys
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
-import os
-
-os.chdir('./umbrella')
-
-pl, axs = plt.subplots(1,1, figsize=(12,12))
-
-# get the CV folders 
-folders = os.listdir()
-lst = sorted(folders, reverse=True)
-
-# iterate through different points on the CV, extracting forces and work from COLVAR with respect to time
-for i,folder in enumerate(lst):
-    
-    os.chdir(os.getcwd()+'/'+folder)
-    print(os.getcwd())
-
-    # if there is no COLVAR file, skip
-    if 'COLVAR' not in os.listdir():
-        os.chdir('../')
-        continue
-
-    path = os.getcwd()+'/COLVAR'
-
-    axs.set_title(folder)
-    axs.set_xlabel('t / ps')
-
-    # open COLVAR
-    with open(path, 'r') as f:
-        lines = f.readlines()[1:]
-        t = np.zeros(len(lines))
-        cv = np.zeros(len(lines))
-
-        # initiate the arrays
-        steer_cntr = np.zeros(len(lines))
-        steer_bias = np.zeros(len(lines))
-        steer_work = np.zeros(len(lines))
-
-        # get the values for each line in COLVAR
-        for j,line in enumerate(lines):
-            values = line.strip().split()
-            t[j] = float(values[0])
-            cv[j] = float(values[1])
-            steer_cntr[j] = float(values[4])
-            steer_bias[j] = float(values[2])
-            steer_work[j] = float(values[5])
-
-        # plot the time evolution of the parameters
-        axs.set_ylabel('COM separation / nm')
-        axs.plot(t,cv, label=cv)
-        axs.plot(t,steer_cntr, label=folder)
-
-        os.chdir('../')
-
-pl.savefig('umb_bias.png')
-
 
+# path to cloned repo, needed for the shared COLVAR reader in scripts/bpns
+proj_path = os.path.expandvars('$HOME/project')
+sys.path.append(proj_path + '/scripts')
+from bpns.overlay import load_overlays, overlap
+
+def plot_overlay(folder, windows, edges, min_overlap=0.05, output='umb_bias.png'):
+    '''Plots the windows of one folder (arrays of bpns.overlay.load_overlays) and saves the figure to folder/output; returns the path of the figure.'''
+    fig, axs = plt.subplots(2, 2, figsize=(18,14))
+    fig.suptitle(folder)
+    names = sorted(windows, key=float, reverse=True)
+    colors = plt.cm.viridis(np.linspace(0, 1, max(len(names), 1)))
+    centres = (edges[:-1] + edges[1:]) / 2
+
+    # plot the time evolution of the parameters
+    ax = axs[0, 0]
+    ax.set_xlabel('t / ps')
+    ax.set_ylabel('COM separation / nm')
+    for name, color in zip(names, colors):
+        w = windows[name]
+        ax.plot(w['t_cv'], w['cv'], color=color, linewidth=0.3)
+        ax.plot(w['t_cntr'], w['cntr'], color=color, linewidth=1.0, label=name)
+    ax.legend(fontsize='small')
+
+    # histograms of the sampled COM separation, the overlap of each pair is written between the two windows
+    ax = axs[0, 1]
+    ax.set_xlabel('COM separation / nm')
+    ax.set_ylabel('Fraction of samples')
+    for name, color in zip(names, colors):
+        ax.plot(centres, windows[name]['hist'], color=color, label=name)
+    for a, b, value in overlap(windows):
+        x = (windows[a]['centre'] + windows[b]['centre']) / 2
+        ax.annotate(f"{value:.2f}", (x, 0), xytext=(0, 5), textcoords='offset points', ha='center', fontsize='small',
+                    color='red' if value < min_overlap else 'black')
+    used = np.nonzero(sum(windows[name]['hist'] for name in names))[0]
+    if used.size:
+        ax.set_xlim(edges[used[0]], edges[used[-1] + 1])
+
+    # work and bias of the restraint
+    for ax, field, label in ((axs[1, 0], 'work', 'Work / kcal mol-1'), (axs[1, 1], 'bias', 'Bias / kcal mol-1')):
+        ax.set_xlabel('t / ps')
+        ax.set_ylabel(label)
+        for name, color in zip(names, colors):
+            ax.plot(windows[name][f"t_{field}"], windows[name][field], color=color, linewidth=0.5, label=name)
+
+    path = os.path.join(folder, output)
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Overlay plots (COM separation, histogram overlap, work and bias) of umbrella windows.')
+    parser.add_argument('folders', nargs='*', default=['umbrella'], help='folders with one sub-folder per window (default: umbrella)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of windows read at the same time')
+    parser.add_argument('-n', '--points', type=int, default=2000, help='number of points of each downsampled trace')
+    parser.add_argument('--bin', type=float, default=0.01, help='bin width of the histograms (nm)')
+    parser.add_argument('--min-overlap', type=float, default=0.05, help='overlap below which a pair of windows is marked')
+    args = parser.parse_args()
+
+    edges = np.arange(1.0, 8.0 + args.bin / 2, args.bin)
+    overlays = load_overlays(args.folders, edges=edges, n_points=args.points, workers=args.jobs)
+    for folder, windows in overlays.items():
+        if not windows:
+            print(f"{folder}: no umbrella windows with COLVAR")
+            continue
+        for a, b, value in overlap(windows):
+            print(f"{folder}: {a} - {b} overlap {value:.3f}" + (' LOW' if value < args.min_overlap else ''))
+        print(plot_overlay(folder, windows, edges, min_overlap=args.min_overlap))
@@ -9,7 +9,9 @@ srun --mpi=pmix gmx_mpi mdrun -s 75ns.tpr -cpi md.cpt -plumed plumed.dat -noappe
 
 # convert trajectory to remove PBC, rotations and translations
 echo -e '"Protein" | 13 | "Other" \nq ' | srun --mpi=pmix gmx_mpi make_ndx -f 75ns.tpr -o dry.ndx &> post_proc.log
-echo "Protein_CAL_Other Protein System" | srun --mpi=pmix gmx_mpi trjconv -f traj_comp.part0002.xtc -s 75ns.tpr -dt 100 -pbc cluster -center -o cluster.xtc -n dry.ndx &>> post_proc.log
+# the trajectory of the last part (an extended window, see prep_manual_umb.sh -e, writes the next part)
+traj=$(ls traj_comp.part*.xtc | tail -n 1)
+echo "Protein_CAL_Other Protein System" | srun --mpi=pmix gmx_mpi trjconv -f $traj -s 75ns.tpr -dt 100 -pbc cluster -center -o cluster.xtc -n dry.ndx &>> post_proc.log
 echo "Protein Protein_CAL_Other" | srun --mpi=pmix gmx_mpi trjconv -f cluster.xtc -n dry.ndx -s 75ns.tpr -o dry.xtc -fit rot+trans &>> post_proc.log
 
 # create first snapshot for VMD
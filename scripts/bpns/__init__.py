@@ -0,0 +1,2 @@
+# Shared Python code used by the scripts and notebooks of this repo.
+# The scripts that get copied into result folders (e.g. get_force.py) find this package through the proj_path variable at their top, which points to the cloned repo.
@@ -0,0 +1,403 @@
+# Adaptive placement of umbrella windows for full free-energy profiles, instead of the fixed windows of prep_manual_umb.sh.
+# Starting from a coarse set of windows, each round:
+# - reads the finished windows: mean force and bootstrap error of each window (bpns.errors), histogram of its CV (bpns.overlay),
+#   using the samples after the pulling and equil ps of equilibration
+# - estimates the error of the profile at the last window: the statistical error (independent windows, trapezoid weights) plus the
+#   discretisation error of the trapezoid rule in each interval (h^3/12 times the curvature of the force, from the neighbouring slopes)
+# - adds a window in the middle of each pair of neighbours whose histograms overlap less than min_overlap; off by default (0), since
+#   umbrella integration only needs the mean forces and with the restraint of plumed.dat (KAPPA 500) windows 0.5 nm apart never overlap,
+#   useful with softer restraints (the overlaps are always reported)
+# - then, while the estimated error is above the target, chooses the action which reduces it most per ns of simulation:
+#   extending a window (its statistical error goes as 1/sqrt(time)) or adding a window in the middle of an interval (its discretisation error / 4)
+# - prepares the windows with prep_manual_umb.sh (new: ./prep_manual_umb.sh 2.35 4.85, extended: ./prep_manual_umb.sh -e 25 3.1) and submits them
+# It stops once all neighbouring windows overlap and the estimated error is below the target. The rounds are saved in adaptive.json.
+# The SLURM job of every submitted window is followed (the job id printed by sbatch): a window whose job ended with an error, or without a
+# complete COLVAR, is recorded as failed, dropped from the running windows and submitted again; windows which failed max_failures times
+# are given up (a failed new window is then left out of the analysis and not proposed again).
+# Usage (in the umbrella folder of a length, which has prep_manual_umb.sh):
+# python3 -m bpns.adaptive start . --spacing 1.0
+# python3 -m bpns.adaptive step . --target 1.0
+# python3 -m bpns.adaptive run . --target 1.0 --poll 600
+# python3 -m bpns.adaptive status .
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from bpns.colvar import load_colvar, restraint_force
+from bpns.errors import force_errors
+from bpns.umbrella import window_dirs
+
+state_name = 'adaptive.json'
+
+# SLURM job states of windows which are still queued or running
+active_states = ('PENDING', 'CONFIGURING', 'RUNNING', 'COMPLETING', 'REQUEUED', 'RESIZING', 'SUSPENDED')
+
+
+def window_name(com):
+    '''Folder name of the window at com, as written by seq in prep_manual_umb.sh (e.g. 2.1, 2.35).'''
+    return f"{round(float(com), 2):g}"
+
+
+def window_data(path, equil=10000, edges=np.arange(1.0, 8.0, 0.01)):
+    '''
+    Mean force, error and CV histogram of one umbrella window.
+    - path: COLVAR file of the window
+    - equil: samples after the end of the pulling which are left out (ps, the COLVAR is printed every 1 ps)
+    - edges: bin edges of the CV histogram (nm)
+    Returns a dictionary: centre, force, error, ns (sampled time used), duration (ps, the whole COLVAR) and hist (normalised histogram).
+    '''
+    colvar = load_colvar(path)
+    cntr = np.asarray(colvar['steer.d1_cntr'])
+    sampled = np.nonzero(np.isclose(cntr, cntr[-1]))[0]
+    sampled = sampled[sampled >= sampled[0] + equil]
+    if sampled.size < 2:
+        raise ValueError(f"{path}: no samples after the pulling and {equil} ps of equilibration")
+    time = np.asarray(colvar['time'])
+    forces = restraint_force(colvar)[sampled]
+    force, error, _, _ = force_errors(forces, rng=0)
+    hist, _ = np.histogram(np.asarray(colvar['d1'])[sampled], bins=edges)
+    return {'centre': float(cntr[-1]), 'force': float(force), 'error': float(error), 'ns': float(time[sampled[-1]] - time[sampled[0]]) / 1000,
+            'duration': float(time[-1] - time[0]), 'hist': hist / max(hist.sum(), 1)}
+
+
+def _window_data(args):
+    return window_data(*args)
+
+
+def _trapezoid_weights(cv):
+    # weights of the window forces in the integral from cv[0] to cv[-1]
+    h = np.diff(cv)
+    return np.concatenate([[0.0], h / 2]) + np.concatenate([h / 2, [0.0]])
+
+
+def _discretisation(cv, force):
+    # trapezoid error of each interval, h^3/12 |f''|, with f'' from the slopes of the neighbouring intervals
+    h = np.diff(cv)
+    slope = np.diff(force) / h
+    mid = (cv[1:] + cv[:-1]) / 2
+    err = np.zeros(h.size)
+    if h.size < 2:
+        return err
+    for i in range(h.size):
+        lo, hi = max(i - 1, 0), min(i + 1, h.size - 1)
+        if hi == lo:
+            continue
+        err[i] = h[i]**3 / 12 * abs((slope[hi] - slope[lo]) / (mid[hi] - mid[lo]))
+    return err
+
+
+def analyse(folder='.', dirs=None, equil=10000, workers=None):
+    '''
+    Reads the windows (by default all windows with a COLVAR) and estimates the error of the free-energy profile.
+    Returns a dictionary with the window names and arrays cv, force, error, ns, duration; the overlaps of neighbouring windows;
+    the profile and its statistical error at each window; the discretisation error of each interval and the total estimated error.
+    '''
+    dirs = [d for d in window_dirs(folder) if os.path.exists(os.path.join(folder, d, 'COLVAR'))] if dirs is None else sorted(dirs, key=float)
+    if len(dirs) < 2:
+        raise ValueError(f"At least two finished windows are needed in {folder}, found {dirs}")
+    args = [(os.path.join(folder, d, 'COLVAR'), equil) for d in dirs]
+    if workers == 1:
+        windows = [window_data(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or min(len(args), os.cpu_count() or 1)) as pool:
+            windows = list(pool.map(_window_data, args))
+
+    cv = np.array([w['centre'] for w in windows])
+    force = np.array([w['force'] for w in windows])
+    error = np.array([w['error'] for w in windows])
+    steps = 0.5 * (force[1:] + force[:-1]) * np.diff(cv)
+    # statistical error of the profile at each window (the windows are independent)
+    stat = np.array([np.sqrt(np.sum((_trapezoid_weights(cv[:j+1]) * error[:j+1])**2)) if j else 0.0 for j in range(cv.size)])
+    disc = _discretisation(cv, force)
+    overlaps = [float(np.minimum(a['hist'], b['hist']).sum()) for a, b in zip(windows[:-1], windows[1:])]
+    return {'dirs': dirs, 'cv': cv, 'force': force, 'error': error, 'ns': np.array([w['ns'] for w in windows]),
+            'duration': np.array([w['duration'] for w in windows]), 'overlaps': overlaps,
+            'gibbs': np.concatenate([[0.0], np.cumsum(steps)]), 'stat_error': stat, 'disc_error': disc, 'total_error': float(stat[-1] + disc.sum())}
+
+
+def propose(analysis, target=1.0, min_overlap=0.0, min_spacing=0.1, extend_ns=25.0, window_ns=75.0, vel=0.35, start=1.6, max_actions=8):
+    '''
+    Chooses the windows to add or extend in the next round.
+    - target: estimated profile error (kcal/mol) at which the profile is converged
+    - min_overlap: overlap of neighbouring histograms below which a window is added between them
+    - min_spacing: smallest distance between windows (nm)
+    - extend_ns: extension of a window (ns); window_ns, vel, start: length of a new window (ns), pulling velocity (nm/ns) and starting COM
+      separation of prep_manual_umb.sh, the pulling time is part of the cost of a new window
+    - max_actions: largest number of actions per round
+    Returns a list of actions: {'action': 'add' or 'extend', 'com': ..., 'ns': ..., 'reason': ...}; empty when converged.
+    '''
+    cv, error, ns = analysis['cv'], analysis['error'], analysis['ns']
+    h = np.diff(cv)
+    actions = []
+    split = set()
+    for i, value in enumerate(analysis['overlaps']):
+        if value < min_overlap and h[i] / 2 >= min_spacing and len(actions) < max_actions:
+            actions.append({'action': 'add', 'com': window_name((cv[i] + cv[i+1]) / 2), 'ns': window_ns, 'reason': f"overlap {value:.3f}"})
+            split.add(i)
+
+    # greedy choice of the actions by error reduction per ns, on the current estimates
+    weights = _trapezoid_weights(cv)
+    var = (weights * error)**2
+    disc = analysis['disc_error'].copy()
+    disc[list(split)] /= 4
+    extended = set()
+    def total():
+        return np.sqrt(var.sum()) + disc.sum()
+    while total() > target and len(actions) < max_actions:
+        best = None
+        for i in range(cv.size):
+            if i in extended:
+                continue
+            new_var = var.copy()
+            new_var[i] *= ns[i] / (ns[i] + extend_ns)
+            gain = (total() - (np.sqrt(new_var.sum()) + disc.sum())) / extend_ns
+            if best is None or gain > best[0]:
+                best = (gain, 'extend', i)
+        for i in range(h.size):
+            if i in split or h[i] / 2 < min_spacing:
+                continue
+            cost = window_ns + ((cv[i] + cv[i+1]) / 2 - start) / vel
+            gain = 0.75 * disc[i] / cost
+            if best is None or gain > best[0]:
+                best = (gain, 'add', i)
+        if best is None or best[0] <= 0:
+            break
+        _, action, i = best
+        if action == 'extend':
+            extended.add(i)
+            var[i] *= ns[i] / (ns[i] + extend_ns)
+            actions.append({'action': 'extend', 'com': analysis['dirs'][i], 'ns': extend_ns, 'reason': f"force error {error[i]:.2f}"})
+        else:
+            split.add(i)
+            actions.append({'action': 'add', 'com': window_name((cv[i] + cv[i+1]) / 2), 'ns': window_ns, 'reason': f"discretisation error {disc[i]:.2f}"})
+            disc[i] /= 4
+    return actions
+
+
+def load_state(folder='.'):
+    '''The rounds so far and the windows which are running, from adaptive.json in folder.'''
+    try:
+        with open(os.path.join(folder, state_name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'rounds': [], 'running': {}, 'failed': {}}
+
+
+def save_state(state, folder='.'):
+    tmp = os.path.join(folder, state_name + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, os.path.join(folder, state_name))
+
+
+def finished(folder, name, duration):
+    '''True if the COLVAR of the window covers duration ps (the whole run, including an extension).'''
+    path = os.path.join(folder, name, 'COLVAR')
+    if not os.path.exists(path):
+        return False
+    t = load_colvar(path)['time']
+    return len(t) > 1 and t[-1] - t[0] >= duration - 1
+
+
+def job_state(job):
+    '''State of a SLURM job (PENDING, RUNNING, COMPLETED, FAILED, TIMEOUT...) from sacct, or from squeue without accounting; ENDED if it is unknown.'''
+    try:
+        out = subprocess.run(['sacct', '-n', '-X', '-P', '-j', str(job), '-o', 'State'], capture_output=True, text=True, check=True).stdout.split()
+        if out:
+            return out[0]
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    try:
+        out = subprocess.run(['squeue', '-h', '-j', str(job), '-o', '%T'], capture_output=True, text=True).stdout.split()
+    except OSError:
+        out = []
+    return out[0] if out else 'ENDED'
+
+
+def window_status(folder, name, entry):
+    '''
+    Status of a submitted window: 'running', 'finished' or 'failed'.
+    - entry: {'duration': ps the COLVAR must cover, 'job': SLURM job id, or None if the submit command waits for the run}
+    The window is running while its job is queued or running. Once the job has ended, the window failed if the job did not complete
+    (non-zero exit, time limit, cancelled...) or its COLVAR does not cover the duration (e.g. a crash before PLUMED wrote anything).
+    States written before the jobs were followed only hold the duration: these windows are running until their COLVAR covers it.
+    '''
+    if not isinstance(entry, dict):
+        return 'finished' if finished(folder, name, entry) else 'running'
+    if entry.get('job') is not None:
+        state = job_state(entry['job'])
+        if state in active_states:
+            return 'running'
+        if state not in ('COMPLETED', 'ENDED'):
+            return 'failed'
+    return 'finished' if finished(folder, name, entry['duration']) else 'failed'
+
+
+def _run(cmd, cwd):
+    print(f"{cwd}: {cmd}")
+    subprocess.run(cmd, shell=True, cwd=cwd, check=True)
+
+
+def _submit(cmd, cwd):
+    # runs the submit command and returns the job id printed by sbatch ("Submitted batch job 123"), or None
+    print(f"{cwd}: {cmd}")
+    out = subprocess.run(cmd, shell=True, cwd=cwd, check=True, capture_output=True, text=True).stdout
+    print(out, end='')
+    match = re.search(r'Submitted batch job (\d+)', out)
+    return int(match.group(1)) if match else None
+
+
+def execute(actions, folder='.', prep='./prep_manual_umb.sh', submit='sbatch 16gpu_umbrella', durations=None):
+    '''
+    Prepares and submits the windows of the actions; returns, by window name, the duration (ps) it must reach, its job id and the action.
+    - prep: script preparing new windows (prep COM...) and extending finished ones (prep -e NS COM...)
+    - submit: command submitting a window, run in the window folder
+    - durations: current duration (ps) of the windows which are extended
+    Actions with a 'duration' are retries of failed windows: a new window is prepared again, an extension continues from its last
+    checkpoint (prep -e 0, its run input is already extended), and the window must reach the same duration as before.
+    '''
+    durations = durations or {}
+    expected = {}
+    added = [a for a in actions if a['action'] == 'add']
+    if added:
+        _run(f"{prep} {' '.join(a['com'] for a in added)}", folder)
+    for a in actions:
+        if a['action'] == 'extend':
+            _run(f"{prep} -e {(0 if 'duration' in a else a['ns']):g} {a['com']}", folder)
+        duration = a['duration'] if 'duration' in a else durations.get(a['com'], 0.0) + a['ns'] * 1000
+        expected[a['com']] = {'duration': duration, 'action': a['action'], 'ns': a['ns']}
+    for name, entry in expected.items():
+        entry['job'] = _submit(submit, os.path.join(folder, name))
+    return expected
+
+
+def usable_windows(folder, state):
+    '''Windows with a COLVAR, except new windows which failed (their partial COLVAR is left out until they are run again).'''
+    failed = state.get('failed', {})
+    return [d for d in window_dirs(folder) if os.path.exists(os.path.join(folder, d, 'COLVAR'))
+            and failed.get(d, {}).get('action') != 'add']
+
+
+def start(folder='.', first=1.6, last=6.6, spacing=1.0, window_ns=75.0, prep='./prep_manual_umb.sh', submit='sbatch 16gpu_umbrella'):
+    '''Prepares and submits the coarse initial windows, every spacing nm from first to last.'''
+    coms = [window_name(c) for c in np.arange(first, last + spacing / 2, spacing)]
+    state = load_state(folder)
+    state['running'].update(execute([{'action': 'add', 'com': c, 'ns': window_ns} for c in coms], folder, prep, submit))
+    state['rounds'].append({'time': time.time(), 'actions': [{'action': 'add', 'com': c, 'ns': window_ns, 'reason': 'initial'} for c in coms]})
+    save_state(state, folder)
+    return coms
+
+
+def step(folder='.', target=1.0, equil=10000, prep='./prep_manual_umb.sh', submit='sbatch 16gpu_umbrella', max_failures=2, **kwargs):
+    '''
+    One round of the driver: if windows are still running, nothing is done; otherwise the windows are analysed and the next actions
+    are prepared and submitted (kwargs are passed to propose).
+    Failed windows are dropped from the running ones and recorded in the state, then submitted again until they have failed max_failures
+    times; after that a failed new window is left out, and neither it nor a failed extension is proposed again.
+    Returns 'running', 'converged' or 'submitted', and the analysis (None while windows are running).
+    '''
+    state = load_state(folder)
+    failed = state.setdefault('failed', {})
+    running, retries = {}, []
+    for name, entry in state['running'].items():
+        status = window_status(folder, name, entry)
+        if status == 'running':
+            running[name] = entry
+        elif status == 'finished':
+            failed.pop(name, None)
+        else:
+            count = failed.get(name, {}).get('count', 0) + 1
+            failed[name] = {'time': time.time(), 'job': entry.get('job'), 'action': entry.get('action'), 'count': count}
+            print(f"window {name} failed (job {entry.get('job')}, {count} time{'s' if count > 1 else ''})")
+            if count < max_failures and isinstance(entry, dict):
+                retries.append({'action': entry['action'], 'com': name, 'ns': entry['ns'], 'duration': entry['duration'], 'reason': 'retry after failure'})
+    if retries:
+        running.update(execute(retries, folder, prep, submit))
+        state['rounds'].append({'time': time.time(), 'actions': retries})
+    if running != state['running']:
+        state['running'] = running
+        save_state(state, folder)
+    if running:
+        return 'running', None
+
+    analysis = analyse(folder, dirs=usable_windows(folder, state), equil=equil)
+    actions = [a for a in propose(analysis, target=target, **kwargs) if failed.get(a['com'], {}).get('count', 0) < max_failures]
+    summary = {'time': time.time(), 'windows': analysis['dirs'], 'total_error': analysis['total_error'],
+               'stat_error': float(analysis['stat_error'][-1]), 'disc_error': float(analysis['disc_error'].sum()),
+               'min_overlap': min(analysis['overlaps']), 'actions': actions}
+    if actions:
+        durations = dict(zip(analysis['dirs'], analysis['duration'].tolist()))
+        state['running'] = execute(actions, folder, prep, submit, durations)
+    state['rounds'].append(summary)
+    save_state(state, folder)
+    return ('submitted' if actions else 'converged'), analysis
+
+
+def format_analysis(analysis):
+    '''Table of the windows (force, error, sampled ns, profile, overlap with the next window) and the estimated errors.'''
+    lines = [f"{'window':>8} {'force':>9} {'error':>7} {'ns':>6} {'G':>8} {'overlap':>8}"]
+    overlaps = analysis['overlaps'] + [None]
+    for i, name in enumerate(analysis['dirs']):
+        overlap = '' if overlaps[i] is None else f"{overlaps[i]:.3f}"
+        lines.append(f"{name:>8} {analysis['force'][i]:9.2f} {analysis['error'][i]:7.2f} {analysis['ns'][i]:6.1f} {analysis['gibbs'][i]:8.2f} {overlap:>8}")
+    lines.append(f"estimated profile error: {analysis['total_error']:.2f} (statistical {analysis['stat_error'][-1]:.2f}, "
+                 f"discretisation {analysis['disc_error'].sum():.2f})")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Adaptive placement of umbrella windows for full free-energy profiles.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    parsers = {name: sub.add_parser(name, help=text) for name, text in (
+        ('start', 'prepare and submit the coarse initial windows'), ('step', 'analyse the finished windows and submit the next round'),
+        ('run', 'repeat step until the profile is converged'), ('status', 'print the analysis of the finished windows'))}
+    for name, p in parsers.items():
+        p.add_argument('folder', nargs='?', default='.', help='umbrella folder of one length (default: current folder)')
+        p.add_argument('--equil', type=int, default=10000, help='samples left out after the pulling (ps)')
+        p.add_argument('--prep', default='./prep_manual_umb.sh', help='script preparing and extending windows')
+        p.add_argument('--submit', default='sbatch 16gpu_umbrella', help='command submitting a window, run in its folder')
+        p.add_argument('--window-ns', type=float, default=75.0, help='length of a new window (ns), as in prep_manual_umb.sh')
+    parsers['start'].add_argument('--spacing', type=float, default=1.0, help='distance between the initial windows (nm)')
+    parsers['start'].add_argument('--first', type=float, default=1.6)
+    parsers['start'].add_argument('--last', type=float, default=6.6)
+    for name in ('step', 'run'):
+        parsers[name].add_argument('--target', type=float, default=1.0, help='estimated profile error at which to stop (kcal/mol)')
+        parsers[name].add_argument('--min-overlap', type=float, default=0.0, help='add a window between neighbours overlapping less (0: off)')
+        parsers[name].add_argument('--min-spacing', type=float, default=0.1)
+        parsers[name].add_argument('--extend-ns', type=float, default=25.0)
+        parsers[name].add_argument('--max-actions', type=int, default=8, help='largest number of windows added or extended per round')
+        parsers[name].add_argument('--max-failures', type=int, default=2, help='failures after which a window is not retried')
+    parsers['run'].add_argument('--poll', type=float, default=600, help='time between checks of the running windows (s)')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'start':
+            print(' '.join(start(args.folder, args.first, args.last, args.spacing, args.window_ns, args.prep, args.submit)))
+        elif args.command == 'status':
+            state = load_state(args.folder)
+            print(format_analysis(analyse(args.folder, dirs=usable_windows(args.folder, state), equil=args.equil)))
+            if state['running']:
+                print(f"running: {' '.join(sorted(state['running'], key=float))}")
+            if state.get('failed'):
+                failed = sorted(state['failed'], key=float)
+                print('failed: ' + ' '.join(f"{name} ({state['failed'][name]['count']}x)" for name in failed))
+        else:
+            options = dict(min_overlap=args.min_overlap, min_spacing=args.min_spacing, extend_ns=args.extend_ns,
+                           window_ns=args.window_ns, max_actions=args.max_actions)
+            while True:
+                result, analysis = step(args.folder, args.target, args.equil, args.prep, args.submit, args.max_failures, **options)
+                if analysis is not None:
+                    print(format_analysis(analysis))
+                print(result)
+                if args.command == 'step' or result == 'converged':
+                    break
+                time.sleep(args.poll)
+    except (ValueError, subprocess.CalledProcessError) as err:
+        sys.exit(str(err))
@@ -0,0 +1,170 @@
+# Shared read-only asset store and manifest-based staging of run folders.
+# Large inputs which are the same in every run folder (the charmm27.ff force field, the protein .itp files) are stored once,
+# keyed by a hash of their name and content, and the run folders get symlinks to them instead of copies:
+# - the store is a folder (BPNS_ASSETS environment variable, by default the assets folder of the build cache, see bpns.buildcache)
+#   with one sub-folder per asset, e.g. <store>/<key>/charmm27.ff; the stored files are made read-only
+# - assets are written to a temporary folder and renamed when complete, like the build cache entries
+# Files which are changed in the run folder (e.g. topol.top, which gets the plastic, water and ions) must still be copied.
+# A manifest (JSON: {"inputs": [...], "outputs": [...]}, glob patterns relative to the run folder) declares what a stage needs and produces,
+# so a job copies only its inputs to the node-local scratch and only its outputs back (symlinks to the store are staged as symlinks).
+# Usage:
+# python3 -m bpns.assets link $proj_path/charmm27.ff $proj_path/protein/*.itp .
+# python3 -m bpns.assets stage-in umbrella_manifest.json $SLURM_SUBMIT_DIR $TMPDIR/$USER/$SLURM_JOBID
+# python3 -m bpns.assets stage-out umbrella_manifest.json $TMPDIR/$USER/$SLURM_JOBID $SLURM_SUBMIT_DIR
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+from bpns.buildcache import cache_root
+
+
+def assets_root():
+    return os.path.expanduser(os.environ.get('BPNS_ASSETS', os.path.join(cache_root(), 'assets')))
+
+
+def hash_asset(path):
+    '''Hash of a file or a folder (names and contents of all its files), including its own name.'''
+    digest = hashlib.sha256(os.path.basename(os.path.normpath(path)).encode() + b'\0')
+    if os.path.isdir(path):
+        files = sorted(os.path.relpath(os.path.join(root, name), path) for root, _, names in os.walk(path) for name in names)
+    else:
+        files = ['']
+    for rel in files:
+        digest.update(rel.encode() + b'\0')
+        with open(os.path.join(path, rel) if rel else path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:32]
+
+
+def _read_only(path):
+    # remove the write permissions of the stored files (folders stay writable, so the store can be cleaned up)
+    paths = [path] if not os.path.isdir(path) else [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+    for p in paths:
+        os.chmod(p, stat.S_IMODE(os.stat(p).st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def add(path):
+    '''Adds a file or a folder to the store (if it is not there yet) and returns the path of the stored copy.'''
+    name = os.path.basename(os.path.normpath(path))
+    entry = os.path.join(assets_root(), hash_asset(path))
+    if os.path.exists(entry):
+        return os.path.join(entry, name)
+    os.makedirs(assets_root(), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=assets_root(), prefix='.tmp.')
+    try:
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(tmp, name))
+        else:
+            shutil.copy2(path, os.path.join(tmp, name))
+        _read_only(os.path.join(tmp, name))
+        # mkdtemp creates the folder for the owner only, the store is shared
+        os.chmod(tmp, 0o755)
+        os.rename(tmp, entry)
+    except OSError:
+        # another run stored the same asset first
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(entry):
+            raise
+    return os.path.join(entry, name)
+
+
+def link(path, dest='.'):
+    '''
+    Adds path to the store and creates a symlink to it in the folder dest, with the same name; returns the symlink.
+    An existing symlink is replaced, an existing file or folder is not (FileExistsError).
+    '''
+    stored = add(path)
+    target = os.path.join(dest, os.path.basename(os.path.normpath(path)))
+    if os.path.islink(target):
+        os.remove(target)
+    elif os.path.exists(target):
+        raise FileExistsError(f"{target} exists and is not a link to the asset store")
+    os.symlink(stored, target)
+    return target
+
+
+def load_manifest(path):
+    '''Reads a stage manifest: a dictionary with the lists of input and output patterns.'''
+    with open(path) as f:
+        manifest = json.load(f)
+    return {'inputs': list(manifest.get('inputs', [])), 'outputs': list(manifest.get('outputs', []))}
+
+
+def expand(patterns, folder):
+    '''Paths (relative to folder) matching the glob patterns, each once, in the order of the patterns.'''
+    paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(folder, pattern), recursive=True)):
+            rel = os.path.relpath(path, folder)
+            if rel not in paths:
+                paths.append(rel)
+    return paths
+
+
+def stage(paths, src, dst):
+    '''Copies the paths (relative) from src to dst, keeping symlinks as symlinks; returns the number of bytes copied.'''
+    copied = 0
+    for rel in paths:
+        source, target = os.path.join(src, rel), os.path.join(dst, rel)
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        if os.path.isdir(source) and not os.path.islink(source):
+            shutil.copytree(source, target, symlinks=True, dirs_exist_ok=True)
+            copied += sum(os.path.getsize(os.path.join(r, n)) for r, _, names in os.walk(source) for n in names
+                          if not os.path.islink(os.path.join(r, n)))
+        else:
+            if os.path.lexists(target):
+                os.remove(target)
+            shutil.copy2(source, target, follow_symlinks=False)
+            copied += 0 if os.path.islink(source) else os.path.getsize(source)
+    return copied
+
+
+def stage_in(manifest, src, scratch):
+    '''Copies the declared inputs of a stage from the run folder src to scratch; raises FileNotFoundError if a pattern matches nothing.'''
+    manifest = load_manifest(manifest) if isinstance(manifest, str) else manifest
+    missing = [p for p in manifest['inputs'] if not expand([p], src)]
+    if missing:
+        raise FileNotFoundError(f"Inputs missing in {src}: {missing}")
+    paths = expand(manifest['inputs'], src)
+    os.makedirs(scratch, exist_ok=True)
+    return paths, stage(paths, src, scratch)
+
+
+def stage_out(manifest, scratch, dst):
+    '''Copies the declared outputs of a stage from scratch back to the run folder dst (outputs which were not produced are skipped).'''
+    manifest = load_manifest(manifest) if isinstance(manifest, str) else manifest
+    paths = expand(manifest['outputs'], scratch)
+    return paths, stage(paths, scratch, dst)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shared asset store and manifest-based staging of run folders.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    link_parser = sub.add_parser('link', help='store files or folders and link them into a folder')
+    link_parser.add_argument('paths', nargs='+', help='files or folders, followed by the destination folder')
+    for command in ('stage-in', 'stage-out'):
+        stage_parser = sub.add_parser(command, help=f"copy the {'inputs' if command == 'stage-in' else 'outputs'} of a manifest")
+        stage_parser.add_argument('manifest')
+        stage_parser.add_argument('src')
+        stage_parser.add_argument('dst')
+    args = parser.parse_args()
+
+    if args.command == 'link':
+        if len(args.paths) < 2:
+            parser.error('link needs at least one path and the destination folder')
+        for path in args.paths[:-1]:
+            link(path, args.paths[-1])
+    else:
+        func = stage_in if args.command == 'stage-in' else stage_out
+        try:
+            paths, size = func(args.manifest, args.src, args.dst)
+        except FileNotFoundError as err:
+            sys.exit(str(err))
+        print(f"{args.command}: {len(paths)} files, {size / 1e6:.1f} MB")
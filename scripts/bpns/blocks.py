@@ -0,0 +1,101 @@
+# Block averaging of time series (e.g. restraint forces from COLVAR).
+# block_statistics computes the block means for many block sizes at once from a single cumulative sum, so a whole block-size sweep costs about as much as reading the data.
+# optimal_block_size picks the block size automatically with the Flyvbjerg-Petersen blocking method and the automated stopping criterion of Jonsson (Phys. Rev. E 98, 043304, 2018).
+
+import numpy as np
+from scipy.stats import chi2
+
+
+def block_means(x, size):
+    '''
+    Averages x over consecutive, non-overlapping blocks of a given size; an incomplete block at the end is dropped.
+    - x: 1D array, or an array with time along the last axis (e.g. n_windows x n_steps)
+    - size: block size (number of samples)
+    Returns an array with the block means along the last axis.
+    '''
+    x = np.asarray(x)
+    n = x.shape[-1] // size
+    return x[..., :n*size].reshape(x.shape[:-1] + (n, size)).mean(axis=-1)
+
+
+def block_statistics(x, sizes):
+    '''
+    Block analysis of x for several block sizes at once.
+    - x: 1D array (time series)
+    - sizes: block sizes (number of samples), e.g. np.arange(100, 9000, 80)
+    Returns arrays with one value per block size:
+    - mean: average of the block means
+    - std: standard deviation of the block means
+    - sem: standard error of the mean (std of the block means with n-1 in the denominator, divided by sqrt(n))
+    - n_blocks: number of complete blocks
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=int)
+    n_blocks = x.size // sizes
+    if np.any(n_blocks < 1):
+        raise ValueError(f"Block sizes larger than the data ({x.size} samples)")
+
+    # shift by the mean for a better precision of the cumulative sum
+    shift = x.mean()
+    csum = np.concatenate([[0.0], np.cumsum(x - shift)])
+
+    # ends of all blocks of all sizes, one after another: block k of size b spans [k*b, (k+1)*b)
+    seg_size = np.repeat(sizes, n_blocks)
+    seg_start = np.concatenate([[0], np.cumsum(n_blocks)[:-1]])
+    k = np.arange(seg_size.size) - np.repeat(seg_start, n_blocks)
+    ends = (k + 1) * seg_size
+    means = (csum[ends] - csum[ends - seg_size]) / seg_size
+
+    # statistics of the block means, per block size
+    mean = np.add.reduceat(means, seg_start) / n_blocks
+    sq_dev = (means - np.repeat(mean, n_blocks))**2
+    var = np.add.reduceat(sq_dev, seg_start) / n_blocks
+    std = np.sqrt(var)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sem = np.sqrt(var / (n_blocks - 1))
+    return mean + shift, std, sem, n_blocks
+
+
+def blocking(x):
+    '''
+    Flyvbjerg-Petersen blocking transformation: the series is repeatedly averaged in pairs of neighbouring samples.
+    Returns, for each level k (block size 2**k):
+    - var: variance of the blocked series (normalised by 1/n)
+    - gamma: its lag-1 autocovariance, sum of the n-1 products normalised by 1/n as in Jonsson (2018)
+    - n: number of samples at that level
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    var, gamma, n = [], [], []
+    while x.size >= 2:
+        d = x - x.mean()
+        var.append(np.mean(d**2))
+        gamma.append(np.sum(d[:-1] * d[1:]) / x.size)
+        n.append(x.size)
+        # an odd sample at the end is dropped
+        m = x.size // 2
+        x = 0.5 * (x[0:2*m:2] + x[1:2*m:2])
+    return np.array(var), np.array(gamma), np.array(n)
+
+
+def optimal_block_size(x, min_blocks=8, alpha=0.01):
+    '''
+    Chooses the block size for x automatically: the smallest blocking level at which the blocked series is no longer correlated,
+    tested with the statistic of Jonsson (Phys. Rev. E 98, 043304, 2018) against the chi-squared quantile at 1-alpha with d-j degrees of freedom.
+    The statistic is the one of the paper, with the bias correction of the lag-1 autocovariance (not the uncorrected sum of its reference code):
+    M_j = sum over levels k >= j of n_k * ((n_k - 1) * var_k / n_k**2 + gamma_k)**2 / var_k**2
+    with var_k and gamma_k normalised by 1/n_k (see blocking). Series whose length is not a power of 2 lose the odd sample at each level.
+    - min_blocks: the block size is never chosen so large that fewer blocks are left
+    Returns the block size in samples (a power of 2).
+    '''
+    var, gamma, n = blocking(x)
+    levels = np.arange(var.size)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.nan_to_num(n * ((n - 1) * var / n**2 + gamma)**2 / var**2)
+    m = np.cumsum(terms[::-1])[::-1]
+    quantiles = chi2.ppf(1 - alpha, var.size - levels)
+
+    max_level = max(int(np.log2(max(len(x) // min_blocks, 1))), 0)
+    below = np.nonzero(m[:max_level+1] < quantiles[:max_level+1])[0]
+    level = below[0] if below.size else max_level
+    return 2**int(level)
@@ -0,0 +1,148 @@
+# Persistent cache of parametrised monomers and built plastics, shared by all campaigns and manual runs.
+# Entries are keyed by a hash of everything that determines them:
+# - monomers (the six .prepi files from antechamber -c bcc + prepgen): the monomer .mol2 files and the mainchain files
+# - plastics (plastic.itp and the equilibrated md/plastic.pdb): the monomer key, the length, the box distance, the ion concentration and replaced molecules,
+#   the .mdp files of the equilibration and how the topology was built (tleap and acpype, or assembled from residue templates with gen.sh -t)
+# so a changed input gives a new key and an old entry is never used by mistake.
+# The cache is a folder (BPNS_CACHE environment variable, by default ~/.cache/bpns) with one sub-folder per entry, e.g. plastic/<key>/plastic.itp.
+# Entries are written to a temporary folder and renamed when complete, so a crashed or concurrent build never leaves a half-written entry.
+# Usage (see gen.sh):
+# python3 -m bpns.buildcache key monomers -p ps
+# python3 -m bpns.buildcache key plastic -p ps -l 10 -d 1.5 -c 0.15 -r SOL --build tleap --monomers <key> --files mdps/plastic/*.mdp
+# python3 -m bpns.buildcache get plastic <key> ps10/plastic plastic.itp md/plastic.pdb  (exit code 1 if not cached)
+# python3 -m bpns.buildcache put plastic <key> ps10/plastic plastic.itp md/plastic.pdb
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+# increase to invalidate all entries, e.g. if the way the files are built changes
+cache_version = 1
+
+
+def cache_root():
+    return os.path.expanduser(os.environ.get('BPNS_CACHE', '~/.cache/bpns'))
+
+
+def hash_files(paths):
+    '''Hash of the names and contents of the files, independent of their order and location.'''
+    digest = hashlib.sha256()
+    for path in sorted(paths, key=os.path.basename):
+        digest.update(os.path.basename(path).encode() + b'\0')
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def make_key(**params):
+    '''Key of a cache entry from its parameters (numbers, strings and file hashes).'''
+    params['cache_version'] = cache_version
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def monomer_key(plast, folder='.'):
+    '''
+    Key of the parametrised monomers of a plastic, from the input files in folder (as needed by gen.sh):
+    {plast}.mol2, {plast}_carb.mol2 and the mainchain.* files.
+    '''
+    files = [os.path.join(folder, f'{plast}.mol2'), os.path.join(folder, f'{plast}_carb.mol2')]
+    files += glob.glob(os.path.join(folder, 'mainchain.*'))
+    missing = [f for f in files if not os.path.exists(f)]
+    if missing:
+        raise FileNotFoundError(f"Missing monomer input files: {missing}")
+    return make_key(kind='monomers', plast=plast, inputs=hash_files(files))
+
+
+def plastic_key(plast, length, monomers, dist=1.5, ion_conc=0.15, ion_repl='SOL', files=(), build='tleap'):
+    '''
+    Key of a built and equilibrated plastic; files are other inputs of the build, e.g. the .mdp files.
+    build is how the topology was made, 'tleap' or 'assembled'; it is left out of the key for tleap, so the keys of earlier entries do not change.
+    '''
+    params = dict(kind='plastic', plast=plast, length=int(length), monomers=monomers, dist=float(dist),
+                  ion_conc=float(ion_conc), ion_repl=ion_repl, files=hash_files(files))
+    if build != 'tleap':
+        params['build'] = build
+    return make_key(**params)
+
+
+def entry_path(kind, key):
+    return os.path.join(cache_root(), kind, key)
+
+
+def fetch(kind, key, dest, names):
+    '''Copies the files of a cache entry to dest (keeping sub-folders); returns False if the entry does not exist.'''
+    entry = entry_path(kind, key)
+    if not all(os.path.exists(os.path.join(entry, name)) for name in names):
+        return False
+    for name in names:
+        target = os.path.join(dest, name)
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        shutil.copy2(os.path.join(entry, name), target)
+    return True
+
+
+def store(kind, key, src, names, info=None):
+    '''Saves the files from src in a new cache entry; an existing entry with the same key is kept.'''
+    entry = entry_path(kind, key)
+    if os.path.exists(entry):
+        return entry
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(entry), prefix=f'.{key}.')
+    try:
+        for name in names:
+            target = os.path.join(tmp, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(os.path.join(src, name), target)
+        with open(os.path.join(tmp, 'entry.json'), 'w') as f:
+            json.dump({'kind': kind, 'key': key, 'files': list(names), 'info': info or {}}, f, indent=1)
+        os.rename(tmp, entry)
+    except OSError:
+        # another build stored the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(entry):
+            raise
+    return entry
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cache of parametrised monomers and built plastics.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    key_parser = sub.add_parser('key', help='prints the key of an entry')
+    key_parser.add_argument('kind', choices=['monomers', 'plastic'])
+    key_parser.add_argument('-p', '--plastic', required=True, help='plastic name, e.g. ps')
+    key_parser.add_argument('-l', '--length', type=int, help='plastic length')
+    key_parser.add_argument('-d', '--dist', type=float, default=1.5, help='distance between the molecule and the edge of the box')
+    key_parser.add_argument('-c', '--conc', type=float, default=0.15, help='concentration of NaCl')
+    key_parser.add_argument('-r', '--repl', default='SOL', help='molecules replaced with ions')
+    key_parser.add_argument('--build', choices=['tleap', 'assembled'], default='tleap', help='how the topology of the plastic is built')
+    key_parser.add_argument('--monomers', help='key of the monomers')
+    key_parser.add_argument('--folder', default='.', help='folder with the monomer input files')
+    key_parser.add_argument('--files', nargs='*', default=[], help='other input files of the build, e.g. the .mdp files')
+
+    for command in ('get', 'put'):
+        io_parser = sub.add_parser(command, help='copies files from (get) or to (put) the cache')
+        io_parser.add_argument('kind')
+        io_parser.add_argument('key')
+        io_parser.add_argument('folder')
+        io_parser.add_argument('names', nargs='+', help='files relative to the folder')
+
+    args = parser.parse_args()
+    if args.command == 'key':
+        if args.kind == 'monomers':
+            print(monomer_key(args.plastic, args.folder))
+        else:
+            if args.length is None or args.monomers is None:
+                parser.error('plastic keys need --length and --monomers')
+            print(plastic_key(args.plastic, args.length, args.monomers, args.dist, args.conc, args.repl, args.files, args.build))
+    elif args.command == 'get':
+        found = fetch(args.kind, args.key, args.folder, args.names)
+        print(f"{args.kind} {args.key}: {'found in' if found else 'not in'} the cache")
+        sys.exit(0 if found else 1)
+    else:
+        print(store(args.kind, args.key, args.folder, args.names))
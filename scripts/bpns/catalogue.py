@@ -0,0 +1,271 @@
+# Results catalogue of an optimiser campaign: one SQLite file (results.db in the campaign folder) with a row per evaluated point.
+# Each row keeps the point (plastic length, COM separation), the force with its bootstrap error and block length, the part of the run used
+# (start and end, ps), and where the value comes from: source ('initial', 'optimiser', 'import', 'manual', ...), run folder, pipeline task, host and time.
+# Points can be flagged (e.g. outliers): they stay in the catalogue but are left out of the queries and of the optimiser.
+# The optimiser rebuilds its state from the catalogue at every start (optimize.py), and the notebooks query it directly, e.g.
+#   Catalogue('results.db').query(com=3.1)                    all lengths at COM 3.1, without the flagged points
+#   Catalogue('results.db').training_data()                   points and forces given to the optimiser / Bayesian quadrature
+# Usage:
+# python3 -m bpns.catalogue import results.db optstate_31     (points of a saved skopt optimiser, for campaigns started before the catalogue)
+# python3 -m bpns.catalogue scan results.db ps0/prot_pl/plumed --length 0 --source manual     (all umbrella windows of a folder)
+# python3 -m bpns.catalogue list results.db --com 3.1
+# python3 -m bpns.catalogue flag results.db 32 37 --note outlier
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import time
+import numpy as np
+
+from bpns.colvar import load_colvar, restraint_force
+from bpns.errors import force_errors
+from bpns.umbrella import window_dirs
+
+# sources of the points the optimiser is built from (manual runs may lie outside its bounds)
+campaign_sources = ('initial', 'import', 'optimiser')
+
+columns = ['id', 'length', 'com', 'force', 'error', 'block', 'start_ps', 'end_ps', 'source', 'run_path', 'task', 'host', 'created', 'flagged', 'note']
+
+schema = '''
+CREATE TABLE IF NOT EXISTS points (
+    id INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL,
+    com REAL NOT NULL,
+    force REAL NOT NULL,
+    error REAL,
+    block INTEGER,
+    start_ps INTEGER,
+    end_ps INTEGER,
+    source TEXT NOT NULL,
+    run_path TEXT,
+    task TEXT,
+    host TEXT,
+    created REAL NOT NULL,
+    flagged INTEGER NOT NULL DEFAULT 0,
+    note TEXT
+);
+CREATE INDEX IF NOT EXISTS points_length_com ON points (length, com);
+CREATE INDEX IF NOT EXISTS points_com ON points (com);
+CREATE INDEX IF NOT EXISTS points_run_path ON points (run_path);
+'''
+
+
+def read_final_force(folder):
+    '''
+    Force, error and block length from the FINAL_FORCE file of an umbrella window (written by get_force.py),
+    and the start of the averaging from FORCE_MONITOR if the force monitor was used. Old files with only the force give None for the rest.
+    '''
+    with open(os.path.join(folder, 'FINAL_FORCE')) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    record = {'force': float(lines[0]),
+              'error': float(lines[1]) if len(lines) > 1 else None,
+              'block': int(float(lines[2])) if len(lines) > 2 else None,
+              'start_ps': 35000, 'end_ps': 50000}
+    if os.path.exists(os.path.join(folder, 'FORCE_MONITOR')):
+        with open(os.path.join(folder, 'FORCE_MONITOR')) as f:
+            record['start_ps'] = json.load(f)['start']
+    return record
+
+
+class Catalogue:
+    '''
+    Results catalogue in an SQLite file; every call opens its own connection, so one file can be shared by several processes.
+    - path: database file, created with the table and the indexes if it does not exist
+    '''
+
+    def __init__(self, path='results.db'):
+        self.path = os.path.abspath(path)
+        with self._connect() as db:
+            db.executescript(schema)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=60)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _run(self, sql, params=(), many=False):
+        db = self._connect()
+        try:
+            with db:
+                cursor = db.executemany(sql, params) if many else db.execute(sql, params)
+                return cursor.lastrowid, cursor.fetchall()
+        finally:
+            db.close()
+
+    def add(self, length, com, force, error=None, block=None, start_ps=None, end_ps=None, source='optimiser',
+            run_path=None, task=None, note=None):
+        '''
+        Records an evaluated point and returns its id. COM is stored as given, the optimiser rounds it to 2 decimals (the names of the
+        umbrella folders) when the point is asked, so the optimiser rebuilt from the catalogue is told the same points.
+        A point with the same run folder as an existing one replaces it (the run was analysed again), keeping its id and flag.
+        '''
+        run_path = os.path.abspath(run_path) if run_path else None
+        values = (int(length), float(com), float(force), None if error is None else float(error), None if block is None else int(block),
+                  start_ps, end_ps, source, run_path, task, socket.gethostname(), time.time(), note)
+        db = self._connect()
+        try:
+            with db:
+                old = db.execute('SELECT id FROM points WHERE run_path = ?', (run_path,)).fetchone() if run_path else None
+                if old:
+                    db.execute('UPDATE points SET length=?, com=?, force=?, error=?, block=?, start_ps=?, end_ps=?, source=?, run_path=?, task=?, '
+                               'host=?, created=?, note=coalesce(?, note) WHERE id=?', values + (old['id'],))
+                    return old['id']
+                return db.execute('INSERT INTO points (length, com, force, error, block, start_ps, end_ps, source, run_path, task, host, created, note) '
+                                  'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', values).lastrowid
+        finally:
+            db.close()
+
+    def add_many(self, points, forces, source='initial', note=None):
+        '''Records a list of points ([length, COM]) with their forces only (no error or run folder), e.g. the initial points of a campaign.'''
+        now, host = time.time(), socket.gethostname()
+        rows = [(int(x[0]), float(x[1]), float(y), source, host, now, note) for x, y in zip(points, forces)]
+        self._run('INSERT INTO points (length, com, force, source, host, created, note) VALUES (?, ?, ?, ?, ?, ?, ?)', rows, many=True)
+
+    def query(self, length=None, com=None, source=None, include_flagged=False, tol=1e-6):
+        '''
+        Points matching all the given conditions, as a list of dictionaries (the columns), in the order they were recorded.
+        - length, com: one value or a list of values (COM within tol)
+        - source: one source or a list of sources
+        - include_flagged: also return the flagged points
+        '''
+        where, params = [], []
+        if length is not None:
+            lengths = [length] if np.isscalar(length) else list(length)
+            where.append(f"length IN ({', '.join('?' * len(lengths))})")
+            params += [int(l) for l in lengths]
+        if com is not None:
+            coms = [com] if np.isscalar(com) else list(com)
+            where.append('(' + ' OR '.join(['com BETWEEN ? AND ?'] * len(coms)) + ')')
+            params += [v for c in coms for v in (float(c) - tol, float(c) + tol)]
+        if source is not None:
+            sources = [source] if isinstance(source, str) else list(source)
+            where.append(f"source IN ({', '.join('?' * len(sources))})")
+            params += sources
+        if not include_flagged:
+            where.append('flagged = 0')
+        sql = 'SELECT * FROM points' + (' WHERE ' + ' AND '.join(where) if where else '') + ' ORDER BY id'
+        return [dict(row) for row in self._run(sql, params)[1]]
+
+    def count(self, include_flagged=True):
+        return self._run('SELECT count(*) FROM points' + ('' if include_flagged else ' WHERE flagged = 0'))[1][0][0]
+
+    def flag(self, ids, note=None, flagged=True):
+        '''Flags the points with the given ids (or removes the flag with flagged=False); the note, if given, replaces the old one.'''
+        ids = [ids] if np.isscalar(ids) else list(ids)
+        self._run('UPDATE points SET flagged = ?, note = coalesce(?, note) WHERE id = ?', [(int(flagged), note, int(i)) for i in ids], many=True)
+
+    def training_data(self, source=campaign_sources, include_flagged=False):
+        '''Points ([length, COM]) and forces to be told to the optimiser or given to the Bayesian quadrature, in the order they were recorded.'''
+        rows = self.query(source=source, include_flagged=include_flagged)
+        return [[row['length'], row['com']] for row in rows], [row['force'] for row in rows]
+
+    def profile(self, length, coms, source=None, field='force'):
+        '''
+        Values of one column (force by default) of one length at the given COM values, NaN where there is no point;
+        if a point was evaluated several times, the last record is used.
+        '''
+        coms = np.asarray(coms, dtype=float).ravel()
+        values = np.full(coms.size, np.nan)
+        for row in self.query(length=length, com=coms, source=source):
+            values[np.argmin(np.abs(coms - row['com']))] = np.nan if row[field] is None else row[field]
+        return values
+
+
+def import_optstate(catalogue, path, folder=None):
+    '''
+    Records the points of a saved skopt optimiser (optstate_x), e.g. to start the catalogue of a campaign which used to keep its state in pickles.
+    Points already in the catalogue (same length, COM and force) are skipped. The errors and block lengths are read from the FINAL_FORCE files
+    of the run folders (folder/ps<length>/prot_pl/plumed/<COM>, folder by default the one of the optstate) where they still exist.
+    Returns the ids of the new points.
+    '''
+    from skopt.utils import load
+
+    folder = folder or os.path.dirname(os.path.abspath(path))
+    optimizer = load(path)
+    ids = []
+    for x, y in zip(optimizer.Xi, optimizer.yi):
+        # COM rounded as in the names of the run folders (older optimisers were told the unrounded values)
+        length, com = int(x[0]), round(float(x[1]), 2)
+        if any(abs(row['force'] - y) < 1e-9 for row in catalogue.query(length=length, com=com, include_flagged=True)):
+            continue
+        run_path = os.path.join(folder, f"ps{length}/prot_pl/plumed/{com}")
+        record = {'force': y}
+        if os.path.exists(os.path.join(run_path, 'FINAL_FORCE')):
+            record = read_final_force(run_path)
+            # the optimiser was told this value, keep it even if the file was overwritten since
+            record['force'] = y
+        else:
+            run_path = None
+        ids.append(catalogue.add(length, com, source='import', run_path=run_path, note=f"from {os.path.basename(path)}", **record))
+    return ids
+
+
+def scan(catalogue, folder, length, source='manual', start=35000, end=50000):
+    '''
+    Records all the umbrella windows of a folder (sub-folders named after the COM separation, see bpns.umbrella.window_dirs) for one length.
+    The force is read from FINAL_FORCE if the window has it, otherwise it is computed from the COLVAR between start and end (ps) as in get_force.py.
+    Returns the ids of the recorded points.
+    '''
+    ids = []
+    for d in window_dirs(folder):
+        run_path = os.path.join(folder, d)
+        if os.path.exists(os.path.join(run_path, 'FINAL_FORCE')):
+            record = read_final_force(run_path)
+        elif os.path.exists(os.path.join(run_path, 'COLVAR')):
+            force, error, _, block = force_errors(restraint_force(load_colvar(os.path.join(run_path, 'COLVAR')))[start:end], rng=0)
+            record = {'force': float(force), 'error': float(error), 'block': block, 'start_ps': start, 'end_ps': end}
+        else:
+            continue
+        ids.append(catalogue.add(length, float(d), source=source, run_path=run_path, **record))
+    return ids
+
+
+def format_rows(rows):
+    '''Text table of query results.'''
+    lines = [f"{'id':>5s} {'length':>6s} {'COM':>6s} {'force':>10s} {'error':>8s} {'block':>6s} {'source':>10s} {'flag':>4s}  run folder / note"]
+    for r in rows:
+        error = f"{r['error']:8.3f}" if r['error'] is not None else f"{'-':>8s}"
+        block = f"{r['block']:6d}" if r['block'] is not None else f"{'-':>6s}"
+        lines.append(f"{r['id']:5d} {r['length']:6d} {r['com']:6.2f} {r['force']:10.4f} {error} {block} {r['source']:>10s} {'x' if r['flagged'] else '':>4s}  "
+                     f"{r['run_path'] or ''}{' (' + r['note'] + ')' if r['note'] else ''}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Results catalogue of optimiser campaigns.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    import_parser = sub.add_parser('import', help='record the points of saved skopt optimisers (optstate_x)')
+    import_parser.add_argument('db')
+    import_parser.add_argument('optstates', nargs='+')
+    scan_parser = sub.add_parser('scan', help='record the umbrella windows of a folder')
+    scan_parser.add_argument('db')
+    scan_parser.add_argument('folder')
+    scan_parser.add_argument('--length', type=int, required=True)
+    scan_parser.add_argument('--source', default='manual')
+    scan_parser.add_argument('--start', type=int, default=35000)
+    scan_parser.add_argument('--end', type=int, default=50000)
+    list_parser = sub.add_parser('list', help='print the points')
+    list_parser.add_argument('db')
+    list_parser.add_argument('--length', type=int, nargs='+')
+    list_parser.add_argument('--com', type=float, nargs='+')
+    list_parser.add_argument('--source', nargs='+')
+    list_parser.add_argument('--all', action='store_true', help='include the flagged points')
+    flag_parser = sub.add_parser('flag', help='flag points (e.g. outliers), so they are left out of the queries and of the optimiser')
+    flag_parser.add_argument('db')
+    flag_parser.add_argument('ids', type=int, nargs='+')
+    flag_parser.add_argument('--note')
+    flag_parser.add_argument('--unflag', action='store_true')
+    args = parser.parse_args()
+
+    catalogue = Catalogue(args.db)
+    if args.command == 'import':
+        for path in args.optstates:
+            print(f"{path}: {len(import_optstate(catalogue, path))} points recorded")
+    elif args.command == 'scan':
+        print(f"{len(scan(catalogue, args.folder, args.length, args.source, args.start, args.end))} windows recorded")
+    elif args.command == 'list':
+        print(format_rows(catalogue.query(length=args.length, com=args.com, source=args.source, include_flagged=args.all)))
+    else:
+        catalogue.flag(args.ids, note=args.note, flagged=not args.unflag)
@@ -0,0 +1,170 @@
+# Reader for PLUMED COLVAR files, shared by get_force.py, overlay_work.py and the notebooks.
+# The text file is parsed in bulk into named NumPy columns (names taken from the "#! FIELDS" header).
+# A binary copy is saved next to it (.COLVAR.npy + .COLVAR.json), keyed by the size and modification time of the text file:
+# - if the COLVAR did not change, the binary copy is memory-mapped and no text is parsed at all
+# - if the COLVAR only grew (the simulation is still running), only the new lines at the end are parsed
+# - otherwise, the whole file is parsed again
+
+import json
+import os
+import numpy as np
+
+
+class Colvar:
+    '''
+    Columns of a COLVAR file.
+    - fields: names of the columns from the "#! FIELDS" header, e.g. ['time', 'd1', 'steer.bias', ...]
+    - data: 2D array with n rows (printed steps) and m columns (fields)
+    Columns can be accessed by name (colvar['d1']) or by position (colvar[1]).
+    '''
+
+    def __init__(self, fields, data):
+        self.fields = list(fields)
+        self.data = data
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self.fields:
+                raise KeyError(f"No field {key} in COLVAR, available fields: {self.fields}")
+            key = self.fields.index(key)
+        return self.data[:, key]
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def __len__(self):
+        return self.data.shape[0]
+
+
+def read_fields(line):
+    '''Returns the list of column names from the "#! FIELDS" header line (str or bytes).'''
+    if isinstance(line, bytes):
+        line = line.decode()
+    words = line.split()
+    if words[:2] != ['#!', 'FIELDS']:
+        raise ValueError(f"Not a COLVAR header: {line.strip()}")
+    return words[2:]
+
+
+def parse_table(text, ncol):
+    '''
+    Parses whitespace-separated numbers into a 2D array with ncol columns, skipping comment lines starting with # or @.
+    - text: bytes containing complete lines only
+    - ncol: number of columns; rows with a different number of values are not allowed
+    '''
+    if not text.strip():
+        return np.zeros((0, ncol))
+    data = np.loadtxt(text.decode().splitlines(), comments=('#', '@'), ndmin=2)
+    if data.size == 0:
+        return np.zeros((0, ncol))
+    if data.shape[1] != ncol:
+        raise ValueError(f"Expected {ncol} columns, found {data.shape[1]}")
+    return data
+
+
+def _cache_paths(path):
+    # binary copy and its metadata are hidden files next to the COLVAR, e.g. 2.1/.COLVAR.npy
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f'.{name}.npy'), os.path.join(folder, f'.{name}.json')
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_complete_lines(path, offset):
+    # read everything after offset, up to the last newline (the last line may still be written by PLUMED)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b'\n') + 1
+    return chunk[:end]
+
+
+def _write_cache(path, fields, data, st, offset, last_line):
+    npy_path, meta_path = _cache_paths(path)
+    meta = {'fields': fields, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'offset': offset,
+            'rows': data.shape[0], 'last_line': last_line.decode()}
+
+    # write to temporary files first so that a crash never leaves a half-written cache behind
+    # the metadata goes last, a mismatch between its row count and the array is treated as a stale cache
+    try:
+        with open(npy_path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(data))
+        os.replace(npy_path + '.tmp', npy_path)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+    except OSError:
+        # read-only result folders: just skip caching
+        pass
+
+
+def _last_line(text):
+    lines = text.rstrip(b'\n').rsplit(b'\n', 1)
+    return lines[-1] + b'\n'
+
+
+def load_colvar(path='COLVAR', cache=True):
+    '''
+    Loads a COLVAR file and returns a Colvar object with named columns.
+    - path: path to the COLVAR file
+    - cache: if True, uses and updates the binary copy stored next to the COLVAR file
+    '''
+    st = os.stat(path)
+    npy_path, meta_path = _cache_paths(path)
+    meta = _read_meta(meta_path) if cache else None
+
+    if meta is not None:
+        # unchanged file: map the binary copy, no parsing at all
+        if meta['size'] == st.st_size and meta['mtime_ns'] == st.st_mtime_ns:
+            data = np.load(npy_path, mmap_mode='r')
+            if data.shape[0] == meta['rows']:
+                return Colvar(meta['fields'], data)
+
+        # grown file: check that the already parsed part is still the same, then parse only the tail
+        elif st.st_size >= meta['offset']:
+            last = meta['last_line'].encode()
+            start = meta['offset'] - len(last)
+            with open(path, 'rb') as f:
+                header = f.readline()
+                f.seek(max(start, 0))
+                same_tail = f.read(len(last)) == last
+            if same_tail and read_fields(header) == meta['fields']:
+                old = np.load(npy_path)
+                if old.shape[0] == meta['rows']:
+                    tail = _read_complete_lines(path, meta['offset'])
+                    new = parse_table(tail, len(meta['fields']))
+                    data = np.concatenate([old, new]) if len(new) else old
+                    offset = meta['offset'] + len(tail)
+                    _write_cache(path, meta['fields'], data, st, offset, _last_line(tail) if len(new) else last)
+                    return Colvar(meta['fields'], data)
+
+    # no (valid) cache: parse the whole file
+    with open(path, 'rb') as f:
+        header = f.readline()
+    fields = read_fields(header)
+    text = _read_complete_lines(path, len(header))
+    data = parse_table(text, len(fields))
+    if cache:
+        last = _last_line(text) if len(data) else header
+        _write_cache(path, fields, data, st, len(header) + len(text), last)
+    return Colvar(fields, data)
+
+
+def restraint_force(colvar, arg=None, label='steer'):
+    '''
+    Calculates the restraint force -kappa*(cv - cv_ref) for each printed step.
+    The centre of the restraint and the force constant are taken from the last recorded step, as the umbrella is static by then.
+    - colvar: Colvar object
+    - arg: name of the CV, by default the first column after time (d1 in plumed.dat)
+    - label: label of the (MOVING)RESTRAINT action in plumed.dat
+    '''
+    arg = arg or colvar.fields[1]
+    ref = colvar[f'{label}.{arg}_cntr'][-1]
+    kappa = colvar[f'{label}.{arg}_kappa'][-1]
+    return -kappa * (np.asarray(colvar[arg]) - ref)
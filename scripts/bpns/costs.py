@@ -0,0 +1,83 @@
+# Cost model of the optimiser points, used for cost-aware acquisition (expected improvement per GPU-hour).
+# A point at a new plastic length needs the whole preparation (gen.sh, put_together.py, prep_prot_pl.sh) before its umbrella run,
+# a point at a length which is already prepared (or being prepared for another point) only needs prep_umb.sh and get_force.py.
+# If the plastic is in the build cache (bpns.buildcache), gen.sh only sets up the folders, so only the protein-plastic equilibration is left.
+# The cost of each stage is the median of the finished tasks recorded by the pipeline (pipeline_state.json), in GPU-hours;
+# stages which did not run yet use the defaults below.
+
+import numpy as np
+
+# rough costs of the stages (GPU-hours), used until the stage has been timed
+# the pull only runs if the windows are seeded from a single pull per length (seed_from_pull in optimize.py), so it costs nothing until it is timed
+default_costs = {'gen': 12.0, 'place': 0.05, 'equil': 12.0, 'pull': 0.0, 'umbrella': 10.0, 'force': 0.05}
+
+# stages needed once per length, and for every point
+prep_stages = ('gen', 'place', 'equil', 'pull')
+point_stages = ('umbrella', 'force')
+
+# GPUs of the stages, for pipeline states recorded without them
+default_gpus = {'gen': 1, 'equil': 1, 'pull': 1, 'umbrella': 1}
+
+
+def stage_timings(state, cpu_weight=0.1):
+    '''
+    Costs of the finished tasks from the pipeline state (see bpns.pipeline), per stage.
+    - state: dictionary of the finished tasks (Pipeline.state, or pipeline_state.json loaded)
+    - cpu_weight: GPU-hours counted for one hour of a task without GPUs
+    Returns a dictionary stage -> list of costs (GPU-hours).
+    '''
+    timings = {}
+    for name, entry in list(state.items()):
+        stage = entry.get('stage', name.split('/')[0])
+        gpus = entry.get('gpus', default_gpus.get(stage, 0))
+        hours = (entry['finished'] - entry['started']) / 3600
+        timings.setdefault(stage, []).append(hours * (gpus or cpu_weight))
+    return timings
+
+
+class CostModel:
+    '''
+    Expected cost (GPU-hours) of evaluating points (length, COM separation).
+    - costs: cost of each stage, e.g. from stage_timings (the defaults are used for the missing stages)
+    - prepared: lengths whose protein-plastic system exists or is being prepared
+    - cached: lengths whose plastic is in the build cache (only the gen stage is skipped)
+    - cached_gen: cost of gen.sh for a cached plastic
+    - power: the cost enters the acquisition as cost**power (0: cost ignored, 1: EI per GPU-hour)
+    '''
+
+    def __init__(self, costs=None, prepared=(), cached=(), cached_gen=0.05, power=1.0):
+        self.costs = dict(default_costs)
+        self.costs.update(costs or {})
+        self.prepared = set(int(l) for l in prepared)
+        self.cached = set(int(l) for l in cached)
+        self.cached_gen = cached_gen
+        self.power = power
+
+    @classmethod
+    def from_state(cls, state, cpu_weight=0.1, **kwargs):
+        '''Cost model with the median measured cost of each stage of the pipeline state.'''
+        costs = {stage: float(np.median(t)) for stage, t in stage_timings(state, cpu_weight).items()}
+        return cls(costs=costs, **kwargs)
+
+    def point_cost(self, length):
+        '''Cost of one point at the given length, including the preparation if the length is not prepared.'''
+        cost = sum(self.costs[s] for s in point_stages)
+        length = int(length)
+        if length not in self.prepared:
+            cost += sum(self.costs[s] for s in prep_stages)
+            if length in self.cached:
+                cost += self.cached_gen - self.costs['gen']
+        return cost
+
+    def __call__(self, x):
+        '''Cost**power of the points x (n x 2, length in the first column), used by bpns.surrogate.'''
+        lengths = np.asarray(x)[:, 0].astype(int)
+        unique, inverse = np.unique(lengths, return_inverse=True)
+        return np.array([self.point_cost(l) for l in unique])[inverse]**self.power
+
+    def update(self, x):
+        '''The point x will be evaluated: its length is prepared for the next points.'''
+        self.prepared.add(int(x[0]))
+
+    def summary(self):
+        return ', '.join(f"{s}: {self.costs[s]:.2f}" for s in prep_stages + point_stages) + ' GPU-h per task'
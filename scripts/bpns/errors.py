@@ -0,0 +1,111 @@
+# Error estimation of correlated time series (restraint forces) and of the free-energy profiles integrated from them.
+# - integrated_time: integrated autocorrelation time from the FFT autocorrelation, with the automatic window of Sokal
+#   (Monte Carlo Methods in Statistical Mechanics, 1997): the sum is cut at the first lag M >= c*tau(M)
+# - bootstrap_means: moving block bootstrap of the mean; all resamples of all windows are drawn with one numpy.random.Generator call
+#   and averaged from the moving block means (one cumulative sum), so thousands of resamples cost about as much as reading the data
+# - force_errors and profile_errors give the errors of the window forces and of the profiles (the windows are resampled independently)
+# The variances (error**2) can be given to the Gaussian processes as the noise of each point, e.g. RBFQuadrature(..., noise=errors**2).
+
+import numpy as np
+from scipy.fft import next_fast_len
+
+from bpns.umbrella import integrate_blocks
+
+
+def autocorrelation(x):
+    '''
+    Normalised autocorrelation function of x along the last axis (e.g. n_windows x n_steps), computed with FFTs.
+    Returns an array of the same shape, 1 at lag 0.
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    d = x - x.mean(axis=-1, keepdims=True)
+    size = next_fast_len(2 * n)
+    f = np.fft.rfft(d, n=size, axis=-1)
+    acf = np.fft.irfft(f * np.conj(f), n=size, axis=-1)[..., :n]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nan_to_num(acf / acf[..., :1])
+
+
+def integrated_time(x, c=5.0):
+    '''
+    Integrated autocorrelation time of x along the last axis (in samples; 1 for uncorrelated data), tau = 1 + 2*sum(rho(t)).
+    - c: window constant of Sokal's automatic windowing (5 is usual for roughly exponential correlations)
+    Returns one value per series (e.g. per window).
+    '''
+    rho = autocorrelation(x)
+    n = rho.shape[-1]
+    taus = 2 * np.cumsum(rho, axis=-1) - 1
+    ok = np.arange(n) >= c * taus
+    window = np.where(ok.any(axis=-1), ok.argmax(axis=-1), n - 1)
+    tau = np.take_along_axis(taus, window[..., None], axis=-1)[..., 0]
+    return np.maximum(tau, 1.0)
+
+
+def statistical_error(x, tau=None):
+    '''Standard error of the mean of a correlated series (last axis), sqrt(var * tau / n).'''
+    x = np.asarray(x, dtype=np.float64)
+    tau = integrated_time(x) if tau is None else tau
+    return np.sqrt(x.var(axis=-1) * tau / x.shape[-1])
+
+
+def block_length(x, factor=2.0):
+    '''Block length for the block bootstrap: factor times the largest integrated autocorrelation time of the series (samples).'''
+    return max(int(np.ceil(factor * np.max(integrated_time(x)))), 1)
+
+
+def bootstrap_means(x, block, n_resamples=2000, rng=None, max_elements=2**23):
+    '''
+    Moving block bootstrap of the mean of x (time along the last axis; the other axes, e.g. windows, are resampled independently).
+    Each resample joins n // block blocks of length block, starting at random positions.
+    - rng: numpy.random.Generator or seed
+    - max_elements: the random block starts are drawn in chunks of resamples of at most this size, to limit the memory
+    Returns the means of the resamples (... x n_resamples).
+    '''
+    rng = np.random.default_rng(rng)
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    block = int(min(max(block, 1), n))
+    n_blocks = n // block
+
+    # moving block means from one cumulative sum, shifted by the mean for precision
+    shift = x.mean(axis=-1, keepdims=True)
+    csum = np.concatenate([np.zeros(x.shape[:-1] + (1,)), np.cumsum(x - shift, axis=-1)], axis=-1)
+    moving = ((csum[..., block:] - csum[..., :-block]) / block)[..., None, :]
+
+    per_resample = int(np.prod(x.shape[:-1])) * n_blocks
+    chunk = max(max_elements // max(per_resample, 1), 1)
+    means = []
+    for first in range(0, n_resamples, chunk):
+        starts = rng.integers(0, moving.shape[-1], size=x.shape[:-1] + (min(chunk, n_resamples - first), n_blocks))
+        means.append(np.take_along_axis(moving, starts, axis=-1).mean(axis=-1))
+    return np.concatenate(means, axis=-1) + shift
+
+
+def force_errors(forces, n_resamples=2000, block=None, rng=None):
+    '''
+    Mean forces and their bootstrap errors.
+    - forces: restraint forces with time along the last axis (one window, or n_windows x n_steps)
+    - block: block length of the bootstrap (samples), by default twice the integrated autocorrelation time (see block_length)
+    Returns the mean forces, their errors (standard deviation of the bootstrap means), the integrated autocorrelation times and the block length.
+    '''
+    forces = np.asarray(forces, dtype=np.float64)
+    tau = integrated_time(forces)
+    block = block or max(int(np.ceil(2 * np.max(tau))), 1)
+    means = bootstrap_means(forces, block, n_resamples, rng)
+    return forces.mean(axis=-1), means.std(axis=-1), tau, block
+
+
+def profile_errors(cv, forces, n_resamples=2000, block=None, rng=None):
+    '''
+    Free-energy profile (umbrella integration of the mean forces) and its bootstrap error.
+    - cv: CV values of the windows
+    - forces: forces with time along the last axis (n_windows x n_steps, or n_systems x n_windows x n_steps)
+    - block: block length of the bootstrap (samples), by default twice the largest integrated autocorrelation time
+    Returns the profile, its error at each window and the bootstrap profiles (... x n_resamples x n_windows).
+    '''
+    forces = np.asarray(forces, dtype=np.float64)
+    block = block or block_length(forces)
+    means = bootstrap_means(forces, block, n_resamples, rng)
+    profiles = integrate_blocks(cv, np.swapaxes(means, -1, -2))
+    return integrate_blocks(cv, forces.mean(axis=-1)), profiles.std(axis=-2), profiles
@@ -0,0 +1,28 @@
+# GPy wrapper of the mean function of the 2D (plastic length, COM separation) model, see bpns.surface.slope_mean.
+# Kept apart from bpns.surface so that the surface evaluation can be imported without GPy.
+
+import GPy
+import numpy as np
+
+from bpns.surface import slope_mean, slope_mean_gradient
+
+
+class SlopeMean(GPy.core.Mapping):
+    '''
+    Non-standard mean function for GPy models, evaluated for all points at once.
+    - input_dim, output_dim: 2 and 1 for the (length, COM) model
+    The mean function itself has no parameters (determined in get_force.ipynb), so it is not optimised together with the kernel.
+    '''
+
+    def __init__(self, input_dim=2, output_dim=1, name='slope_mean'):
+        super(SlopeMean, self).__init__(input_dim=input_dim, output_dim=output_dim, name=name)
+
+    def f(self, X):
+        return slope_mean(X)
+
+    def update_gradients(self, dL_dF, X):
+        pass
+
+    def gradients_X(self, dL_dF, X):
+        # chain rule with the analytic gradient of the mean function
+        return np.asarray(dL_dF).reshape(-1, 1) * slope_mean_gradient(X)
@@ -0,0 +1,177 @@
+# Streaming force estimator for a running umbrella simulation.
+# The monitor follows the COLVAR file while mdrun is writing it, reads only the new lines at each check and keeps a running (Welford) mean and variance of the block-averaged restraint force -kappa*(d - d_ref).
+# Once the standard error of the force drops below a threshold, mdrun is stopped cleanly (SIGTERM: GROMACS writes a checkpoint and stops at the next neighbour-search step) and the force is reported.
+# Usage (see prep_umb.sh):
+# python3 -m bpns.monitor COLVAR --pid <mdrun pid> --threshold 0.5 --start 10000
+# The result is written as JSON to FORCE_MONITOR next to the COLVAR file (force, error, number of blocks, first and last sample used).
+
+import argparse
+import json
+import os
+import signal
+import time
+import numpy as np
+
+from bpns.colvar import parse_table, read_fields
+
+
+class BlockWelford:
+    '''
+    Running mean and variance of block averages.
+    - size: block size (number of samples)
+    Samples are added in chunks with add(); complete blocks update the running statistics, the rest is kept until the block is full.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self.partial = np.zeros(0)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, values):
+        values = np.concatenate([self.partial, np.asarray(values, dtype=np.float64)])
+        n_new = values.size // self.size
+        self.partial = values[n_new*self.size:]
+        if n_new == 0:
+            return
+
+        # combine the statistics of the new blocks with the running ones (Chan et al. update of Welford's algorithm)
+        blocks = values[:n_new*self.size].reshape(n_new, self.size).mean(axis=1)
+        mean_b = blocks.mean()
+        m2_b = np.sum((blocks - mean_b)**2)
+        n = self.n + n_new
+        delta = mean_b - self.mean
+        self.mean += delta * n_new / n
+        self.m2 += m2_b + delta**2 * self.n * n_new / n
+        self.n = n
+
+    @property
+    def std(self):
+        '''Standard deviation of the block averages.'''
+        return np.sqrt(self.m2 / self.n) if self.n else np.nan
+
+    @property
+    def error(self):
+        '''Standard error of the mean force.'''
+        return np.sqrt(self.m2 / (self.n - 1) / self.n) if self.n > 1 else np.inf
+
+
+class ForceMonitor:
+    '''
+    Follows a growing COLVAR file and estimates the mean restraint force.
+    - path: COLVAR file
+    - start: number of samples skipped at the beginning (pulling + equilibration at the umbrella)
+    - block: block size (samples)
+    - arg, label: CV and restraint label in plumed.dat, as in bpns.colvar.restraint_force
+    '''
+
+    def __init__(self, path='COLVAR', start=35000, block=1000, arg=None, label='steer'):
+        self.path = path
+        self.start = start
+        self.stats = BlockWelford(block)
+        self.arg = arg
+        self.label = label
+        self.fields = None
+        self.offset = 0
+        self.n_samples = 0
+
+    def update(self):
+        '''Reads the lines written since the last call and updates the force statistics; returns the number of new samples.'''
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb') as f:
+            if self.fields is None:
+                header = f.readline()
+                if not header.endswith(b'\n'):
+                    return 0
+                self.fields = read_fields(header)
+                self.offset = len(header)
+            f.seek(self.offset)
+            chunk = f.read()
+
+        # only complete lines, the last one may still be written
+        chunk = chunk[:chunk.rfind(b'\n') + 1]
+        self.offset += len(chunk)
+        data = parse_table(chunk, len(self.fields))
+        if len(data) == 0:
+            return 0
+
+        # restraint force with the centre and force constant of each step
+        arg = self.arg or self.fields[1]
+        col = self.fields.index
+        cv = data[:, col(arg)]
+        ref = data[:, col(f'{self.label}.{arg}_cntr')]
+        kappa = data[:, col(f'{self.label}.{arg}_kappa')]
+        force = -kappa * (cv - ref)
+
+        # skip the samples before the start of the analysis
+        skip = max(self.start - self.n_samples, 0)
+        self.n_samples += len(force)
+        self.stats.add(force[skip:])
+        return len(force)
+
+    def converged(self, threshold, min_blocks=10):
+        return self.stats.n >= min_blocks and self.stats.error <= threshold
+
+    def result(self, converged):
+        used = self.stats.n * self.stats.size
+        return {'force': float(self.stats.mean), 'error': float(self.stats.error), 'std': float(self.stats.std),
+                'n_blocks': self.stats.n, 'block': self.stats.size, 'start': self.start, 'end': self.start + used,
+                'converged': bool(converged)}
+
+
+def running(pid):
+    '''Checks if the process with the given pid is still running.'''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # a finished child which was not waited for yet is a zombie, it counts as finished
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().split(')')[-1].split()[0] != 'Z'
+    except OSError:
+        return True
+
+
+def monitor(path, pid, threshold, start=35000, block=1000, min_blocks=10, interval=60, output='FORCE_MONITOR'):
+    '''
+    Follows the COLVAR file while the process pid (mdrun or the srun running it) is alive.
+    When the standard error of the force is below threshold, sends SIGTERM to the process.
+    Writes the final estimate as JSON to output (next to the COLVAR file) and returns it.
+    '''
+    mon = ForceMonitor(path, start=start, block=block)
+    converged = False
+    while running(pid):
+        mon.update()
+        if mon.converged(threshold, min_blocks):
+            converged = True
+            print(f"Force converged: {mon.stats.mean:.4f} +/- {mon.stats.error:.4f} after {mon.n_samples} samples, stopping the simulation")
+            os.kill(pid, signal.SIGTERM)
+            break
+        print(f"{mon.n_samples} samples, {mon.stats.n} blocks, force {mon.stats.mean:.4f} +/- {mon.stats.error:.4f}", flush=True)
+        time.sleep(interval)
+
+    # if the simulation ended by itself, read what was written since the last check
+    if not converged:
+        mon.update()
+    result = mon.result(converged)
+    with open(os.path.join(os.path.dirname(os.path.abspath(path)), output), 'w') as f:
+        json.dump(result, f, indent=1)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stops an umbrella simulation once the mean restraint force is converged.')
+    parser.add_argument('colvar', nargs='?', default='COLVAR', help='COLVAR file written by PLUMED')
+    parser.add_argument('--pid', type=int, required=True, help='pid of the running mdrun (or srun) process')
+    parser.add_argument('--threshold', type=float, required=True, help='standard error of the force at which the simulation is stopped')
+    parser.add_argument('--start', type=int, default=35000, help='number of samples skipped at the beginning')
+    parser.add_argument('--block', type=int, default=1000, help='block size (samples)')
+    parser.add_argument('--min-blocks', type=int, default=10, help='minimum number of blocks before the simulation can be stopped')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between checks')
+    args = parser.parse_args()
+    monitor(args.colvar, args.pid, args.threshold, start=args.start, block=args.block, min_blocks=args.min_blocks, interval=args.interval)
@@ -0,0 +1,93 @@
+# Data for the overlay plots of umbrella windows (plumed_files/overlay_work.py), for any number of windows and plastic lengths.
+# Each COLVAR is read once (with bpns.colvar, binary cache included), in parallel over all the windows of all the folders, and reduced to:
+# - the traces of the CV, the centre of the restraint, the bias and the work against time, downsampled to a fixed number of points
+#   by keeping the minimum and the maximum of each bucket of samples, so spikes and the envelope of the fluctuations are kept
+# - the histogram of the CV after the pulling (the samples where the centre is at its final value), on bins shared by all windows
+# All the panels (traces, histogram overlap, work and bias) are drawn from these small arrays, so a 75 ns window costs a few thousand points.
+# The overlap of neighbouring windows is the shared area of their normalised histograms (1: identical, 0: no common samples).
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from bpns.colvar import load_colvar
+from bpns.umbrella import window_dirs
+
+# columns of the traces and their names in COLVAR
+trace_fields = {'cv': 'd1', 'cntr': 'steer.d1_cntr', 'bias': 'steer.bias', 'work': 'steer.d1_work'}
+
+
+def minmax_downsample(t, y, n_points=2000):
+    '''
+    Downsamples the trace y(t) to at most n_points points: the samples are split into n_points/2 buckets and the minimum and the maximum
+    of each bucket are kept, in their order in time. Traces with at most n_points samples are returned unchanged.
+    '''
+    t, y = np.asarray(t), np.asarray(y)
+    n_buckets = n_points // 2
+    if len(y) <= n_points or n_buckets < 1:
+        return t, y
+    # buckets of size samples, the last one padded with NaN
+    size = -(-len(y) // n_buckets)
+    n_rows = -(-len(y) // size)
+    buckets = np.full(n_rows * size, np.nan)
+    buckets[:len(y)] = y
+    buckets = buckets.reshape(n_rows, size)
+    offset = np.arange(n_rows) * size
+    index = np.unique(np.concatenate([np.nanargmin(buckets, axis=1) + offset, np.nanargmax(buckets, axis=1) + offset]))
+    return t[index], y[index]
+
+
+def window_overlay(path, edges, n_points=2000):
+    '''
+    Reduces one COLVAR file to the arrays of the overlay plots.
+    - edges: bin edges of the CV histogram (nm), the same for all windows
+    - n_points: number of points of each downsampled trace
+    Returns a dictionary: 't_<field>' and '<field>' for each trace (see trace_fields), 'hist' (normalised histogram of the CV after the pulling)
+    and 'centre' (final centre of the restraint).
+    '''
+    colvar = load_colvar(path)
+    t = np.asarray(colvar['time'])
+    result = {}
+    for name, field in trace_fields.items():
+        result[f"t_{name}"], result[name] = minmax_downsample(t, colvar[field], n_points)
+    cntr = np.asarray(colvar['steer.d1_cntr'])
+    sampled = np.asarray(colvar['d1'])[np.isclose(cntr, cntr[-1])]
+    hist, _ = np.histogram(sampled, bins=edges)
+    result['hist'] = hist / max(hist.sum(), 1)
+    result['centre'] = float(cntr[-1])
+    return result
+
+
+def _window_overlay(args):
+    return window_overlay(*args)
+
+
+def load_overlays(folders, edges=np.arange(1.0, 8.0, 0.01), n_points=2000, workers=None):
+    '''
+    Reads the windows of several umbrella folders (e.g. one per plastic length), all windows in parallel.
+    - folders: folders with one sub-folder per window (named after the CV value, with a COLVAR file); windows without COLVAR are skipped
+    - edges, n_points: as in window_overlay
+    - workers: number of processes, by default the number of cores
+    Returns a dictionary {folder: {window: arrays of window_overlay}}, windows sorted by their centre.
+    '''
+    jobs = [(folder, d) for folder in folders for d in window_dirs(folder) if os.path.exists(os.path.join(folder, d, 'COLVAR'))]
+    args = [(os.path.join(folder, d, 'COLVAR'), edges, n_points) for folder, d in jobs]
+    if workers == 1 or len(jobs) <= 1:
+        loaded = [window_overlay(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count() or 1)) as pool:
+            loaded = list(pool.map(_window_overlay, args, chunksize=max(len(jobs) // (4 * (os.cpu_count() or 1)), 1)))
+    overlays = {folder: {} for folder in folders}
+    for (folder, d), arrays in zip(jobs, loaded):
+        overlays[folder][d] = arrays
+    return overlays
+
+
+def overlap(windows):
+    '''
+    Overlap of neighbouring windows (sorted by their centre): the shared area of their normalised CV histograms.
+    - windows: {window: arrays of window_overlay}, as one folder of load_overlays
+    Returns a list of (window, next window, overlap).
+    '''
+    names = sorted(windows, key=float)
+    return [(a, b, float(np.minimum(windows[a]['hist'], windows[b]['hist']).sum())) for a, b in zip(names[:-1], names[1:])]
@@ -0,0 +1,247 @@
+# Small task pipeline used by the optimiser to run the preparation and simulation stages.
+# Each stage (gen.sh, put_together.py, prep_prot_pl.sh, prep_umb.sh, get_force.py) is a Task with a shell command, the folder it runs in, the files it needs and the files it produces.
+# Tasks depending on each other form a graph: independent tasks (e.g. preparing two plastic lengths) run at the same time, the others wait for their dependencies.
+# Finished tasks are recorded in a state file (pipeline_state.json); after a crash or a restart, tasks that are recorded and whose outputs still exist are skipped.
+# Tasks are executed by an executor:
+# - LocalExecutor: runs the commands as local processes, useful for testing
+# - SlurmExecutor: runs each command as a SLURM job step (srun) or as a separate job (sbatch --wait)
+# With a Telemetry object (bpns.telemetry), the wall and CPU time, GROMACS performance and bytes written of every task are recorded in telemetry.jsonl.
+
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class TaskError(Exception):
+    '''Raised when a task (or one of its dependencies) fails.'''
+
+
+class Task:
+    '''
+    One stage of the pipeline.
+    - name: unique name of the task, e.g. "gen/ps10"
+    - cmd: shell command to run
+    - cwd: folder in which the command is run
+    - inputs: files which must exist before the task is started (relative to cwd or absolute)
+    - outputs: files produced by the task, the task is only considered finished if all of them exist
+    - deps: names of the tasks that must be finished first; they must be added to the pipeline before this task
+    - stage: name of the stage, used for grouping (e.g. in the executors and timings)
+    - gpus: number of GPUs the task needs, used by SlurmExecutor
+    - scan: folders (relative to cwd) in which the task writes its files, used by the telemetry; by default cwd
+    '''
+
+    def __init__(self, name, cmd, cwd='.', inputs=(), outputs=(), deps=(), stage=None, gpus=0, scan=('.',)):
+        self.name = name
+        self.cmd = cmd
+        self.cwd = os.path.abspath(cwd)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.stage = stage or name.split('/')[0]
+        self.gpus = gpus
+        self.scan = list(scan)
+
+    def path(self, name):
+        return os.path.join(self.cwd, name)
+
+    def missing_inputs(self):
+        return [p for p in self.inputs if not os.path.exists(self.path(p))]
+
+    def missing_outputs(self):
+        return [p for p in self.outputs if not os.path.exists(self.path(p))]
+
+
+class LocalExecutor:
+    '''
+    Runs the task commands as local processes.
+    - max_workers: maximum number of tasks running at the same time
+    '''
+
+    def __init__(self, max_workers=4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def command(self, task):
+        return task.cmd
+
+    def submit(self, task):
+        '''Starts the task and returns a future with the exit code of its command and the CPU time (s) used by it and its children.'''
+        return self._pool.submit(self._run, task)
+
+    def _run(self, task):
+        # wait4 gives the resource usage of this process only, also when several tasks run at the same time
+        proc = subprocess.Popen(self.command(task), shell=True, cwd=task.cwd)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return proc.returncode, usage.ru_utime + usage.ru_stime
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+class SlurmExecutor(LocalExecutor):
+    '''
+    Runs the task commands through SLURM.
+    - launcher: "srun" starts each task as a job step inside the current allocation (the optimiser runs inside a job),
+      "sbatch" submits each task as a separate job and waits for it to end (sbatch --wait)
+    - cpus: CPUs per task
+    - partition, time: passed to SLURM if given
+    - options: list of additional SLURM options, e.g. ["--exclude=compute-21-1"]
+    - max_workers: maximum number of tasks running (or queued) at the same time
+    Note that the stage scripts call "srun gmx_mpi" themselves: the sbatch launcher gives them their own allocation to do so, and the srun launcher
+    starts the outer step with --overlap (not --exclusive), so the inner gmx_mpi steps can use the resources it holds instead of waiting for them forever.
+    The outer steps overlap each other as well, the number of tasks running at the same time is limited by max_workers.
+    '''
+
+    def __init__(self, launcher='srun', cpus=16, partition=None, time=None, options=(), max_workers=32):
+        super().__init__(max_workers=max_workers)
+        if launcher not in ('srun', 'sbatch'):
+            raise ValueError("launcher must be srun or sbatch")
+        self.launcher = launcher
+        self.cpus = cpus
+        self.partition = partition
+        self.time = time
+        self.options = list(options)
+
+    def command(self, task):
+        args = [f'--job-name={task.name}', '--ntasks=1', f'--cpus-per-task={self.cpus}']
+        if task.gpus:
+            args.append(f'--gpus={task.gpus}')
+        if self.partition:
+            args.append(f'--partition={self.partition}')
+        if self.time:
+            args.append(f'--time={self.time}')
+        args += self.options
+
+        if self.launcher == 'srun':
+            return ' '.join(['srun', '--overlap'] + args + ['bash', '-c', shlex.quote(task.cmd)])
+        return ' '.join(['sbatch', '--wait', f'--output={task.stage}_%j.log'] + args + [f'--wrap={shlex.quote(task.cmd)}'])
+
+
+class Pipeline:
+    '''
+    Graph of tasks with a record of the finished ones.
+    - executor: LocalExecutor or SlurmExecutor
+    - state_file: JSON file where the finished tasks are recorded
+    - telemetry: bpns.telemetry.Telemetry recording the resources used by each task, or None
+    run() can be called from several threads at the same time; a task needed by several callers only runs once.
+    '''
+
+    def __init__(self, executor, state_file='pipeline_state.json', telemetry=None):
+        self.executor = executor
+        self.telemetry = telemetry
+        self.state_file = os.path.abspath(state_file)
+        self.tasks = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.state_file) as f:
+                self.state = json.load(f)
+        except FileNotFoundError:
+            self.state = {}
+
+    def add(self, task):
+        '''Adds a task to the pipeline; adding a task with the same name and command again has no effect.'''
+        with self._lock:
+            if task.name in self.tasks:
+                if self.tasks[task.name].cmd != task.cmd:
+                    raise ValueError(f"Task {task.name} already exists with a different command")
+                return self.tasks[task.name]
+            unknown = [d for d in task.deps if d not in self.tasks]
+            if unknown:
+                raise ValueError(f"Task {task.name} depends on unknown tasks: {unknown}")
+            self.tasks[task.name] = task
+            return task
+
+    def is_done(self, name):
+        '''Checks if the task is recorded as finished and its outputs are still there.'''
+        task = self.tasks[name]
+        return name in self.state and not task.missing_outputs()
+
+    def run(self, *names):
+        '''Runs the given tasks together with all their unfinished dependencies and waits for them; raises TaskError if any of them fails.'''
+        for future in [self._start(name) for name in names]:
+            future.result()
+
+    def _start(self, name):
+        # one future per task, shared by everyone who needs the task
+        with self._lock:
+            if name in self._futures:
+                return self._futures[name]
+            future = Future()
+            self._futures[name] = future
+
+        if self.is_done(name):
+            future.set_result(None)
+            return future
+
+        # wait for the dependencies, then submit the task itself
+        task = self.tasks[name]
+        deps = [self._start(d) for d in task.deps]
+        remaining = [len(deps)]
+        remaining_lock = threading.Lock()
+
+        def dep_finished(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            failed = [d for d, f in zip(task.deps, deps) if f.exception() is not None]
+            if failed:
+                self._fail(name, TaskError(f"Task {name} not started, dependencies failed: {failed}"))
+            else:
+                self._submit(task)
+
+        if deps:
+            for dep in deps:
+                dep.add_done_callback(dep_finished)
+        else:
+            self._submit(task)
+        return future
+
+    def _submit(self, task):
+        missing = task.missing_inputs()
+        if missing:
+            self._fail(task.name, TaskError(f"Task {task.name} not started, missing inputs: {missing}"))
+            return
+        print(f"Starting {task.name}: {task.cmd}")
+        started = time.time()
+        self.executor.submit(task).add_done_callback(lambda f: self._finished(task, f, started))
+
+    def _finished(self, task, exec_future, started):
+        if exec_future.exception() is not None:
+            self._fail(task.name, TaskError(f"Task {task.name} could not be run: {exec_future.exception()}"))
+            return
+        code, cpu = exec_future.result()
+        if self.telemetry is not None:
+            try:
+                self.telemetry.record(task, started, time.time(), cpu, code)
+            except OSError as e:
+                print(f"Telemetry of {task.name} not recorded: {e}")
+        missing = task.missing_outputs()
+        if code != 0 or missing:
+            self._fail(task.name, TaskError(f"Task {task.name} failed (exit code {code}, missing outputs: {missing})"))
+            return
+
+        self._record(task, started)
+        print(f"Finished {task.name}")
+        self._futures[task.name].set_result(None)
+
+    def _fail(self, name, error):
+        # forget the failed future so that the task is tried again the next time it is needed
+        with self._lock:
+            future = self._futures.pop(name)
+        print(error)
+        future.set_exception(error)
+
+    def _record(self, task, started):
+        # the state file is rewritten as a whole, through a temporary file so that a crash never leaves it half-written
+        with self._lock:
+            self.state[task.name] = {'cmd': task.cmd, 'cwd': task.cwd, 'stage': task.stage, 'gpus': task.gpus,
+                                     'started': started, 'finished': time.time()}
+            with open(self.state_file + '.tmp', 'w') as f:
+                json.dump(self.state, f, indent=1)
+            os.replace(self.state_file + '.tmp', self.state_file)
@@ -0,0 +1,228 @@
+# One steered pull per plastic length, with every umbrella window seeded from its snapshots.
+# Without it, each window (prep_umb.sh) restarts from md.cpt and pulls from 1.6 nm to its own centre before sampling,
+# so the distant windows repeat all the pulling of the nearer ones. Here:
+# - pull: runs the MOVINGRESTRAINT of plumed.dat once, from 1.6 nm to max_cv, saving coordinates and velocities every frame_ps (pull/pull.trr);
+#   the frames are indexed by the COM separation measured at their time in COLVAR (pull/frames.json)
+# - seed: prepares a window (including windows asked for later by the optimiser) from the stored frame closest to its centre,
+#   with a static restraint at the centre (a MOVINGRESTRAINT with a single step, so COLVAR has the same columns as before)
+# GROMACS is called as $GMX (default gmx), e.g. GMX="srun --mpi=pmix /path/to/gmx_mpi"; any stand-in executable accepting the same
+# arguments (grompp, mdrun) can be used to test the workflow without simulations.
+# Usage (in the plumed folder of a length, the protein-plastic folder being ..):
+# python3 -m bpns.pull pull .. --max-cv 6.6
+# python3 -m bpns.pull seed .. 3.35
+
+import argparse
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import numpy as np
+
+from bpns.colvar import load_colvar
+
+# plumed.dat of the repo, used as the template of the restraints
+plumed_template = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'plumed_files', 'plumed.dat')
+
+
+def gmx_command():
+    '''GROMACS command from the GMX environment variable (may include a launcher, e.g. srun), as a list.'''
+    return shlex.split(os.environ.get('GMX', 'gmx'))
+
+
+def run_gmx(args, cwd, log):
+    '''Runs a GROMACS command in cwd, appending its output to the log file; raises CalledProcessError if it fails.'''
+    with open(log, 'a') as f:
+        f.write(f"$ {' '.join(gmx_command() + args)}\n")
+        f.flush()
+        subprocess.run(gmx_command() + args, cwd=cwd, stdout=f, stderr=subprocess.STDOUT, check=True)
+
+
+def mdp_value(text, key, default=None):
+    '''Value of a parameter in an mdp file (dashes and underscores are the same in mdp keys).'''
+    key = key.replace('-', '_').lower()
+    for line in text.splitlines():
+        name, _, value = line.split(';')[0].partition('=')
+        if name.strip().replace('-', '_').lower() == key and value.strip():
+            return value.strip()
+    return default
+
+
+def set_mdp(text, **params):
+    '''Sets parameters of an mdp file (given as text), adding the ones which are not there; returns the new text.'''
+    params = {k.replace('-', '_').lower(): v for k, v in params.items()}
+    lines = []
+    for line in text.splitlines():
+        name = line.split(';')[0].partition('=')[0].strip().replace('-', '_').lower()
+        if '=' in line.split(';')[0] and name in params:
+            line = f"{name:24s} = {params.pop(name)}"
+        lines.append(line)
+    lines += [f"{k:24s} = {v}" for k, v in params.items()]
+    return '\n'.join(lines) + '\n'
+
+
+def set_restraint(text, points):
+    '''
+    Replaces the schedule of the MOVINGRESTRAINT in plumed.dat (given as text) by points [(step, at), ...], keeping its force constant.
+    A single point gives a static restraint.
+    '''
+    kappa = re.search(r'KAPPA0=(\S+)', text).group(1)
+    lines = []
+    inside = False
+    for line in text.splitlines():
+        if line.strip().startswith('MOVINGRESTRAINT'):
+            inside = True
+        elif inside and line.strip() == '...':
+            inside = False
+            lines += [f"   STEP{i}={step}  AT{i}={at}  KAPPA{i}={kappa}" for i, (step, at) in enumerate(points)]
+        elif inside and re.match(r'\s*STEP\d+=', line):
+            continue
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def pull(prot_pl, folder=None, max_cv=6.6, start_cv=1.6, vel=0.35, frame_ps=10, template=plumed_template):
+    '''
+    Runs the pull of one plastic length from the end of the protein-plastic equilibration (md/md.gro and md/md.cpt) and indexes its frames.
+    - prot_pl: protein-plastic folder (with topol.top, md.mdp and md/)
+    - folder: folder of the pull, by default plumed/pull in prot_pl
+    - max_cv, start_cv: COM separations at the end and at the start of the pull (nm)
+    - vel: pulling velocity (nm/ns)
+    - frame_ps: time between saved frames (ps); the COM resolution of the seeds is about vel*frame_ps/1000 nm
+    - template: plumed.dat with the CV definitions and the MOVINGRESTRAINT
+    Returns the frame index (see index_frames). Nothing is run again if the pull is already indexed.
+    '''
+    prot_pl = os.path.abspath(prot_pl)
+    folder = os.path.abspath(folder or os.path.join(prot_pl, 'plumed', 'pull'))
+    if os.path.exists(os.path.join(folder, 'frames.json')):
+        return load_frames(folder)
+    os.makedirs(folder, exist_ok=True)
+    log = os.path.join(folder, 'pull.out')
+
+    with open(os.path.join(prot_pl, 'md.mdp')) as f:
+        mdp = f.read()
+    dt = float(mdp_value(mdp, 'dt', 0.002))
+    n_steps = int(round((max_cv - start_cv) / vel * 1000 / dt))
+    frame_steps = max(int(round(frame_ps / dt)), 1)
+    with open(os.path.join(folder, 'pull.mdp'), 'w') as f:
+        f.write(set_mdp(mdp, tinit=0, nsteps=n_steps, nstxout=frame_steps, nstvout=frame_steps, nstfout=0,
+                        continuation='yes', gen_vel='no'))
+    with open(template) as f:
+        plumed = f.read()
+    with open(os.path.join(folder, 'plumed.dat'), 'w') as f:
+        f.write(set_restraint(plumed, [(0, start_cv), (n_steps, max_cv)]))
+    with open(os.path.join(folder, 'pull.json'), 'w') as f:
+        json.dump({'start_cv': start_cv, 'max_cv': max_cv, 'vel': vel, 'dt': dt, 'frame_ps': frame_steps * dt, 'n_steps': n_steps}, f)
+
+    # the pull continues the equilibration (coordinates, velocities and coupling state from the checkpoint)
+    rel = os.path.relpath(folder, prot_pl)
+    run_gmx(['grompp', '-f', f"{rel}/pull.mdp", '-c', 'md/md.gro', '-t', 'md/md.cpt', '-p', 'topol.top',
+             '-o', f"{rel}/pull.tpr", '-po', f"{rel}/mdout.mdp", '-maxwarn', '2'], prot_pl, log)
+    run_gmx(['mdrun', '-deffnm', 'pull', '-plumed', 'plumed.dat'], folder, log)
+    return index_frames(folder)
+
+
+def index_frames(folder):
+    '''
+    Indexes the frames of a finished pull by COM separation: the time of each saved frame and the CV (and restraint centre) at that time in COLVAR.
+    The index is saved to frames.json in the pull folder and returned as a dictionary of arrays (time, com, centre).
+    '''
+    with open(os.path.join(folder, 'pull.json')) as f:
+        meta = json.load(f)
+    colvar = load_colvar(os.path.join(folder, 'COLVAR'))
+    arg = colvar.fields[1]
+    time = np.asarray(colvar['time'])
+    frames = np.arange(0, time[-1] + 1e-6, meta['frame_ps'])
+    index = {'time': frames.tolist(), 'com': np.interp(frames, time, colvar[arg]).tolist(),
+             'centre': np.interp(frames, time, colvar[f'steer.{arg}_cntr']).tolist()}
+    with open(os.path.join(folder, 'frames.json.tmp'), 'w') as f:
+        json.dump(index, f)
+    os.replace(os.path.join(folder, 'frames.json.tmp'), os.path.join(folder, 'frames.json'))
+    return {k: np.array(v) for k, v in index.items()}
+
+
+def load_frames(folder):
+    '''Frame index of a pull folder (see index_frames).'''
+    with open(os.path.join(folder, 'frames.json')) as f:
+        return {k: np.array(v) for k, v in json.load(f).items()}
+
+
+def closest_frame(frames, com, tolerance=0.05):
+    '''
+    The stored frame whose COM separation is the closest to com; returns its time (ps) and COM separation.
+    Raises ValueError if no frame is within tolerance (nm), e.g. if com is beyond the end of the pull.
+    '''
+    i = int(np.argmin(np.abs(frames['com'] - com)))
+    if abs(frames['com'][i] - com) > tolerance:
+        raise ValueError(f"No frame of the pull within {tolerance} nm of {com} nm (pulled from {frames['com'].min():.2f} to {frames['com'].max():.2f} nm)")
+    return float(frames['time'][i]), float(frames['com'][i])
+
+
+def seed(prot_pl, com, folder=None, pull_folder=None, ns=50, tolerance=0.05, template=plumed_template):
+    '''
+    Prepares an umbrella window at com from the closest frame of the pull: umbrella.tpr (continuing from the frame coordinates and velocities)
+    and plumed.dat with a static restraint at com. The window is then run with mdrun -s umbrella.tpr -plumed plumed.dat (see prep_umb.sh).
+    - prot_pl: protein-plastic folder
+    - folder: folder of the window, by default plumed/<com> in prot_pl
+    - pull_folder: folder of the pull, by default plumed/pull in prot_pl
+    - ns: length of the window (ns)
+    Returns the time and COM separation of the frame used.
+    '''
+    prot_pl = os.path.abspath(prot_pl)
+    folder = os.path.abspath(folder or os.path.join(prot_pl, 'plumed', str(com)))
+    pull_folder = os.path.abspath(pull_folder or os.path.join(prot_pl, 'plumed', 'pull'))
+    os.makedirs(folder, exist_ok=True)
+    time, frame_com = closest_frame(load_frames(pull_folder), float(com), tolerance)
+
+    with open(os.path.join(prot_pl, 'md.mdp')) as f:
+        mdp = f.read()
+    dt = float(mdp_value(mdp, 'dt', 0.002))
+    with open(os.path.join(folder, 'umbrella.mdp'), 'w') as f:
+        f.write(set_mdp(mdp, tinit=0, nsteps=int(round(ns * 1000 / dt)), continuation='yes', gen_vel='no'))
+    with open(template) as f:
+        plumed = f.read()
+    with open(os.path.join(folder, 'plumed.dat'), 'w') as f:
+        f.write(set_restraint(plumed, [(0, com)]))
+
+    # the parameters are saved for debugging, in the same format as prep_umb.sh (no pulling in the window itself)
+    with open(os.path.join(folder, 'params.log'), 'w') as f:
+        f.write(f"seeded from the pull frame at {time} ps, COM separation {frame_com:.4f} nm\n")
+        f.write("distance to pull: 0\ntime in ns: 0\n")
+
+    rel, pull_rel = os.path.relpath(folder, prot_pl), os.path.relpath(pull_folder, prot_pl)
+    run_gmx(['grompp', '-f', f"{rel}/umbrella.mdp", '-c', f"{pull_rel}/pull.gro", '-t', f"{pull_rel}/pull.trr", '-time', f"{time:g}",
+             '-p', 'topol.top', '-o', f"{rel}/umbrella.tpr", '-po', f"{rel}/mdout.mdp", '-maxwarn', '2'], prot_pl, os.path.join(folder, 'seed.out'))
+    return time, frame_com
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Single steered pull per plastic length and umbrella windows seeded from it.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    pull_parser = sub.add_parser('pull', help='run and index the pull of one length')
+    pull_parser.add_argument('prot_pl', help='protein-plastic folder (with topol.top, md.mdp and md/)')
+    pull_parser.add_argument('--folder', help='pull folder (default: plumed/pull in prot_pl)')
+    pull_parser.add_argument('--max-cv', type=float, default=6.6, help='COM separation at the end of the pull (nm)')
+    pull_parser.add_argument('--start-cv', type=float, default=1.6, help='COM separation at the start of the pull (nm)')
+    pull_parser.add_argument('--vel', type=float, default=0.35, help='pulling velocity (nm/ns)')
+    pull_parser.add_argument('--frame-ps', type=float, default=10, help='time between saved frames (ps)')
+    pull_parser.add_argument('--template', default=plumed_template, help='plumed.dat template')
+    seed_parser = sub.add_parser('seed', help='prepare an umbrella window from the closest frame of the pull')
+    seed_parser.add_argument('prot_pl', help='protein-plastic folder')
+    seed_parser.add_argument('com', help='centre of the window (nm), also the name of its folder')
+    seed_parser.add_argument('--folder', help='window folder (default: plumed/<com> in prot_pl)')
+    seed_parser.add_argument('--pull-folder', help='pull folder (default: plumed/pull in prot_pl)')
+    seed_parser.add_argument('--ns', type=float, default=50, help='length of the window (ns)')
+    seed_parser.add_argument('--tolerance', type=float, default=0.05, help='largest distance between the window and the frame (nm)')
+    seed_parser.add_argument('--template', default=plumed_template, help='plumed.dat template')
+    args = parser.parse_args()
+
+    if args.command == 'pull':
+        frames = pull(args.prot_pl, args.folder, args.max_cv, args.start_cv, args.vel, args.frame_ps, args.template)
+        print(f"{len(frames['time'])} frames from {frames['com'].min():.3f} to {frames['com'].max():.3f} nm")
+    else:
+        try:
+            time, com = seed(args.prot_pl, args.com, args.folder, args.pull_folder, args.ns, args.tolerance, args.template)
+        except ValueError as err:
+            sys.exit(str(err))
+        print(f"Window {args.com} seeded from the frame at {time} ps (COM separation {com:.4f} nm)")
@@ -0,0 +1,230 @@
+# Bayesian quadrature of force profiles with a Gaussian process (GP) with an RBF kernel, in closed form.
+# The GP is fitted once (one Cholesky factorisation) and the integrals of its posterior over any number of intervals are computed together,
+# using the analytic integrals of the RBF kernel over an interval (Lebesgue measure). This gives the same numbers as building a
+# GPy GPRegression + emukit VanillaBayesianQuadrature for every upper bound (as integrate_bayesian1D in quadrature.ipynb used to do),
+# without refitting. Several systems measured at the same COM values (e.g. ps0/ps10/ps20/ps40) share the factorisation.
+# The 2D (plastic length, COM separation) model has its own quadrature (ProductRBFQuadrature): a product of RBF kernels, one per dimension,
+# whose integrals over boxes factorise into the 1D integrals below. Up to max_exact points the GP is exact (the same model as GPy's RBF kernel
+# in quadrature.ipynb); above, it uses n_inducing inducing points (DTC approximation), built from the data in chunks, so the memory grows
+# linearly with the number of points and the cost of the integrals does not depend on it.
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, cholesky, solve_triangular
+from scipy.special import erf
+
+from bpns.surrogate import farthest_points
+
+
+def rbf(x1, x2, lengthscale, variance):
+    '''RBF kernel matrix between the 1D points x1 and x2.'''
+    d = np.subtract.outer(np.ravel(x1), np.ravel(x2))
+    return variance * np.exp(-0.5 * (d / lengthscale)**2)
+
+
+def rbf_kernel_mean(x, lb, ub, lengthscale, variance):
+    '''
+    Integral of the RBF kernel over intervals: int_lb^ub k(t, x) dt.
+    - x: points (n)
+    - lb, ub: lower and upper bounds of the intervals (k)
+    Returns a k x n array.
+    '''
+    x = np.ravel(x)
+    lb, ub = np.ravel(lb)[:, None], np.ravel(ub)[:, None]
+    s = np.sqrt(2) * lengthscale
+    return variance * lengthscale * np.sqrt(np.pi / 2) * (erf((ub - x) / s) - erf((lb - x) / s))
+
+
+def rbf_double_integral(lb, ub, lengthscale, variance):
+    '''Double integral of the RBF kernel over the square [lb, ub] x [lb, ub], for each interval.'''
+    length = np.ravel(ub) - np.ravel(lb)
+    r = length / lengthscale
+    return variance * lengthscale**2 * (np.sqrt(2*np.pi) * r * erf(r / np.sqrt(2)) - 2 * (1 - np.exp(-0.5 * r**2)))
+
+
+class RBFQuadrature:
+    '''
+    GP with a zero mean and an RBF kernel fitted to 1D data, with integrals of the posterior in closed form.
+    - x: points (n), e.g. COM separations
+    - y: values at the points, n or n x m (m systems measured at the same points, e.g. forces of several plastic lengths)
+    - lengthscale, variance: RBF kernel hyperparameters
+    - noise: variance of the observation noise, a number or one value per point (e.g. squared errors of the forces)
+    The defaults are the ones used in quadrature.ipynb (GPy defaults, noise variance 1.0).
+    '''
+
+    def __init__(self, x, y, lengthscale=0.5, variance=1.0, noise=1.0):
+        self.x = np.ravel(x).astype(np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.lengthscale = lengthscale
+        self.variance = variance
+
+        # one factorisation of K + noise, shared by all the integrals and systems
+        gram = rbf(self.x, self.x, lengthscale, variance) + np.diag(np.broadcast_to(noise, self.x.shape))
+        self.chol = cho_factor(gram)
+        self.alpha = cho_solve(self.chol, self.y)
+
+    def predict(self, x):
+        '''Posterior mean (same trailing shape as y) and variance of the GP at the points x.'''
+        k = rbf(x, self.x, self.lengthscale, self.variance)
+        mean = k @ self.alpha
+        var = self.variance - np.sum(k * cho_solve(self.chol, k.T).T, axis=1)
+        return mean, var
+
+    def integrate(self, lb, ub):
+        '''
+        Integrals of the GP posterior over the intervals [lb, ub] (arrays of the same length k, or numbers).
+        Returns the integral means (k, or k x m) and variances (k).
+        '''
+        z = rbf_kernel_mean(self.x, lb, ub, self.lengthscale, self.variance)
+        mean = z @ self.alpha
+        var = rbf_double_integral(lb, ub, self.lengthscale, self.variance) - np.sum(z * cho_solve(self.chol, z.T).T, axis=1)
+        return mean, var
+
+
+def integrate_profiles(coms, forces, interval=0.5, lengthscale=0.5, variance=1.0, noise=1.0):
+    '''
+    Free-energy profiles from forces by Bayesian quadrature, for one or several systems sampled at the same COM values.
+    The integrals start at the first COM value and end at upper bounds from the second COM value onwards, every interval nm (as integrate_bayesian1D in quadrature.ipynb).
+    - coms: COM separations (n, or n x 1)
+    - forces: forces at the COM separations (n, or n x m for m systems)
+    Returns:
+    - integrals: free energies at the first COM value (0) and at each upper bound (k+1, or k+1 x m)
+    - variances: variances of the integrals (k+1), the same for all systems
+    '''
+    coms = np.ravel(coms)
+    forces = np.asarray(forces, dtype=np.float64)
+    if forces.ndim == 2 and forces.shape[1] == 1:
+        forces = forces[:, 0]
+
+    ub = np.arange(coms[1], coms[-1]+interval, interval)
+    model = RBFQuadrature(coms, forces, lengthscale=lengthscale, variance=variance, noise=noise)
+    mean, var = model.integrate(np.full(ub.shape, coms[0]), ub)
+
+    # the profile starts at 0 at the first COM value
+    integrals = np.concatenate([np.zeros((1,) + mean.shape[1:]), mean])
+    variances = np.concatenate([[0.0], var])
+    return integrals, variances
+
+
+def _box_factors(z, lb, ub, lengthscales):
+    # kernel means of the product kernel (variance 1) over the boxes [lb, ub] (k x d) at the points z (m x d), and its double integrals;
+    # dimensions with lb == ub are not integrated, the kernel is evaluated at that value instead
+    mean = np.ones((len(lb), len(z)))
+    double = np.ones(len(lb))
+    for d, l in enumerate(lengthscales):
+        box = (ub[:, d] > lb[:, d])[:, None]
+        integral = rbf_kernel_mean(z[:, d], lb[:, d], ub[:, d], l, 1.0)
+        value = rbf(lb[:, d], z[:, d], l, 1.0)
+        mean *= np.where(box, integral, value)
+        double *= np.where(box[:, 0], rbf_double_integral(lb[:, d], ub[:, d], l, 1.0), 1.0)
+    return mean, double
+
+
+class ProductRBFQuadrature:
+    '''
+    GP with a product of RBF kernels over several dimensions (e.g. plastic length and COM separation), with integrals of the posterior
+    over boxes in closed form; exact up to max_exact points, with inducing points (DTC) above.
+    - x: points (n x d)
+    - y: values at the points (n)
+    - lengthscale: one number (isotropic, as GPy.kern.RBF) or one value per dimension; variance: kernel variance
+    - noise: variance of the observation noise, a number or one value per point
+    - mean, mean_integral: mean function of the points (n x d -> n) and its integrals over boxes (lb, ub: k x d -> k), e.g.
+      bpns.surface.slope_mean and bpns.surface.slope_mean_integral; zero mean by default
+    - inducing: inducing points (m x d), or their number; by default the exact GP up to max_exact points, n_inducing points chosen
+      among the data (farthest-point selection) above
+    - chunk_size: number of points processed at a time
+    The defaults are the ones of the 2D model in quadrature.ipynb (lengthscale 50, GPy defaults otherwise).
+    '''
+
+    def __init__(self, x, y, lengthscale=50.0, variance=1.0, noise=1.0, mean=None, mean_integral=None,
+                 inducing=None, max_exact=300, n_inducing=300, chunk_size=5000, random_state=0):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.lengthscales = np.broadcast_to(np.asarray(lengthscale, dtype=np.float64), self.x.shape[1:]).copy()
+        self.variance = variance
+        self.mean, self.mean_integral = mean, mean_integral
+        self.chunk_size = chunk_size
+        noise = np.broadcast_to(np.asarray(noise, dtype=np.float64), self.x.shape[:1])
+        residual = np.ravel(y).astype(np.float64) - (np.ravel(mean(self.x)) if mean else 0.0)
+
+        if inducing is None and len(self.x) > max_exact:
+            inducing = n_inducing
+        if np.ndim(inducing) == 0 and inducing is not None:
+            inducing = farthest_points(self.x, min(int(inducing), len(self.x)), np.random.RandomState(random_state))
+        self.inducing = None if inducing is None else np.asarray(inducing, dtype=np.float64)
+
+        if self.inducing is None:
+            self.chol = cholesky(self.kern(self.x, self.x) + np.diag(noise), lower=True)
+            self.alpha = cho_solve((self.chol, True), residual)
+        else:
+            # DTC: A = K_mm + K_mn diag(1/noise) K_nm and b = K_mn (y/noise), summed over chunks of points
+            k_mm = self.kern(self.inducing, self.inducing)
+            jitter = 1e-8 * variance * np.eye(len(self.inducing))
+            a = k_mm.copy()
+            b = np.zeros(len(self.inducing))
+            for start in range(0, len(self.x), chunk_size):
+                k_mn = self.kern(self.inducing, self.x[start:start+chunk_size])
+                a += (k_mn / noise[start:start+chunk_size]) @ k_mn.T
+                b += k_mn @ (residual[start:start+chunk_size] / noise[start:start+chunk_size])
+            self.chol_mm = cholesky(k_mm + jitter, lower=True)
+            self.chol_a = cholesky(a + jitter, lower=True)
+            self.alpha = cho_solve((self.chol_a, True), b)
+
+    def kern(self, x1, x2):
+        '''Product RBF kernel matrix between the points x1 and x2.'''
+        k = np.full((len(x1), len(x2)), float(self.variance))
+        for d, l in enumerate(self.lengthscales):
+            k *= rbf(x1[:, d], x2[:, d], l, 1.0)
+        return k
+
+    def _posterior(self, k, prior, mean):
+        # posterior mean and variance from the kernel values k (k x n or k x m) of the chunk and its prior variance and mean
+        # k K^-1 k^T = |L^-1 k^T|^2, one triangular solve per factor
+        if self.inducing is None:
+            return mean + k @ self.alpha, prior - np.sum(solve_triangular(self.chol, k.T, lower=True)**2, axis=0)
+        q = np.sum(solve_triangular(self.chol_mm, k.T, lower=True)**2, axis=0)
+        s = np.sum(solve_triangular(self.chol_a, k.T, lower=True)**2, axis=0)
+        return mean + k @ self.alpha, prior - q + s
+
+    def _support(self):
+        return self.x if self.inducing is None else self.inducing
+
+    def predict(self, x):
+        '''Posterior mean and variance (n x 1 each, as GPy) at the points x (n x d), chunk_size points at a time.'''
+        x = np.asarray(x, dtype=np.float64)
+        mean, var = np.empty(len(x)), np.empty(len(x))
+        for start in range(0, len(x), self.chunk_size):
+            chunk = x[start:start+self.chunk_size]
+            prior = np.ravel(self.mean(chunk)) if self.mean else 0.0
+            mean[start:start+len(chunk)], var[start:start+len(chunk)] = self._posterior(self.kern(chunk, self._support()), self.variance, prior)
+        return mean[:, None], var[:, None]
+
+    def integrate(self, lb, ub):
+        '''
+        Integrals of the GP posterior over the boxes [lb, ub] (k x d each; a dimension with lb == ub is not integrated, e.g. a fixed length),
+        chunk_size boxes at a time.
+        Returns the integral means and variances (k each).
+        '''
+        lb, ub = np.atleast_2d(lb).astype(np.float64), np.atleast_2d(ub).astype(np.float64)
+        mean, var = np.empty(len(lb)), np.empty(len(lb))
+        for start in range(0, len(lb), self.chunk_size):
+            l, u = lb[start:start+self.chunk_size], ub[start:start+self.chunk_size]
+            z, double = _box_factors(self._support(), l, u, self.lengthscales)
+            prior = self.mean_integral(l, u) if self.mean_integral else 0.0
+            mean[start:start+len(l)], var[start:start+len(l)] = self._posterior(self.variance * z, self.variance * double, prior)
+        return mean, var
+
+    def profiles(self, lendata, comdata):
+        '''
+        Free-energy profiles of all the lengths: integrals over COM from comdata[0] to each COM value, at each fixed length.
+        Returns the free energies and their variances (n_lengths x n_coms each).
+        '''
+        lendata, comdata = np.ravel(lendata).astype(np.float64), np.ravel(comdata).astype(np.float64)
+        lengths = np.repeat(lendata, comdata.size - 1)
+        lb = np.column_stack([lengths, np.full(lengths.shape, comdata[0])])
+        ub = np.column_stack([lengths, np.tile(comdata[1:], lendata.size)])
+        mean, var = self.integrate(lb, ub)
+
+        # the profiles start at 0 at the first COM value
+        shape = (lendata.size, comdata.size - 1)
+        gibbs = np.hstack([np.zeros((lendata.size, 1)), mean.reshape(shape)])
+        gibbs_var = np.hstack([np.zeros((lendata.size, 1)), np.maximum(var, 0.0).reshape(shape)])
+        return gibbs, gibbs_var
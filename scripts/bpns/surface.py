@@ -0,0 +1,117 @@
+# Evaluation of the 2D (plastic length, COM separation) model on dense grids.
+# The grid points are built with array operations (no Python loops) and the posterior mean and variance are predicted in chunks of a fixed number of points,
+# so the memory needed does not depend on how fine the grid is (the kernel matrix between a chunk and the training points is the largest array).
+# The free-energy surface is integrated from the predicted forces along the COM axis with the closed-form quadrature of bpns.quadrature, all lengths at once.
+# The result is saved to a .npz file which the plots and animations in quadrature.ipynb can load without running the GP predictions again.
+# The mean function of the model (fitted in get_force.ipynb) is defined here in vectorised form; its GPy wrapper is in bpns.meanfunc.
+
+import numpy as np
+
+from bpns.quadrature import RBFQuadrature
+
+
+def slope_mean(X, top=3.5, height=25, curvature=6, cutoff=5):
+    '''
+    Mean function of the 2D model: -curvature*(com-top)**2 + height below com = cutoff, 0 above.
+    - X: points (n x 2), columns: plastic length, COM separation
+    Returns the mean at the points (n x 1).
+    '''
+    com = np.asarray(X)[:, 1:2]
+    return np.where(com < cutoff, height - curvature*(com - top)**2, 0.0)
+
+
+def slope_mean_integral(lb, ub, top=3.5, height=25, curvature=6, cutoff=5):
+    '''
+    Integrals of slope_mean over boxes (bpns.quadrature.ProductRBFQuadrature): the COM separation is integrated from lb to ub,
+    the length is integrated as well if lb and ub differ (the mean does not depend on it).
+    - lb, ub: lower and upper corners of the boxes (k x 2), columns: plastic length, COM separation
+    Returns the integrals (k).
+    '''
+    lb, ub = np.atleast_2d(lb), np.atleast_2d(ub)
+    def antiderivative(com):
+        com = np.minimum(com, cutoff)
+        return height*com - curvature*(com - top)**3/3
+    width = np.where(ub[:, 0] > lb[:, 0], ub[:, 0] - lb[:, 0], 1.0)
+    return (antiderivative(ub[:, 1]) - antiderivative(lb[:, 1])) * width
+
+
+def slope_mean_gradient(X, top=3.5, height=25, curvature=6, cutoff=5):
+    '''Gradient of slope_mean with respect to the points (n x 2); the mean does not depend on the plastic length.'''
+    X = np.asarray(X)
+    grad = np.zeros(X.shape)
+    com = X[:, 1]
+    grad[:, 1] = np.where(com < cutoff, -2*curvature*(com - top), 0.0)
+    return grad
+
+
+def grid_points(lendata, comdata):
+    '''
+    Points of the (length, COM) grid in the format used by the GP models (n x 2), lengths changing slowest.
+    Row i*len(comdata) + j is (lendata[i], comdata[j]), so reshaping a prediction to (len(lendata), len(comdata)) gives the grid,
+    in the same layout as np.meshgrid(comdata, lendata).
+    '''
+    comgrid, lengrid = np.meshgrid(comdata, lendata)
+    return np.column_stack([lengrid.ravel(), comgrid.ravel()])
+
+
+def predict_chunked(predict, points, chunk_size=20000):
+    '''
+    Posterior mean and variance at many points, predicted chunk_size points at a time.
+    - predict: function returning the mean and variance (n x 1 each) at the given points, e.g. emukit_model.predict or gpy_model.predict
+    - points: n x 2 array
+    Returns the mean and variance as 1D arrays (n).
+    '''
+    n = len(points)
+    mean = np.empty(n)
+    var = np.empty(n)
+    for start in range(0, n, chunk_size):
+        mu, v = predict(points[start:start+chunk_size])
+        mean[start:start+chunk_size] = np.ravel(mu)
+        var[start:start+chunk_size] = np.ravel(v)
+    return mean, var
+
+
+def integrate_surface(comdata, forces, lengthscale=0.5, variance=1.0, noise=1.0):
+    '''
+    Free energies along the COM axis for every plastic length, by Bayesian quadrature of the predicted forces.
+    - comdata: COM values of the grid (m), the integrals start at comdata[0] and end at each of the values
+    - forces: forces on the grid (n_lengths x m)
+    Returns the free energies and their variances (n_lengths x m and m; the variance is the same for all lengths).
+    '''
+    comdata = np.asarray(comdata, dtype=np.float64)
+    model = RBFQuadrature(comdata, np.asarray(forces).T, lengthscale=lengthscale, variance=variance, noise=noise)
+    mean, var = model.integrate(np.full(comdata.size - 1, comdata[0]), comdata[1:])
+    gibbs = np.concatenate([np.zeros((1, mean.shape[1])), mean]).T
+    return gibbs, np.concatenate([[0.0], var])
+
+
+def evaluate_surface(predict, lendata, comdata, chunk_size=20000, output=None, **quadrature):
+    '''
+    Predicts the forces of the 2D model on the (lendata x comdata) grid and integrates them to free energies.
+    - predict: prediction function of the fitted model (see predict_chunked)
+    - lendata, comdata: grid values of the plastic length and the COM separation
+    - chunk_size: number of points predicted at a time
+    - output: if given, the surface is saved to this .npz file (see load_surface)
+    - quadrature: hyperparameters passed to integrate_surface
+    Returns a dictionary with the grid values, the forces and their variances, and the free energies and their variances (arrays n_lengths x n_coms).
+    '''
+    lendata = np.asarray(lendata, dtype=np.float64)
+    comdata = np.asarray(comdata, dtype=np.float64)
+    shape = (lendata.size, comdata.size)
+
+    mean, var = predict_chunked(predict, grid_points(lendata, comdata), chunk_size)
+    gibbs, gibbs_var = integrate_surface(comdata, mean.reshape(shape), **quadrature)
+
+    surface = {'lendata': lendata, 'comdata': comdata, 'forces': mean.reshape(shape), 'forces_var': var.reshape(shape),
+               'gibbs': gibbs, 'gibbs_var': np.broadcast_to(gibbs_var, shape).copy()}
+    if output is not None:
+        np.savez(output, **surface)
+    return surface
+
+
+def load_surface(path):
+    '''Loads a surface saved by evaluate_surface; also returns the meshgrids (comgrid, lengrid) used by the plots.'''
+    with np.load(path) as data:
+        surface = {key: data[key] for key in data.files}
+    surface['comgrid'], surface['lengrid'] = np.meshgrid(surface['comdata'], surface['lendata'])
+    return surface
@@ -0,0 +1,268 @@
+# Surrogate model for the optimiser which stays fast as the number of sampled points grows.
+# It can be used in optimize.py instead of the skopt Optimizer (same ask/tell/Xi/yi/copy interface); like the skopt Optimizer, its state is not saved but rebuilt from the results catalogue (results.db) at every start:
+# - Gaussian process with a Matern 5/2 kernel (one lengthscale per dimension) on inputs scaled to [0, 1], as skopt's "gp" estimator
+# - the kernel hyperparameters are re-optimised only every refit_every points, starting from the previous values (warm start)
+# - in between, new points are added to the Cholesky factor of the kernel matrix incrementally (O(n^2) instead of a new O(n^3) factorisation)
+# - above max_exact points, the GP switches to an inducing-point approximation (DTC) with n_inducing points, whose cost per added point does not depend on n;
+#   the hyperparameters are then fitted on a random subset of max_exact points
+# - the acquisition function (EI or LCB) is evaluated on a fixed grid of candidates over (length, COM) with array operations, instead of L-BFGS restarts;
+#   EI is computed on the normalised targets and the candidates at points which were already told are never selected again
+# - the noise variance of the normalised targets is bounded by max_noise: with noisy forces, the most likely GP is otherwise almost flat with
+#   a large noise, and EI reduces to the largest standard deviation, i.e. the corners of the space
+# Batches of points are selected with the constant liar strategy, like skopt (see ask).
+# With a cost model (the cost attribute, e.g. bpns.costs.CostModel), EI is divided by the cost of each candidate, so points are chosen by expected improvement per GPU-hour.
+
+import copy
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, cholesky, solve_triangular
+from scipy.optimize import minimize
+from scipy.stats import norm
+
+
+def matern52(x1, x2, lengthscales, variance):
+    '''Matern 5/2 kernel matrix between the (scaled) points x1 (n x d) and x2 (m x d).'''
+    a = x1 / lengthscales
+    b = x2 / lengthscales
+    sq = np.sum(a**2, axis=1)[:, None] + np.sum(b**2, axis=1)[None, :] - 2 * a @ b.T
+    r = np.sqrt(5 * np.maximum(sq, 0))
+    return variance * (1 + r + r**2 / 3) * np.exp(-r)
+
+
+def farthest_points(x, n, rng):
+    '''Chooses n of the points x spread over the space (greedy farthest-point selection), used as inducing points.'''
+    chosen = [rng.randint(len(x))]
+    dist = np.sum((x - x[chosen[0]])**2, axis=1)
+    for _ in range(n - 1):
+        chosen.append(int(np.argmax(dist)))
+        dist = np.minimum(dist, np.sum((x - x[chosen[-1]])**2, axis=1))
+    return x[chosen]
+
+
+class GP:
+    '''
+    Zero-mean GP with fixed hyperparameters on normalised data, exact or with inducing points.
+    - theta: log of (lengthscale_1, ..., lengthscale_d, signal variance, noise variance)
+    - inducing: inducing points (m x d), or None for the exact GP
+    '''
+
+    jitter = 1e-8
+
+    def __init__(self, theta, x, y, inducing=None):
+        self.theta = np.asarray(theta, dtype=np.float64)
+        self.lengthscales = np.exp(self.theta[:-2])
+        self.variance, self.noise = np.exp(self.theta[-2:])
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.inducing = inducing
+
+        if inducing is None:
+            self.chol = cholesky(self.kern(self.x, self.x) + (self.noise + self.jitter) * np.eye(len(self.x)), lower=True)
+        else:
+            # DTC: A = K_mm + K_mn K_nm / noise and b = K_mn y / noise, both can be extended point by point
+            self.chol_mm = cho_factor(self.kern(inducing, inducing) + self.jitter * self.variance * np.eye(len(inducing)), lower=True)
+            k_mn = self.kern(inducing, self.x)
+            self.a = self.kern(inducing, inducing) + k_mn @ k_mn.T / self.noise
+            self.b = k_mn @ self.y / self.noise
+        self._solve()
+
+    def kern(self, x1, x2):
+        return matern52(x1, x2, self.lengthscales, self.variance)
+
+    def _solve(self):
+        if self.inducing is None:
+            self.alpha = cho_solve((self.chol, True), self.y)
+        else:
+            self.chol_a = cho_factor(self.a + self.jitter * self.variance * np.eye(len(self.a)), lower=True)
+            self.alpha = cho_solve(self.chol_a, self.b)
+
+    def add(self, x, y):
+        '''Adds points without changing the hyperparameters.'''
+        x = np.atleast_2d(x)
+        if self.inducing is None:
+            # extend the Cholesky factor: [[L, 0], [L21, L22]] with L21 = (L^-1 K_on)^T and L22 = chol(K_nn - L21 L21^T)
+            l21 = solve_triangular(self.chol, self.kern(self.x, x), lower=True).T
+            l22 = cholesky(self.kern(x, x) + (self.noise + self.jitter) * np.eye(len(x)) - l21 @ l21.T, lower=True)
+            n, m = len(self.x), len(x)
+            chol = np.zeros((n + m, n + m))
+            chol[:n, :n] = self.chol
+            chol[n:, :n] = l21
+            chol[n:, n:] = l22
+            self.chol = chol
+        else:
+            k_mn = self.kern(self.inducing, x)
+            self.a += k_mn @ k_mn.T / self.noise
+            self.b += k_mn @ np.asarray(y, dtype=np.float64) / self.noise
+        self.x = np.vstack([self.x, x])
+        self.y = np.concatenate([self.y, y])
+        self._solve()
+
+    def predict(self, x):
+        '''Posterior mean and variance of the latent function at the points x (normalised units).'''
+        if self.inducing is None:
+            k = self.kern(x, self.x)
+            v = solve_triangular(self.chol, k.T, lower=True)
+            return k @ self.alpha, np.maximum(self.variance - np.sum(v**2, axis=0), 1e-12)
+        k = self.kern(x, self.inducing)
+        q = np.sum(k * cho_solve(self.chol_mm, k.T).T, axis=1)
+        s = np.sum(k * cho_solve(self.chol_a, k.T).T, axis=1)
+        return k @ self.alpha, np.maximum(self.variance - q + s, 1e-12)
+
+
+def neg_log_likelihood(theta, x, y):
+    '''Negative log marginal likelihood of the exact GP with hyperparameters theta.'''
+    try:
+        gp = GP(theta, x, y)
+    except np.linalg.LinAlgError:
+        return 1e10
+    return 0.5 * y @ gp.alpha + np.sum(np.log(np.diag(gp.chol))) + 0.5 * len(y) * np.log(2 * np.pi)
+
+
+class Surrogate:
+    '''
+    Bayesian optimiser with the interface of skopt.Optimizer used by optimize.py (ask, tell, Xi, yi, copy, rng).
+    - bounds: (low, high) of each dimension, e.g. [(0, 40), (2.1, 5.6)]
+    - integer: which dimensions are integers, e.g. [True, False]
+    - grid_step: spacing of the candidate grid in the real dimensions (integer dimensions use all integers)
+    - acq_func: "EI" (expected improvement, minimisation) or "LCB" (lower confidence bound)
+    - xi, kappa: parameters of EI (in units of the standard deviation of y, unlike skopt) and LCB
+    - max_noise: upper bound of the fitted noise variance, relative to the variance of y
+    - max_exact: above this number of points, the inducing-point approximation is used
+    - n_inducing: number of inducing points
+    - refit_every: number of added points after which the hyperparameters are re-optimised
+    - random_state: seed (for the inducing points and the subsets used for fitting)
+    '''
+
+    def __init__(self, bounds, integer=None, grid_step=0.01, acq_func='EI', xi=0.01, kappa=1.96,
+                 max_noise=0.1, max_exact=300, n_inducing=150, refit_every=5, random_state=None):
+        self.bounds = np.array(bounds, dtype=np.float64)
+        self.integer = list(integer) if integer is not None else [False]*len(bounds)
+        self.grid_step = grid_step
+        self.acq_func = acq_func
+        self.xi = xi
+        self.kappa = kappa
+        self.max_noise = max_noise
+        self.max_exact = max_exact
+        self.n_inducing = n_inducing
+        self.refit_every = refit_every
+        self.rng = np.random.RandomState(random_state)
+
+        self.Xi = []
+        self.yi = []
+        self.theta = np.log(np.r_[np.full(len(bounds), 0.3), 1.0, 0.1])
+        self.model = None
+        self.n_fit = 0
+        self.cost = None
+        self.candidates = self._grid()
+
+    def _grid(self):
+        self.axes = []
+        for (low, high), is_int in zip(self.bounds, self.integer):
+            if is_int:
+                self.axes.append(np.arange(int(low), int(high) + 1, dtype=np.float64))
+            else:
+                self.axes.append(np.round(np.linspace(low, high, int(round((high - low) / self.grid_step)) + 1), 10))
+        return np.stack(np.meshgrid(*self.axes, indexing='ij'), axis=-1).reshape(-1, len(self.axes))
+
+    def _grid_index(self, x):
+        # index of the candidate closest to each point x (points off the grid are rounded to the nearest grid point)
+        x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+        index = [np.clip(np.rint((x[:, d] - low) / (high - low) * (len(axis) - 1)), 0, len(axis) - 1).astype(int)
+                 for d, ((low, high), axis) in enumerate(zip(self.bounds, self.axes))]
+        return np.ravel_multi_index(index, [len(axis) for axis in self.axes])
+
+    def _scale(self, x):
+        return (np.asarray(x, dtype=np.float64) - self.bounds[:, 0]) / (self.bounds[:, 1] - self.bounds[:, 0])
+
+    def _fit(self):
+        # y is normalised with the statistics of the points known at this fit, kept fixed until the next one
+        x = self._scale(self.Xi)
+        y = np.asarray(self.yi, dtype=np.float64)
+        self.y_mean, self.y_std = y.mean(), (y.std() or 1.0)
+        y = (y - self.y_mean) / self.y_std
+
+        # hyperparameters warm-started from the previous fit, on a subset if there are many points
+        subset = np.arange(len(y))
+        if len(y) > self.max_exact:
+            subset = self.rng.choice(len(y), self.max_exact, replace=False)
+        log_bounds = [(np.log(0.01), np.log(100.0))]*(len(self.theta) - 2) + [(np.log(0.01), np.log(100.0)), (np.log(1e-6), np.log(self.max_noise))]
+        res = minimize(neg_log_likelihood, self.theta, args=(x[subset], y[subset]), method='L-BFGS-B', bounds=log_bounds, options={'maxiter': 100})
+        if np.isfinite(res.fun):
+            self.theta = res.x
+
+        inducing = None
+        if len(y) > self.max_exact:
+            inducing = farthest_points(x, min(self.n_inducing, len(y)), self.rng)
+        self.model = GP(self.theta, x, y, inducing)
+        self.n_fit = len(y)
+
+    def _add(self, x, y, refit=True):
+        self.Xi += [list(p) for p in x]
+        self.yi += list(y)
+        if self.model is None or (refit and len(self.yi) - self.n_fit >= self.refit_every):
+            self._fit()
+        else:
+            self.model.add(self._scale(x), (np.asarray(y, dtype=np.float64) - self.y_mean) / self.y_std)
+
+    def tell(self, x, y):
+        '''Adds one point (x a list of coordinates, y a number) or several (lists of both).'''
+        if np.ndim(y) == 0:
+            x, y = [x], [y]
+        self._add(x, y)
+
+    def predict(self, x):
+        '''Posterior mean and standard deviation at the points x, in the units of y.'''
+        mean, var = self.model.predict(self._scale(np.atleast_2d(x)))
+        return mean * self.y_std + self.y_mean, np.sqrt(var) * self.y_std
+
+    def acquisition(self, x):
+        '''Acquisition values at the points x, larger is better (log of EI, or log of EI per unit cost with a cost model, or minus LCB).'''
+        if self.acq_func == 'LCB':
+            mean, std = self.predict(x)
+            return -(mean - self.kappa * std)
+        # log EI on the normalised targets (xi in units of the standard deviation of yi),
+        # with the asymptotic form for very negative z so that large xi still ranks the points
+        mean, var = self.model.predict(self._scale(np.atleast_2d(x)))
+        std = np.sqrt(var)
+        z = ((np.min(self.yi) - self.y_mean) / self.y_std - self.xi - mean) / std
+        log_h = np.empty_like(z)
+        tail = z < -5
+        log_h[~tail] = np.log(np.maximum(z[~tail] * norm.cdf(z[~tail]) + norm.pdf(z[~tail]), 1e-300))
+        log_h[tail] = norm.logpdf(z[tail]) - 2 * np.log(-z[tail]) + np.log1p(-3 / z[tail]**2)
+        if self.cost is not None:
+            return np.log(std) + log_h - np.log(self.cost(x))
+        return np.log(std) + log_h
+
+    def _best(self):
+        # the candidates at the points already told (evaluated, running or lies of the current batch) are never selected again
+        acq = self.acquisition(self.candidates)
+        acq[self._grid_index(self.Xi)] = -np.inf
+        if np.all(np.isneginf(acq)):
+            raise ValueError('All the candidates of the grid have been evaluated')
+        best = int(np.argmax(acq))
+        return best, [int(v) if is_int else float(v) for v, is_int in zip(self.candidates[best], self.integer)]
+
+    def ask(self, n_points=None, strategy='cl_min'):
+        '''
+        Returns the next point to sample (n_points=None) or a list of n_points points.
+        For a batch, each selected point is told to a copy of the model with a "lie" value (min, mean or max of yi) before the next one is selected;
+        the lies are added incrementally, without refitting the hyperparameters.
+        '''
+        if n_points is None:
+            return self._best()[1]
+        lie = {'cl_min': np.min, 'cl_mean': np.mean, 'cl_max': np.max}[strategy](self.yi)
+        opt = self.copy()
+        points = []
+        for _ in range(n_points):
+            x = opt._best()[1]
+            points.append(x)
+            opt._add([x], [lie], refit=False)
+            # the preparation of a new length is shared by the next points at that length
+            if opt.cost is not None:
+                opt.cost.update(x)
+        return points
+
+    def copy(self, random_state=None):
+        opt = copy.deepcopy(self)
+        if random_state is not None:
+            opt.rng = np.random.RandomState(random_state)
+        return opt
@@ -0,0 +1,207 @@
+# Synthetic simulation backend: stands in for gen.sh, put_together.py, prep_prot_pl.sh, prep_pull.sh and prep_umb.sh,
+# so that the optimiser loop (scripts/optimize.py with backend = 'synthetic') can be run end to end without GROMACS, e.g. to load test
+# hundreds of iterations and concurrent dispatch on a laptop:
+# - every stage waits for an artificial latency (seconds, with a random jitter) and writes the outputs declared by the optimiser's tasks
+# - the umbrella stage writes a COLVAR file with the same columns as PLUMED, with the CV fluctuating around the position where the restraint
+#   balances an analytic mean force: the mean function of the 2D model (bpns.surface.slope_mean) scaled down with the plastic length,
+#   plus autocorrelated (AR(1)) noise; get_force.py extracts the force from it as from a real run
+# - the settings (latencies, noise, force constant, number of steps...) are the defaults below, updated from a JSON file given with --config
+# - the noise of a window depends only on the seed, the length and the COM separation, so rerunning a point gives the same COLVAR
+# Usage:
+# python3 -m bpns.synthetic init synthetic.json
+# python3 -m bpns.synthetic --config synthetic.json gen -p ps -l 10
+# python3 -m bpns.synthetic --config ../../synthetic.json umbrella -l 10 3.35 [seed]
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import time
+import numpy as np
+from scipy.signal import lfilter
+
+from bpns.surface import slope_mean
+
+colvar_fields = ['time', 'd1', 'steer.bias', 'steer.force2', 'steer.d1_cntr', 'steer.d1_work', 'steer.d1_kappa']
+
+# the default settings, overridden by the --config file
+defaults = {
+    'seed': 0,
+    # latency of each stage (s), multiplied by a random factor in [1 - jitter, 1 + jitter]
+    'latency': {'gen': 5.0, 'place': 0.5, 'equil': 2.0, 'pull': 1.0, 'umbrella': 2.0},
+    'jitter': 0.2,
+    # probability that an umbrella window fails (exit code 1, no COLVAR), to test the handling of failed points
+    'fail_rate': 0.0,
+    # umbrella windows: printed steps (1 ps each, get_force.py uses 35-50 ns), force constant (kcal/mol/nm2, as in plumed.dat),
+    # fluctuation (nm) and correlation time (printed steps) of the CV, pulling velocity (nm/ns) from the starting COM separation
+    'n_steps': 50000,
+    'kappa': 500.0,
+    'sigma': 0.03,
+    'tau': 100,
+    'vel': 0.35,
+    'start': 1.6,
+    # mean force: slope_mean(com) * (1 - length / length_scale)
+    'length_scale': 80.0,
+}
+
+
+def load_config(path=None):
+    '''The default settings, updated from the JSON file path (if given); the latencies are updated stage by stage.'''
+    config = json.loads(json.dumps(defaults))
+    if path:
+        with open(path) as f:
+            user = json.load(f)
+        config['latency'].update(user.pop('latency', {}))
+        config.update(user)
+    return config
+
+
+def ar1(n, sigma, tau, rng):
+    '''Autocorrelated noise (AR(1) process) with standard deviation sigma and correlation time tau (in samples).'''
+    phi = np.exp(-1.0 / tau)
+    eps = rng.normal(0, sigma * np.sqrt(1 - phi**2), n)
+    eps[0] = rng.normal(0, sigma)
+    # x_i = phi x_(i-1) + eps_i as a linear filter, without a Python loop over the samples
+    return lfilter([1.0], [1.0, -phi], eps)
+
+
+def write_colvar(path, center, n_steps=75000, stride=1, kappa=5000.0, sigma=0.02, tau=50, pull_steps=5000, start=1.6, force=0.0, offset=0.5, rng=None):
+    '''
+    Writes a COLVAR file of one umbrella window: pulling from start to center, then sampling around the centre.
+    - n_steps: number of printed steps
+    - stride: time between printed steps (ps)
+    - kappa: force constant of the restraint (energy/nm2)
+    - sigma, tau: fluctuation (nm) and correlation time (printed steps) of the CV around the centre
+    - force: mean force acting on the CV, the CV is shifted by -force/kappa so that the restraint balances it
+    - offset: additional shift of the CV below the centre, in units of sigma
+    '''
+    rng = rng or np.random.default_rng(0)
+    time = np.arange(n_steps) * float(stride)
+    pull = min(pull_steps, n_steps)
+    cntr = np.full(n_steps, float(center))
+    cntr[:pull] = np.linspace(start, center, pull)
+    d1 = cntr + ar1(n_steps, sigma, tau, rng) - offset * sigma - force / kappa
+    bias = 0.5 * kappa * (d1 - cntr)**2
+    work = np.concatenate([[0.0], np.cumsum(-kappa * (d1[1:] - cntr[1:]) * np.diff(cntr))])
+    data = np.column_stack([time, d1, bias, 2 * bias, cntr, work, np.full(n_steps, kappa)])
+    with open(path, 'w') as f:
+        f.write('#! FIELDS ' + ' '.join(colvar_fields) + '\n')
+        np.savetxt(f, data, fmt='%.6f')
+
+
+def mean_force(length, com, config=defaults):
+    '''Analytic mean force at (length, COM separation): the mean function of the 2D model, scaled down with the plastic length.'''
+    return float(slope_mean(np.array([[length, com]]))[0, 0]) * (1 - length / config['length_scale'])
+
+
+def _wait(stage, config):
+    # artificial latency of a stage
+    jitter = config['jitter']
+    time.sleep(max(config['latency'].get(stage, 0.0) * random.uniform(1 - jitter, 1 + jitter), 0.0))
+
+
+def _touch(path, text=''):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def gen(plast, length, folder='.', config=defaults):
+    '''
+    Stands in for gen.sh: creates the folders of a length (ps10/plastic/md, ps10/prot_pl/md, ps10/prot_pl/plumed) with the plastic structure,
+    and copies get_force.py to the plumed folder (the forces are extracted from the synthetic COLVAR files by the real script).
+    '''
+    _wait('gen', config)
+    base = os.path.join(folder, f"{plast}{length}")
+    _touch(os.path.join(base, 'plastic', 'md', 'plastic.pdb'), f"REMARK    synthetic plastic, length {length}\nEND\n")
+    os.makedirs(os.path.join(base, 'prot_pl', 'md'), exist_ok=True)
+    os.makedirs(os.path.join(base, 'prot_pl', 'plumed'), exist_ok=True)
+    scripts = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    shutil.copy(os.path.join(scripts, 'prot_plastic', 'get_force.py'), os.path.join(base, 'prot_pl', 'plumed'))
+    return base
+
+
+def place(folder='.', config=defaults):
+    '''Stands in for put_together.py: writes conf.pdb in the protein-plastic folder.'''
+    _wait('place', config)
+    _touch(os.path.join(folder, 'conf.pdb'), 'REMARK    synthetic protein and plastic\nEND\n')
+
+
+def equil(folder='.', config=defaults):
+    '''Stands in for prep_prot_pl.sh: writes (empty) md/md.tpr and md/md.cpt in the protein-plastic folder.'''
+    _wait('equil', config)
+    for name in ('md.tpr', 'md.cpt'):
+        _touch(os.path.join(folder, 'md', name))
+
+
+def pull(folder='.', max_cv=6.6, frame_ps=10, config=defaults):
+    '''Stands in for prep_pull.sh: writes the frame index pull/frames.json of a pull from the starting COM separation to max_cv.'''
+    _wait('pull', config)
+    times = np.arange(0, (max_cv - config['start']) / config['vel'] * 1000 + 1e-6, frame_ps)
+    centre = config['start'] + times * config['vel'] / 1000
+    index = {'time': times.tolist(), 'com': centre.tolist(), 'centre': centre.tolist()}
+    os.makedirs(os.path.join(folder, 'pull'), exist_ok=True)
+    with open(os.path.join(folder, 'pull', 'frames.json'), 'w') as f:
+        json.dump(index, f)
+    return index
+
+
+def umbrella(length, com, folder='.', seed=False, config=defaults):
+    '''
+    Stands in for prep_umb.sh: writes {com}/COLVAR and {com}/params.log in the plumed folder.
+    The window is pulled from the starting COM separation at the pulling velocity, or (seed) starts at its centre like the windows seeded from a pull.
+    Raises RuntimeError for a simulated failure (see fail_rate).
+    '''
+    _wait('umbrella', config)
+    rng = np.random.default_rng([config['seed'], int(length), int(round(float(com) * 100))])
+    if rng.uniform() < config['fail_rate']:
+        raise RuntimeError(f"synthetic failure of the window {com} (length {length})")
+    out = os.path.join(folder, str(com))
+    os.makedirs(out, exist_ok=True)
+    time_ns = 0.0 if seed else (float(com) - config['start']) / config['vel']
+    with open(os.path.join(out, 'params.log'), 'w') as f:
+        f.write(f"distance to pull: {0.0 if seed else float(com) - config['start']:.3f}\ntime in ns: {time_ns:.3f}\n")
+    write_colvar(os.path.join(out, 'COLVAR'), float(com), n_steps=config['n_steps'], kappa=config['kappa'], sigma=config['sigma'],
+                 tau=config['tau'], pull_steps=int(round(time_ns * 1000)), start=config['start'], force=mean_force(length, float(com), config), offset=0.0, rng=rng)
+    return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic simulation backend for testing the optimiser loop without GROMACS.')
+    parser.add_argument('--config', help='JSON file with the settings overriding the defaults')
+    sub = parser.add_subparsers(dest='command', required=True)
+    init_parser = sub.add_parser('init', help='write the default settings to a JSON file')
+    init_parser.add_argument('path')
+    gen_parser = sub.add_parser('gen', help='stand-in for gen.sh (run in the campaign folder)')
+    gen_parser.add_argument('-p', '--plast', default='ps')
+    gen_parser.add_argument('-l', '--length', type=int, required=True)
+    sub.add_parser('place', help='stand-in for put_together.py (run in the protein-plastic folder)')
+    sub.add_parser('equil', help='stand-in for prep_prot_pl.sh (run in the protein-plastic folder)')
+    pull_parser = sub.add_parser('pull', help='stand-in for prep_pull.sh (run in the plumed folder)')
+    pull_parser.add_argument('--max-cv', type=float, default=6.6)
+    umb_parser = sub.add_parser('umbrella', help='stand-in for prep_umb.sh (run in the plumed folder)')
+    umb_parser.add_argument('com')
+    umb_parser.add_argument('mode', nargs='?', choices=['seed'], help='seed the window from the pull')
+    umb_parser.add_argument('-l', '--length', type=int, required=True)
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        with open(args.path, 'w') as f:
+            json.dump(defaults, f, indent=2)
+        sys.exit()
+    config = load_config(args.config)
+    if args.command == 'gen':
+        gen(args.plast, args.length, config=config)
+    elif args.command == 'place':
+        place(config=config)
+    elif args.command == 'equil':
+        equil(config=config)
+    elif args.command == 'pull':
+        pull(max_cv=args.max_cv, config=config)
+    else:
+        try:
+            umbrella(args.length, args.com, seed=args.mode == 'seed', config=config)
+        except RuntimeError as err:
+            sys.exit(str(err))
@@ -0,0 +1,201 @@
+# Timing and resource telemetry of the pipeline tasks of an optimiser campaign.
+# Each finished (or failed) task appends one JSON line to telemetry.jsonl in the campaign folder, with:
+# - the stage and the point (plastic length, COM separation) it belongs to
+# - wall time, CPU time of the task process and its children (from os.wait4, see bpns.pipeline), GPUs and GPU-hours;
+#   the CPU time only covers local processes: with the SLURM executor the work runs in job steps started by slurmstepd, not as children
+#   of the task process, so it is close to 0 (the CPU time of the steps is in the SLURM accounting, sacct -j <job> --format=JobName,TotalCPU)
+# - ns/day of every GROMACS run of the task, parsed from the mdrun logs written during the task
+# - bytes written (files created or modified during the task in the folders it writes to)
+# The file is only ever appended to, so it keeps the whole history of a campaign, including restarted tasks.
+# A summary of a campaign (time per stage, critical path, throughput per GPU-hour) is printed with:
+# python3 -m bpns.telemetry summary <campaign folder>
+
+import argparse
+import json
+import os
+import re
+import socket
+import threading
+import numpy as np
+
+# names of the pipeline stages in the reports
+stage_labels = {'gen': 'build', 'place': 'place', 'equil': 'equilibrate', 'umbrella': 'umbrella', 'force': 'analysis'}
+
+performance_re = re.compile(r'^Performance:\s+([0-9.]+)', re.MULTILINE)
+
+
+def parse_point(name):
+    '''Plastic length and COM separation from a task name, e.g. umbrella/ps10/3.35 -> (10, 3.35); None where not given.'''
+    length = re.search(r'/ps(\d+)', name)
+    com = re.search(r'/ps\d+/([0-9.]+)$', name)
+    return int(length.group(1)) if length else None, float(com.group(1)) if com else None
+
+
+def changed_files(folders, since):
+    '''Files in the folders (recursively) modified after the time since; each file is given once, also if the folders are nested.'''
+    seen = set()
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                real = os.path.realpath(path)
+                if real in seen:
+                    continue
+                seen.add(real)
+                try:
+                    if os.path.getmtime(path) >= since:
+                        yield path
+                except OSError:
+                    continue
+
+
+def gromacs_performance(paths):
+    '''ns/day of the mdrun logs among the paths (the "Performance:" line), as a dictionary log file -> ns/day.'''
+    performance = {}
+    for path in paths:
+        if not path.endswith('.log'):
+            continue
+        try:
+            with open(path, errors='replace') as f:
+                match = performance_re.findall(f.read())
+        except OSError:
+            continue
+        if match:
+            performance[path] = float(match[-1])
+    return performance
+
+
+def pull_time(folder):
+    '''Pulling time (ns) of an umbrella window from its params.log (written by prep_umb.sh), or None.'''
+    try:
+        with open(os.path.join(folder, 'params.log')) as f:
+            match = re.search(r'time in ns:\s*([0-9.]+)', f.read())
+    except OSError:
+        return None
+    return float(match.group(1)) if match else None
+
+
+class Telemetry:
+    '''
+    Appends the records of finished tasks to a JSONL file.
+    - path: telemetry file, e.g. telemetry.jsonl in the campaign folder
+    '''
+
+    def __init__(self, path='telemetry.jsonl'):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+
+    def record(self, task, started, finished, cpu, code):
+        folders = [task.path(f) for f in task.scan]
+        changed = list(changed_files(folders, started))
+        length, com = parse_point(task.name)
+        wall = finished - started
+        entry = {'task': task.name, 'stage': task.stage, 'length': length, 'com': com, 'deps': task.deps,
+                 'ok': code == 0 and not task.missing_outputs(), 'exit_code': code, 'host': socket.gethostname(),
+                 'started': started, 'finished': finished, 'wall': wall, 'cpu': cpu,
+                 'gpus': task.gpus, 'gpu_hours': wall * task.gpus / 3600,
+                 'ns_per_day': {os.path.relpath(p, task.cwd): v for p, v in gromacs_performance(changed).items()},
+                 'bytes_written': int(sum(os.path.getsize(p) for p in changed if os.path.exists(p)))}
+
+        # the pulling at the start of an umbrella run, estimated from the pulling time and the simulation speed
+        if task.stage == 'umbrella' and entry['ns_per_day']:
+            pull_ns = pull_time(folders[0])
+            if pull_ns is not None:
+                entry['pull_wall'] = min(pull_ns / np.mean(list(entry['ns_per_day'].values())) * 86400, wall)
+
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+        return entry
+
+
+def load_records(path):
+    '''Reads all the records of a telemetry file (tasks which were run several times have several records).'''
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def critical_path(records):
+    '''
+    The chain of tasks which determined the end of the campaign: starting from the task which finished last, the dependency which finished last, and so on.
+    Returns a list of records, first task first.
+    '''
+    last = {}
+    for r in records:
+        if r['ok']:
+            last[r['task']] = r
+    if not last:
+        return []
+    path = [max(last.values(), key=lambda r: r['finished'])]
+    while True:
+        deps = [last[d] for d in path[-1]['deps'] if d in last]
+        if not deps:
+            break
+        path.append(max(deps, key=lambda r: r['finished']))
+    return path[::-1]
+
+
+def summary(records):
+    '''Text report of a campaign: time and resources per stage, critical path and throughput.'''
+    lines = []
+    stages = {}
+    for r in records:
+        stages.setdefault(r['stage'], []).append(r)
+
+    lines.append(f"{'stage':12s} {'runs':>5s} {'failed':>6s} {'wall h':>9s} {'median h':>9s} {'CPU h':>8s} {'GPU h':>8s} {'ns/day':>8s} {'GB written':>10s}")
+    for stage, rs in stages.items():
+        wall = np.array([r['wall'] for r in rs]) / 3600
+        perf = [v for r in rs for v in r['ns_per_day'].values()]
+        lines.append(f"{stage_labels.get(stage, stage):12s} {len(rs):5d} {sum(not r['ok'] for r in rs):6d} {wall.sum():9.2f} {np.median(wall):9.2f} "
+                     f"{sum(r['cpu'] for r in rs) / 3600:8.2f} {sum(r['gpu_hours'] for r in rs):8.2f} "
+                     f"{np.mean(perf) if perf else float('nan'):8.1f} {sum(r['bytes_written'] for r in rs) / 1e9:10.3f}")
+    pulls = [r['pull_wall'] for r in records if 'pull_wall' in r]
+    if pulls:
+        lines.append(f"pulling (part of umbrella): {sum(pulls) / 3600:.2f} h in {len(pulls)} runs")
+
+    # campaign throughput
+    span = (max(r['finished'] for r in records) - min(r['started'] for r in records)) / 3600
+    gpu_hours = sum(r['gpu_hours'] for r in records)
+    points = sum(r['ok'] for r in records if r['stage'] == 'force')
+    lines.append('')
+    lines.append(f"points evaluated: {points} in {span:.1f} h, {gpu_hours:.1f} GPU-h in total")
+    if gpu_hours > 0:
+        lines.append(f"throughput: {points / gpu_hours:.3f} points per GPU-hour, {gpu_hours / max(points, 1):.1f} GPU-h per point")
+    wasted = sum(r['gpu_hours'] for r in records if not r['ok'])
+    if wasted:
+        lines.append(f"GPU-hours of failed tasks: {wasted:.1f}")
+
+    # critical path, with the time spent waiting between the tasks (e.g. for free GPUs)
+    path = critical_path(records)
+    if path:
+        lines.append('')
+        lines.append('critical path:')
+        previous = None
+        for r in path:
+            wait = (r['started'] - previous['finished']) / 3600 if previous else 0.0
+            lines.append(f"  {r['task']:32s} {r['wall'] / 3600:8.2f} h" + (f"   (waited {wait:.2f} h)" if wait > 0.01 else ''))
+            previous = r
+        busy = sum(r['wall'] for r in path) / 3600
+        lines.append(f"  total {busy:.2f} h of work, {(path[-1]['finished'] - path[0]['started']) / 3600:.2f} h from start to end")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Telemetry of optimiser campaigns.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    summary_parser = sub.add_parser('summary', help='time per stage, critical path and throughput of a campaign')
+    summary_parser.add_argument('folder', nargs='?', default='.', help='campaign folder (with telemetry.jsonl)')
+    args = parser.parse_args()
+
+    path = args.folder if args.folder.endswith('.jsonl') else os.path.join(args.folder, 'telemetry.jsonl')
+    records = load_records(path)
+    if not records:
+        print(f"No records in {path}")
+    else:
+        print(summary(records))
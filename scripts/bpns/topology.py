@@ -0,0 +1,430 @@
+# Polymer topologies of any length assembled from residue templates, without running tleap and acpype for every length.
+# The templates are taken once from the tleap/acpype output (<name>_GMX.top and <name>_GMX.gro) of two short chains, one of each parity
+# (an even length ends with the carboxylated tail, an odd length with the standard tail, see sequence), e.g. lengths 6 and 7:
+# - the atoms of every residue (type, charge, mass), from the head, middle (standard and carboxylated) and tail residues
+# - every bonded interaction ([ bonds ], [ pairs ], [ angles ], [ dihedrals ]) with its parameters, keyed by the names of the consecutive residues it spans,
+#   so an interaction is copied to every place of the new chain where the same residues follow each other
+# - the coordinates: tleap builds the chain from the internal coordinates of the residues, so a standard + carboxylated pair repeats with one rigid
+#   transformation (rotation and translation), which is applied to the residues of the reference chain as many times as needed
+# The assembled <name>_GMX.top, <name>_GMX.gro and posre_<name>.itp have the layout of the acpype output, so gen.sh uses them in the same way.
+# check compares an assembled topology with the tleap/acpype output of the same length (atoms, the multiset of interactions and the coordinates).
+# Usage (see gen.sh -t):
+# python3 -m bpns.topology templates ref6 ref7 -o templates.json
+# python3 -m bpns.topology build templates.json -p ps -l 100 -o ps100
+# python3 -m bpns.topology check templates.json ps8
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import numpy as np
+
+# sections with the bonded interactions and the number of atoms of each entry
+interaction_atoms = {'bonds': 2, 'pairs': 2, 'angles': 3, 'dihedrals': 4}
+
+section_re = re.compile(r'^\s*\[\s*(\w+)\s*\]')
+
+# longest sequence of residues an interaction can span (a dihedral spans 3 residues when a residue has only 2 atoms on the path)
+max_span = 4
+
+
+def sequence(plast, length):
+    '''Residue names of a chain, as in gen.sh: standard head, carboxylated and standard residues alternating, and the tail that follows the last one.'''
+    if length < 2:
+        raise ValueError(f"The chain needs at least 2 residues, not {length}")
+    residues = [f"h{plast}".upper()]
+    residues += [f"{plast}c".upper() if i % 2 != 0 else plast.upper() for i in range(1, length - 1)]
+    if residues[-1] == plast.upper() or residues[-1] == f"h{plast}".upper():
+        residues.append(f"t{plast[1:2]}c".upper())
+    else:
+        residues.append(f"t{plast}".upper())
+    return residues
+
+
+def _data(line):
+    # fields of a topology line without its comment
+    return line.split(';', 1)[0].split()
+
+
+def read_top(path):
+    '''
+    Reads the topology of one molecule (acpype <name>_GMX.top or an .itp).
+    Returns a dictionary with:
+    - name, nrexcl: from [ moleculetype ]
+    - preamble: lines before [ moleculetype ] (e.g. [ defaults ] and [ atomtypes ])
+    - atoms: list of dictionaries (nr, type, resnr, resname, name, charge, mass)
+    - sections: the interaction sections in the order of the file, each with its header line, column comments and rows (atom numbers, rest of the line)
+    - footer: lines after the interactions (position restraint include, [ system ], [ molecules ])
+    '''
+    top = {'name': None, 'nrexcl': 3, 'preamble': [], 'atoms': [], 'sections': [], 'footer': []}
+    mode = 'preamble'
+    trailing = []
+    with open(path) as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        match = section_re.match(line)
+        if mode == 'footer':
+            top['footer'].append(line)
+            continue
+        if match:
+            name = match.group(1)
+            if name == 'moleculetype':
+                mode = 'moleculetype'
+            elif name == 'atoms':
+                mode = 'atoms'
+            elif name in interaction_atoms:
+                mode = name
+                top['sections'].append({'header': line.strip(), 'kind': name, 'comments': [], 'rows': []})
+                trailing = []
+            elif mode == 'preamble':
+                top['preamble'].append(line)
+            else:
+                mode = 'footer'
+                top['footer'] += trailing + [line]
+            continue
+        if mode == 'preamble':
+            top['preamble'].append(line)
+        elif line.lstrip().startswith('#') and mode != 'moleculetype':
+            mode = 'footer'
+            top['footer'] += trailing + [line]
+        elif not _data(line):
+            # column headers of a section, or comments before the footer
+            if line.strip() and mode in interaction_atoms:
+                if top['sections'][-1]['rows']:
+                    trailing.append(line)
+                else:
+                    top['sections'][-1]['comments'].append(line)
+        elif mode == 'moleculetype':
+            fields = _data(line)
+            top['name'], top['nrexcl'] = fields[0], int(fields[1])
+        elif mode == 'atoms':
+            fields = _data(line)
+            top['atoms'].append({'nr': int(fields[0]), 'type': fields[1], 'resnr': int(fields[2]), 'resname': fields[3], 'name': fields[4],
+                                 'charge': float(fields[6]), 'mass': float(fields[7])})
+        else:
+            n = interaction_atoms[mode]
+            fields = line.split()
+            rest = line.strip().split(None, n)[n] if len(fields) > n else ''
+            top['sections'][-1]['rows'].append((tuple(int(a) for a in fields[:n]), rest))
+    if top['name'] is None or not top['atoms']:
+        raise ValueError(f"{path} has no [ moleculetype ] or [ atoms ]")
+    return top
+
+
+def read_gro(path):
+    '''Atom names and coordinates (nm, n_atoms x 3) of a .gro file.'''
+    with open(path) as f:
+        lines = f.read().splitlines()
+    n = int(lines[1])
+    atoms = lines[2:2+n]
+    names = [l[10:15].strip() for l in atoms]
+    return names, np.array([[float(l[20:28]), float(l[28:36]), float(l[36:44])] for l in atoms])
+
+
+def _reference_files(folder):
+    # acpype output of one chain: the topology and the coordinates
+    tops = glob.glob(os.path.join(folder, '*_GMX.top'))
+    gros = glob.glob(os.path.join(folder, '*_GMX.gro'))
+    if len(tops) != 1 or len(gros) != 1:
+        raise FileNotFoundError(f"{folder} must contain one *_GMX.top and one *_GMX.gro (acpype output)")
+    return tops[0], gros[0]
+
+
+def residues_of(top):
+    '''Residue names of a topology, in the order of the chain.'''
+    names = {}
+    for atom in top['atoms']:
+        names.setdefault(atom['resnr'], atom['resname'])
+    return [names[r] for r in sorted(names)]
+
+
+def make_templates(folders, tol=1e-4):
+    '''
+    Residue templates from the tleap/acpype output of short chains (folders with <name>_GMX.top and <name>_GMX.gro).
+    Give at least one chain of each parity with 4 middle residues or more (e.g. lengths 6 and 7), so every residue and every sequence of
+    residues spanned by an interaction is there. Raises ValueError if a residue has different atoms or charges in the chains.
+    Returns a dictionary which can be saved as JSON.
+    '''
+    templates = {'name': None, 'nrexcl': None, 'preamble': None, 'footer': None, 'residues': {}, 'sections': [], 'sequences': [], 'references': []}
+    for folder in folders:
+        top_path, gro_path = _reference_files(folder)
+        top = read_top(top_path)
+        if templates['name'] is None:
+            templates.update(name=top['name'], nrexcl=top['nrexcl'], preamble=top['preamble'], footer=top['footer'],
+                             sections=[{'header': s['header'], 'kind': s['kind'], 'comments': s['comments'], 'windows': {}} for s in top['sections']])
+        elif [s['header'] for s in top['sections']] != [s['header'] for s in templates['sections']]:
+            raise ValueError(f"The sections of {top_path} differ from those of the first reference")
+
+        # atoms of each residue, in the order of the chain
+        first = {}
+        for atom in top['atoms']:
+            first.setdefault(atom['resnr'], atom['nr'])
+        residues = residues_of(top)
+        for resnr, resname in zip(sorted(first), residues):
+            atoms = [[a['name'], a['type'], a['charge'], a['mass']] for a in top['atoms'] if a['resnr'] == resnr]
+            known = templates['residues'].setdefault(resname, atoms)
+            if [a[:2] for a in known] != [a[:2] for a in atoms] or not np.allclose([a[2:] for a in known], [a[2:] for a in atoms], atol=tol):
+                raise ValueError(f"Residue {resname} differs between the references ({top_path}, residue {resnr})")
+
+        # interactions keyed by the residues they span; each atom as (residue offset in the window, atom name)
+        for section, template in zip(top['sections'], templates['sections']):
+            for atoms, rest in section['rows']:
+                resnrs = [top['atoms'][a-1]['resnr'] for a in atoms]
+                start = min(resnrs)
+                window = ' '.join(residues[start-1:max(resnrs)])
+                spec = [[r - start, top['atoms'][a-1]['name']] for a, r in zip(atoms, resnrs)]
+                entries = template['windows'].setdefault(window, [])
+                if [spec, rest] not in entries:
+                    entries.append([spec, rest])
+
+        # all the sequences of residues present in the references, to check that a new chain has no others
+        for size in range(1, max_span + 1):
+            for start in range(len(residues) - size + 1):
+                if ' '.join(residues[start:start+size]) not in templates['sequences']:
+                    templates['sequences'].append(' '.join(residues[start:start+size]))
+
+        names, coords = read_gro(gro_path)
+        if names != [a['name'] for a in top['atoms']]:
+            raise ValueError(f"The atoms of {gro_path} are not those of {top_path}")
+        templates['references'].append({'residues': residues, 'coords': np.round(coords, 4).tolist()})
+
+    if not {len(r['residues']) % 2 for r in templates['references']} == {0, 1}:
+        raise ValueError('The references need at least one chain of even and one of odd length')
+    return templates
+
+
+def _superpose(a, b):
+    # rotation and translation mapping the points a onto b (Kabsch)
+    ca, cb = a.mean(axis=0), b.mean(axis=0)
+    u, _, vt = np.linalg.svd((a - ca).T @ (b - cb))
+    d = np.sign(np.linalg.det(vt.T @ u.T))
+    rot = vt.T @ np.diag([1.0, 1.0, d]) @ u.T
+    return rot, cb - rot @ ca
+
+
+def chain_coordinates(templates, residues):
+    '''
+    Coordinates of a chain with the given residues, from the reference chain of the same parity: the head as it is, the middle residues and the tail
+    moved along the chain by the transformation which maps each standard + carboxylated pair of the reference onto the next pair.
+    '''
+    reference = [r for r in templates['references'] if len(r['residues']) % 2 == len(residues) % 2 and len(r['residues']) >= 6]
+    if not reference:
+        raise ValueError('No reference chain of this parity with at least 4 middle residues')
+    reference = reference[0]
+    sizes = [len(templates['residues'][r]) for r in reference['residues']]
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    coords = np.array(reference['coords'])
+    block = lambda i: coords[starts[i]:starts[i+1]]
+    rot, shift = _superpose(np.vstack([block(1), block(2)]), np.vstack([block(3), block(4)]))
+    inverse = (rot.T, -rot.T @ shift)
+
+    def moved(x, k):
+        r, t = (rot, shift) if k >= 0 else inverse
+        for _ in range(abs(k)):
+            x = x @ r.T + t
+        return x
+
+    n_ref = len(reference['residues'])
+    chain = []
+    for i, resname in enumerate(residues):
+        if i == 0:
+            j = 0
+        elif i == len(residues) - 1:
+            j = n_ref - 1
+        else:
+            j = 1 if i % 2 == 1 else 2
+        if reference['residues'][j] != resname:
+            raise ValueError(f"Residue {resname} at position {i} has no counterpart in the reference chain")
+        chain.append(moved(block(j), (i - j) // 2))
+    return np.vstack(chain)
+
+
+def assemble(templates, residues, name):
+    '''
+    Topology of a chain with the given residues (see sequence), by replicating the residue templates and their interactions.
+    Raises ValueError if a residue or a sequence of residues is not in the templates.
+    Returns a topology dictionary like read_top.
+    '''
+    atoms, index = [], []
+    for resnr, resname in enumerate(residues, start=1):
+        if resname not in templates['residues']:
+            raise ValueError(f"No template of residue {resname}")
+        index.append({})
+        for atom_name, atom_type, charge, mass in templates['residues'][resname]:
+            atoms.append({'nr': len(atoms) + 1, 'type': atom_type, 'resnr': resnr, 'resname': resname, 'name': atom_name, 'charge': charge, 'mass': mass})
+            index[-1][atom_name] = len(atoms)
+
+    # a sequence of residues which is not in the references could miss interactions
+    for size in range(1, max_span + 1):
+        for start in range(len(residues) - size + 1):
+            if ' '.join(residues[start:start+size]) not in templates['sequences']:
+                raise ValueError(f"The residues {' '.join(residues[start:start+size])} do not follow each other in the reference chains")
+
+    sections = []
+    for template in templates['sections']:
+        rows = []
+        for window, entries in template['windows'].items():
+            window = window.split()
+            for start in range(len(residues) - len(window) + 1):
+                if residues[start:start+len(window)] != window:
+                    continue
+                for spec, rest in entries:
+                    rows.append((tuple(index[start + offset][atom_name] for offset, atom_name in spec), rest))
+        rows.sort(key=lambda row: row[0])
+        sections.append({'header': template['header'], 'kind': template['kind'], 'comments': template['comments'], 'rows': rows})
+    # the name of the reference molecule, also in e.g. posre_ps6.itp
+    pattern = re.compile(r'(?<![A-Za-z0-9])' + re.escape(templates['name']) + r'(?![A-Za-z0-9])')
+    return {'name': name, 'nrexcl': templates['nrexcl'], 'atoms': atoms, 'sections': sections,
+            'preamble': [pattern.sub(name, l) for l in templates['preamble']], 'footer': [pattern.sub(name, l) for l in templates['footer']]}
+
+
+def write_top(top, path):
+    '''Writes a topology dictionary in the layout of acpype (the moleculetype with the preamble and footer of the reference).'''
+    lines = list(top['preamble'])
+    lines += ['[ moleculetype ]', ';name            nrexcl', f" {top['name']:16s} {top['nrexcl']}", '', '[ atoms ]',
+              ';   nr  type  resi  res  atom  cgnr     charge      mass       ; qtot   bond_type']
+    qtot = 0.0
+    for a in top['atoms']:
+        qtot += a['charge']
+        lines.append(f"{a['nr']:6d} {a['type']:>4s} {a['resnr']:5d} {a['resname']:>5s} {a['name']:>5s} {a['nr']:4d} {a['charge']:12.6f} {a['mass']:12.5f} ; qtot {qtot:.3f}")
+    for section in top['sections']:
+        lines += ['', section['header']] + section['comments']
+        lines += [' '.join(f"{a:6d}" for a in atoms) + f"   {rest}" for atoms, rest in section['rows']]
+    lines += [''] + top['footer']
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_gro(path, top, coords, title=None):
+    '''Writes the coordinates (nm) of a topology as a .gro file, in a box around the molecule.'''
+    lines = [title or top['name'], f"{len(top['atoms']):5d}"]
+    for a, (x, y, z) in zip(top['atoms'], coords):
+        lines.append(f"{a['resnr'] % 100000:5d}{a['resname'][:5]:<5s}{a['name'][:5]:>5s}{a['nr'] % 100000:5d}{x:8.3f}{y:8.3f}{z:8.3f}")
+    box = coords.max(axis=0) - coords.min(axis=0) + 1.0
+    lines.append(''.join(f"{b:11.5f}" for b in box))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_posre(path, top, k=1000):
+    '''Position restraints of the heavy atoms, as written by acpype.'''
+    lines = ['[ position_restraints ]', '; atom  type      fx      fy      fz']
+    lines += [f"{a['nr']:6d}     1  {k}  {k}  {k}" for a in top['atoms'] if a['mass'] > 1.5]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def build(templates, plast, length, folder, name=None):
+    '''
+    Writes <name>_GMX.top, <name>_GMX.gro and posre_<name>.itp of a chain of the given length to folder (name by default e.g. ps100).
+    The topology and the coordinates are assembled before the folder is created, so a chain which cannot be assembled leaves nothing behind.
+    '''
+    name = name or f"{plast}{length}"
+    residues = sequence(plast, length)
+    top = assemble(templates, residues, name)
+    coords = chain_coordinates(templates, residues)
+    os.makedirs(folder, exist_ok=True)
+    write_top(top, os.path.join(folder, f"{name}_GMX.top"))
+    write_gro(os.path.join(folder, f"{name}_GMX.gro"), top, coords)
+    write_posre(os.path.join(folder, f"posre_{name}.itp"), top)
+    return top
+
+
+def _parameters(rest):
+    # function type and parameters of an interaction, as numbers where possible
+    values = []
+    for field in rest.split(';', 1)[0].split():
+        try:
+            values.append(float(field))
+        except ValueError:
+            values.append(field)
+    return values
+
+
+def compare(top, reference, coords=None, ref_coords=None, tol=1e-4):
+    '''
+    Differences between an assembled topology and the tleap/acpype topology of the same chain: the atoms (names, types, charges, masses),
+    each interaction section as a multiset of (atoms, parameters), and the RMSD of the coordinates if they are given (after superposition).
+    Returns a list of messages, empty if the topologies are equivalent.
+    '''
+    messages = []
+    if len(top['atoms']) != len(reference['atoms']):
+        return [f"{len(top['atoms'])} atoms instead of {len(reference['atoms'])}"]
+    for a, b in zip(top['atoms'], reference['atoms']):
+        if (a['name'], a['type'], a['resnr'], a['resname']) != (b['name'], b['type'], b['resnr'], b['resname']) \
+                or abs(a['charge'] - b['charge']) > tol or abs(a['mass'] - b['mass']) > tol:
+            messages.append(f"atom {b['nr']}: {a['name']} {a['type']} {a['charge']} instead of {b['name']} {b['type']} {b['charge']}")
+    if len(top['sections']) != len(reference['sections']):
+        messages.append(f"{len(top['sections'])} interaction sections instead of {len(reference['sections'])}")
+    for section, ref in zip(top['sections'], reference['sections']):
+        rows = sorted((atoms, _parameters(rest)) for atoms, rest in section['rows'])
+        ref_rows = sorted((atoms, _parameters(rest)) for atoms, rest in ref['rows'])
+        if len(rows) != len(ref_rows):
+            messages.append(f"{ref['header']}: {len(rows)} entries instead of {len(ref_rows)}")
+            continue
+        for (atoms, values), (ref_atoms, ref_values) in zip(rows, ref_rows):
+            same = atoms == ref_atoms and len(values) == len(ref_values) and all(
+                abs(v - w) <= tol * max(1.0, abs(w)) if isinstance(v, float) and isinstance(w, float) else v == w for v, w in zip(values, ref_values))
+            if not same:
+                messages.append(f"{ref['header']}: {atoms} {values} instead of {ref_atoms} {ref_values}")
+                break
+    if coords is not None and ref_coords is not None:
+        rot, shift = _superpose(coords, ref_coords)
+        rmsd = np.sqrt(np.mean(np.sum((coords @ rot.T + shift - ref_coords)**2, axis=1)))
+        if rmsd > 0.01:
+            messages.append(f"coordinates: RMSD {rmsd:.3f} nm")
+    return messages
+
+
+def load_templates(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Polymer topologies assembled from residue templates.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    templates_parser = sub.add_parser('templates', help='make the residue templates from the tleap/acpype output of short chains')
+    templates_parser.add_argument('folders', nargs='+', help='acpype output folders (with *_GMX.top and *_GMX.gro), at least one even and one odd length')
+    templates_parser.add_argument('-o', '--output', default='templates.json')
+    build_parser = sub.add_parser('build', help='write the topology, coordinates and position restraints of a chain')
+    build_parser.add_argument('templates')
+    build_parser.add_argument('-p', '--plastic', required=True, help='plastic name, e.g. ps')
+    build_parser.add_argument('-l', '--length', type=int, required=True)
+    build_parser.add_argument('-o', '--output', required=True, help='output folder')
+    build_parser.add_argument('-b', '--name', help='molecule name, by default e.g. ps100')
+    check_parser = sub.add_parser('check', help='compare assembled chains with the tleap/acpype output of the same length')
+    check_parser.add_argument('templates')
+    check_parser.add_argument('folders', nargs='+', help='acpype output folders of the chains to compare with')
+    check_parser.add_argument('-p', '--plastic', default='ps')
+    args = parser.parse_args()
+
+    if args.command == 'templates':
+        templates = make_templates(args.folders)
+        with open(args.output, 'w') as f:
+            json.dump(templates, f)
+        print(f"{len(templates['residues'])} residues, {sum(len(s['windows']) for s in templates['sections'])} residue sequences in {args.output}")
+    elif args.command == 'build':
+        try:
+            top = build(load_templates(args.templates), args.plastic, args.length, args.output, args.name)
+        except ValueError as err:
+            sys.exit(str(err))
+        print(f"{top['name']}: {len(top['atoms'])} atoms, " + ', '.join(f"{len(s['rows'])} {s['kind']}" for s in top['sections']))
+    else:
+        templates = load_templates(args.templates)
+        failed = False
+        for folder in args.folders:
+            top_path, gro_path = _reference_files(folder)
+            reference = read_top(top_path)
+            residues = residues_of(reference)
+            if residues != sequence(args.plastic, len(residues)):
+                print(f"{folder}: not a {args.plastic} chain built by gen.sh ({' '.join(residues)})")
+                failed = True
+                continue
+            top = assemble(templates, residues, reference['name'])
+            messages = compare(top, reference, chain_coordinates(templates, residues), read_gro(gro_path)[1])
+            print(f"{folder}: " + ('equivalent' if not messages else '\n  '.join(['DIFFERENT'] + messages)))
+            failed = failed or bool(messages)
+        sys.exit(1 if failed else 0)
@@ -0,0 +1,288 @@
+# Single-pass analysis of the dry protein + plastic trajectory, replacing the chain of gmx trjconv/rms/rmsf/gyrate calls of simulate.sh.
+# The trajectory is read in chunks of frames (mdtraj.iterload), so the memory does not grow with its length, and in the same pass:
+# - the frames are fitted on the protein (rotation and translation) and written to dry.xtc, as trjconv -fit rot+trans did
+# - RMSD of the protein C-alpha atoms and of the plastic (each fitted on itself), to the first frame
+# - RMSF of the protein and of the plastic atoms (each fitted on itself), from running sums of the coordinates and their squares
+# - mass-weighted radius of gyration of the protein, and the mass-weighted COM separation of the protein chains
+# The atoms of the protein chains, the C-alpha atoms and the plastic come from the topology (topol.top and the .itp files it includes)
+# and the dry index group (dry.ndx from make_ndx), so no atom numbers are hardcoded. The mass of each atom is taken from the topology too.
+# The results are written as .xvg files with the names used before (rmsd_prot.xvg, rmsd_pl.xvg, rmsf_prot.xvg, rmsf_pl.xvg, gyr.xvg) and com.xvg;
+# the energy terms written by one gmx energy call (energy.xvg) are split into pe.xvg, ke.xvg, temp.xvg and pres.xvg.
+# Usage (see simulate.sh):
+# python3 -m bpns.trajectory .
+# python3 -m bpns.trajectory ps*/prot_pl/md -j 8       (several run folders in parallel, one process per folder)
+
+import argparse
+import os
+import re
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from bpns.xvg import read_legends, read_xvg
+
+# energy terms of energy.xvg (legends of gmx energy) and the files they are written to
+energy_files = {'Potential': 'pe.xvg', 'Kinetic En.': 'ke.xvg', 'Temperature': 'temp.xvg', 'Pressure': 'pres.xvg'}
+
+section_re = re.compile(r'^\s*\[\s*(\w+)\s*\]')
+
+
+def read_molecules(path, types=None, molecules=None, files=None):
+    '''
+    Molecule types and the [ molecules ] list of a topology, following its #include files (the ones which exist, relative to the including file).
+    Returns a dictionary name -> list of atoms (atom name, residue name, mass; None if the mass is not given) and the list of (name, count).
+    - files: dictionary filled with the file defining each molecule type (name -> path), if given
+    '''
+    types = {} if types is None else types
+    molecules = [] if molecules is None else molecules
+    files = {} if files is None else files
+    section, current = None, None
+    with open(path) as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        line = line.split(';', 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith('#include'):
+            include = os.path.join(os.path.dirname(path), line.split(None, 1)[1].strip('"<> '))
+            if os.path.exists(include):
+                read_molecules(include, types, molecules, files)
+            continue
+        if line.startswith('#'):
+            continue
+        match = section_re.match(line)
+        if match:
+            section = match.group(1)
+            continue
+        fields = line.split()
+        if section == 'moleculetype':
+            current = fields[0]
+            types[current] = []
+            files[current] = path
+        elif section == 'atoms' and current is not None:
+            types[current].append((fields[4], fields[3], float(fields[7]) if len(fields) > 7 else None))
+        elif section == 'molecules':
+            molecules.append((fields[0], int(fields[1])))
+    return types, molecules
+
+
+def read_ndx(path, group=None):
+    '''Atom numbers (1-based) of one group of an index file, by default the last group (the one created by make_ndx).'''
+    groups, name = {}, None
+    with open(path) as f:
+        for line in f:
+            match = section_re.match(line)
+            if match:
+                name = match.group(1)
+                groups[name] = []
+            elif name is not None:
+                groups[name] += [int(a) for a in line.split()]
+    if not groups:
+        raise ValueError(f"No groups in {path}")
+    return np.array(groups[group if group is not None else name])
+
+
+def dry_selection(folder='.', top='topol.top', ndx='dry.ndx', group=None, plastic_itp='plastic.itp'):
+    '''
+    Atoms of the dry trajectory from the topology (in the folder or the one above): the dry atoms are the index group (see read_ndx),
+    in the order of the system, and each molecule of the [ molecules ] list is one chain.
+    - protein chains: molecules whose type name starts with Protein (as written by pdb2gmx)
+    - plastic: the molecules whose type is defined in plastic_itp (written by gen.sh); if the topology does not include it,
+      the other molecules with more than one atom except the ions (type names starting with Ion, e.g. the Ca2+ pairs Ion_chain_C of pdb2gmx)
+    Returns a dictionary with the atom indices in the dry trajectory (protein, ca, plastic, chains: one array per protein chain),
+    the masses of the dry atoms and their atom numbers in the system.
+    '''
+    dry = read_ndx(os.path.join(folder, ndx), group)
+    path = os.path.join(folder, top)
+    if not os.path.exists(path):
+        # the run folders (e.g. md) are one level below the topology
+        path = os.path.join(folder, os.pardir, top)
+    files = {}
+    types, molecules = read_molecules(path, files=files)
+    plastic_types = set(name for name, source in files.items() if os.path.basename(source) == plastic_itp)
+    if not plastic_types:
+        plastic_types = set(name for name, atoms in types.items() if not name.startswith(('Protein', 'Ion')) and len(atoms) > 1)
+    protein, ca, plastic, chains, masses = [], [], [], [], np.full(dry.size, np.nan)
+    start = 0
+    for name, count in molecules:
+        if start >= dry.max():
+            break
+        if name not in types:
+            raise ValueError(f"Molecule type {name} is not defined in {top} or the files it includes")
+        atoms = types[name]
+        for _ in range(count):
+            numbers = np.arange(start + 1, start + len(atoms) + 1)
+            start += len(atoms)
+            where = np.searchsorted(dry, numbers)
+            inside = (where < dry.size) & (dry[np.minimum(where, dry.size - 1)] == numbers)
+            if not inside.any():
+                continue
+            masses[where[inside]] = [np.nan if atoms[i][2] is None else atoms[i][2] for i in np.flatnonzero(inside)]
+            if name.startswith('Protein'):
+                chains.append(where[inside])
+                protein.append(where[inside])
+                ca.append(where[inside][[atoms[i][0] == 'CA' for i in np.flatnonzero(inside)]])
+            elif name in plastic_types:
+                plastic.append(where[inside])
+    if not chains:
+        raise ValueError(f"No protein molecules in {top}")
+    join = lambda parts: np.concatenate(parts) if parts else np.zeros(0, dtype=int)
+    return {'protein': join(protein), 'ca': join(ca), 'plastic': join(plastic), 'chains': chains, 'masses': masses, 'numbers': dry}
+
+
+def _fit(x, ref):
+    # rotations (frames x 3 x 3, applied as x @ rot) and centres fitting the frames x (frames x atoms x 3) on ref (atoms x 3), Kabsch
+    centre = x.mean(axis=1, keepdims=True)
+    u, _, vt = np.linalg.svd(np.einsum('fai,aj->fij', x - centre, ref - ref.mean(axis=0)))
+    d = np.sign(np.linalg.det(u @ vt))
+    u[:, :, -1] *= d[:, None]
+    return u @ vt, centre, ref.mean(axis=0)
+
+
+def _superpose(x, ref):
+    # x fitted on ref with rotation and translation
+    rot, centre, ref_centre = _fit(x, ref)
+    return (x - centre) @ rot + ref_centre
+
+
+class _Fluctuations:
+    # running sums of the coordinates and of their squares of a group fitted on itself, for the RMSF (and the RMSD of each frame)
+    def __init__(self, ref):
+        self.ref = ref
+        self.n, self.sum, self.sum2 = 0, np.zeros(ref.shape), np.zeros(ref.shape[0])
+
+    def add(self, x):
+        fitted = _superpose(x, self.ref)
+        self.n += len(fitted)
+        self.sum += fitted.sum(axis=0)
+        self.sum2 += np.sum(fitted**2, axis=(0, 2))
+        return np.sqrt(np.mean(np.sum((fitted - self.ref)**2, axis=2), axis=1))
+
+    def rmsf(self):
+        mean = self.sum / max(self.n, 1)
+        return np.sqrt(np.maximum(self.sum2 / max(self.n, 1) - np.sum(mean**2, axis=1), 0.0))
+
+
+def _write_xvg(path, columns, fmt='%12.6f'):
+    np.savetxt(path, np.column_stack(columns), fmt=fmt)
+
+
+def analyse(folder='.', trajectory='cluster.xtc', structure='dry.gro', output='dry.xtc', chunk=500, selection=None):
+    '''
+    Streams the dry trajectory of a run folder once and writes the fitted trajectory and the .xvg files (see the top of this file).
+    - trajectory, structure: dry trajectory (PBC removed, e.g. trjconv -pbc cluster) and its structure file
+    - output: fitted trajectory, None to skip writing it
+    - chunk: frames read at a time
+    - selection: from dry_selection, by default from topol.top and dry.ndx in the folder
+    Returns the paths of the written files.
+    '''
+    import mdtraj as md
+
+    sel = selection or dry_selection(folder)
+    masses = sel['masses']
+    if np.isnan(masses[sel['protein']]).any():
+        raise ValueError('The topology gives no mass for some protein atoms')
+    writer = md.formats.XTCTrajectoryFile(os.path.join(folder, output), 'w') if output else None
+    times, rmsd_prot, rmsd_pl, gyration, com = [], [], [], [], []
+    ref = prot = pl = None
+    try:
+        for frames in md.iterload(os.path.join(folder, trajectory), top=os.path.join(folder, structure), chunk=chunk):
+            xyz = frames.xyz.astype(np.float64)
+            if ref is None:
+                ref = xyz[0].copy()
+                prot = _Fluctuations(ref[sel['protein']])
+                pl = _Fluctuations(ref[sel['plastic']]) if sel['plastic'].size else None
+                ca = _Fluctuations(ref[sel['ca']])
+
+            # whole system fitted on the protein, as trjconv -fit rot+trans with the Protein group
+            if writer is not None:
+                rot, centre, ref_centre = _fit(xyz[:, sel['protein']], ref[sel['protein']])
+                fitted = (xyz - centre) @ rot + ref_centre
+                writer.write(fitted.astype(np.float32), time=frames.time, step=np.arange(len(frames)), box=frames.unitcell_vectors)
+
+            times.append(frames.time)
+            rmsd_prot.append(ca.add(xyz[:, sel['ca']]))
+            prot.add(xyz[:, sel['protein']])
+            if pl is not None:
+                rmsd_pl.append(pl.add(xyz[:, sel['plastic']]))
+
+            # mass-weighted radius of gyration of the protein (total and about the x, y and z axes, as gmx gyrate)
+            m = masses[sel['protein']]
+            x = xyz[:, sel['protein']]
+            d2 = (x - np.einsum('a,fai->fi', m, x)[:, None] / m.sum())**2
+            gyration.append(np.column_stack([np.sqrt(np.einsum('a,fai->f', m, d2) / m.sum())] +
+                                            [np.sqrt(np.einsum('a,fa->f', m, d2.sum(axis=2) - d2[:, :, i]) / m.sum()) for i in range(3)]))
+
+            # mass-weighted COM separation of the first two protein chains
+            if len(sel['chains']) > 1:
+                coms = [np.einsum('a,fai->fi', masses[c], xyz[:, c]) / masses[c].sum() for c in sel['chains'][:2]]
+                com.append(np.sqrt(np.sum((coms[1] - coms[0])**2, axis=1)))
+    finally:
+        if writer is not None:
+            writer.close()
+    if ref is None:
+        raise ValueError(f"No frames in {os.path.join(folder, trajectory)}")
+
+    t = np.concatenate(times)
+    paths = [os.path.join(folder, name) for name in ('rmsd_prot.xvg', 'rmsf_prot.xvg', 'gyr.xvg')]
+    _write_xvg(paths[0], [t, np.concatenate(rmsd_prot)])
+    _write_xvg(paths[1], [sel['numbers'][sel['protein']], prot.rmsf()])
+    _write_xvg(paths[2], [t, np.vstack(gyration)])
+    if pl is not None:
+        paths += [os.path.join(folder, 'rmsd_pl.xvg'), os.path.join(folder, 'rmsf_pl.xvg')]
+        _write_xvg(paths[-2], [t, np.concatenate(rmsd_pl)])
+        _write_xvg(paths[-1], [sel['numbers'][sel['plastic']], pl.rmsf()])
+    if com:
+        paths.append(os.path.join(folder, 'com.xvg'))
+        _write_xvg(paths[-1], [t, np.concatenate(com)])
+    if output:
+        paths.append(os.path.join(folder, output))
+    return paths + split_energy(folder)
+
+
+def split_energy(folder='.', path='energy.xvg'):
+    '''Writes the terms of energy.xvg (one gmx energy call, with legends) to the files read by plots.py; returns their paths.'''
+    path = os.path.join(folder, path)
+    if not os.path.exists(path):
+        return []
+    data, paths = read_xvg(path), []
+    for i, legend in enumerate(read_legends(path), start=1):
+        if legend in energy_files:
+            paths.append(os.path.join(folder, energy_files[legend]))
+            _write_xvg(paths[-1], [data[:, 0], data[:, i]])
+    return paths
+
+
+def com_separation(folder='.', trajectory='dry.xtc', structure='dry.gro', chunk=500):
+    '''Mass-weighted COM separation of the first two protein chains along a dry trajectory, streamed in chunks; returns the time (ps) and the separation (nm).'''
+    import mdtraj as md
+
+    sel = dry_selection(folder)
+    chains = sel['chains'][:2]
+    if len(chains) < 2:
+        raise ValueError('The topology has less than two protein chains')
+    masses = sel['masses']
+    times, separation = [], []
+    for frames in md.iterload(os.path.join(folder, trajectory), top=os.path.join(folder, structure), chunk=chunk):
+        coms = [np.einsum('a,fai->fi', masses[c], frames.xyz[:, c].astype(np.float64)) / masses[c].sum() for c in chains]
+        times.append(frames.time)
+        separation.append(np.sqrt(np.sum((coms[1] - coms[0])**2, axis=1)))
+    return np.concatenate(times), np.concatenate(separation)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Single-pass analysis of dry protein + plastic trajectories.')
+    parser.add_argument('folders', nargs='*', default=['.'], help='run folders (with cluster.xtc, dry.gro and dry.ndx; topol.top in the folder or the one above)')
+    parser.add_argument('-f', '--trajectory', default='cluster.xtc', help='dry trajectory without PBC')
+    parser.add_argument('-o', '--output', default='dry.xtc', help='fitted trajectory')
+    parser.add_argument('--chunk', type=int, default=500, help='frames read at a time')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of folders analysed at the same time')
+    args = parser.parse_args()
+
+    # one process per folder, a failed folder does not stop the others
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(args.folders))) as pool:
+        futures = {folder: pool.submit(analyse, folder, args.trajectory, output=args.output, chunk=args.chunk) for folder in args.folders}
+        for folder, future in futures.items():
+            try:
+                print(f"{folder}: " + ' '.join(os.path.basename(p) for p in future.result()))
+            except Exception as err:
+                print(f"{folder}: {err}")
@@ -0,0 +1,165 @@
+# Umbrella integration of many windows and many systems (e.g. plastic lengths) at once.
+# The restraint forces of all windows of all systems are read once into one array (systems x windows x time), then:
+# - the block means of any block size come from a single cumulative sum over time
+# - the free-energy profile of every block is a cumulative trapezoidal integration over the windows
+# so there are no Python loops over windows or blocks, and a block-size study only loops over the block sizes.
+# The systems are read in parallel, one process per system; the windows are read with bpns.colvar (binary cache included).
+# Systems of different lengths are padded with NaN, so each system keeps all of its complete blocks.
+
+import os
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from bpns.colvar import load_colvar, restraint_force
+
+
+def window_dirs(folder='.'):
+    '''Umbrella windows in a folder: the sub-folders named after the centre of the umbrella (e.g. 2.1), sorted by the centre.'''
+    dirs = []
+    for d in os.listdir(folder):
+        if not os.path.isdir(os.path.join(folder, d)):
+            continue
+        try:
+            float(d)
+        except ValueError:
+            continue
+        dirs.append(d)
+    return sorted(dirs, key=float)
+
+
+def load_windows(folder='.', dirs=None, start=35000, end=75000):
+    '''
+    Reads the restraint forces of all umbrella windows of one system.
+    - folder: folder with one sub-folder per window (named after the CV value, with a COLVAR file from PLUMED)
+    - dirs: window folders to use, by default all of them (see window_dirs)
+    - start, end: part of each window used (ps, the COLVAR is printed every 1 ps)
+    Returns the CV values of the windows and the forces (n_windows x n_steps), cut to the shortest window.
+    '''
+    dirs = window_dirs(folder) if dirs is None else list(dirs)
+    if not dirs:
+        raise ValueError(f"No umbrella windows in {folder}")
+    forces = [restraint_force(load_colvar(os.path.join(folder, d, 'COLVAR')))[start:end] for d in dirs]
+    n_steps = min(len(f) for f in forces)
+    return np.array([float(d) for d in dirs]), np.stack([f[:n_steps] for f in forces])
+
+
+def load_systems(folders, dirs=None, start=35000, end=75000, workers=None):
+    '''
+    Reads the windows of several systems at once, in parallel (one process per system).
+    - folders: folders of the systems, each with the same umbrella windows
+    - dirs, start, end: as in load_windows
+    - workers: number of processes, by default one per system (up to the number of cores)
+    Returns the CV values of the windows and the forces (n_systems x n_windows x n_steps); shorter systems are padded with NaN.
+    '''
+    folders = list(folders)
+    if len(folders) == 1 or workers == 1:
+        loaded = [load_windows(f, dirs, start, end) for f in folders]
+    else:
+        workers = workers or min(len(folders), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            loaded = list(pool.map(load_windows, folders, [dirs]*len(folders), [start]*len(folders), [end]*len(folders)))
+
+    cv = loaded[0][0]
+    for folder, (c, _) in zip(folders, loaded):
+        if c.shape != cv.shape or not np.allclose(c, cv):
+            raise ValueError(f"The umbrella windows of {folder} ({c.tolist()}) differ from those of {folders[0]} ({cv.tolist()})")
+
+    n_steps = max(f.shape[1] for _, f in loaded)
+    forces = np.full((len(folders), cv.size, n_steps), np.nan)
+    for i, (_, f) in enumerate(loaded):
+        forces[i, :, :f.shape[1]] = f
+    return cv, forces
+
+
+def block_forces(forces, size, csum=None):
+    '''
+    Block means of the forces (any array with time along the last axis, e.g. systems x windows x time) for one block size.
+    - csum: cumulative sum of the forces along time with a leading 0, to reuse it for many block sizes (see block_size_study)
+    Returns an array (... x n_blocks x n_windows): one row of window forces per block. Blocks with missing data are NaN.
+    '''
+    if csum is None:
+        csum = np.concatenate([np.zeros(forces.shape[:-1] + (1,)), np.cumsum(forces, axis=-1)], axis=-1)
+    n_blocks = (csum.shape[-1] - 1) // size
+    if n_blocks < 1:
+        raise ValueError(f"Block size {size} larger than the data ({csum.shape[-1] - 1} steps)")
+    ends = size * np.arange(1, n_blocks + 1)
+    means = (csum[..., ends] - csum[..., ends - size]) / size
+    return np.swapaxes(means, -1, -2)
+
+
+def integrate_blocks(cv, forces):
+    '''
+    Free-energy profiles from the forces by cumulative trapezoidal integration over the windows (last axis), the first window at 0.
+    - cv: CV values of the windows
+    - forces: window forces, e.g. n_blocks x n_windows (from block_forces)
+    Returns the profiles, same shape as forces.
+    '''
+    steps = 0.5 * (forces[..., 1:] + forces[..., :-1]) * np.diff(cv)
+    return np.concatenate([np.zeros(forces.shape[:-1] + (1,)), np.cumsum(steps, axis=-1)], axis=-1)
+
+
+def _block_statistics(profiles):
+    # mean and standard deviation over the blocks (axis -2), ignoring the blocks a system does not have
+    n_blocks = np.sum(~np.isnan(profiles[..., -1]), axis=-1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(profiles, axis=-2), np.nanstd(profiles, axis=-2), n_blocks
+
+
+def free_energy(cv, forces, size=2000):
+    '''
+    Umbrella integration with block averaging.
+    - cv: CV values of the windows
+    - forces: forces with time along the last axis (n_windows x n_steps, or n_systems x n_windows x n_steps)
+    - size: block size (ps)
+    Returns:
+    - gibbs: average free-energy profile over the blocks (n_windows, or n_systems x n_windows)
+    - std: standard deviation of the profiles of the blocks
+    - profiles: the profile of each block (... x n_blocks x n_windows)
+    - n_blocks: number of complete blocks (per system)
+    '''
+    profiles = integrate_blocks(cv, block_forces(forces, size))
+    gibbs, std, n_blocks = _block_statistics(profiles)
+    return gibbs, std, profiles, n_blocks
+
+
+def block_size_study(cv, forces, sizes):
+    '''
+    Free-energy profiles for many block sizes, from a single cumulative sum of the forces.
+    - cv, forces: as in free_energy
+    - sizes: block sizes (ps)
+    Returns arrays with the block sizes along the first axis:
+    - gibbs, std: average profile and standard deviation (n_sizes x ... x n_windows)
+    - n_blocks: number of complete blocks (n_sizes x ..., e.g. per system)
+    '''
+    csum = np.concatenate([np.zeros(forces.shape[:-1] + (1,)), np.cumsum(forces, axis=-1)], axis=-1)
+    results = [_block_statistics(integrate_blocks(cv, block_forces(forces, int(s), csum))) for s in sizes]
+    return tuple(np.stack(r) for r in zip(*results))
+
+
+def align(gibbs, index=1):
+    '''
+    Shifts free-energy profiles (window along the last axis) so that they are all 0 at the window index,
+    e.g. index=1 puts the minima of the bound state on the same value; index=None uses the minimum of each profile.
+    '''
+    gibbs = np.asarray(gibbs)
+    ref = np.nanmin(gibbs, axis=-1, keepdims=True) if index is None else gibbs[..., index:index+1]
+    return gibbs - ref
+
+
+def integrate_systems(folders, start=35000, end=75000, size=2000, index=1, workers=None):
+    '''
+    Aligned free-energy profiles of several systems in one call.
+    - folders: dictionary name -> folder with the umbrella windows (e.g. {'ps0': ..., 'ps10': ...}), or a list of folders
+    - start, end, size: part of the windows used and block size (ps)
+    - index: window at which the profiles are aligned (see align)
+    - workers: number of processes reading the systems
+    Returns a dictionary with the names of the systems, the CV values, the aligned profiles (gibbs) and their std (n_systems x n_windows),
+    and the number of blocks per system.
+    '''
+    names = list(folders) if isinstance(folders, dict) else [os.path.basename(os.path.normpath(f)) for f in folders]
+    paths = list(folders.values()) if isinstance(folders, dict) else list(folders)
+    cv, forces = load_systems(paths, start=start, end=end, workers=workers)
+    gibbs, std, _, n_blocks = free_energy(cv, forces, size)
+    return {'names': names, 'cv': cv, 'gibbs': align(gibbs, index), 'std': std, 'n_blocks': n_blocks}
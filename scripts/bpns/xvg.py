@@ -0,0 +1,52 @@
+# Reader for GROMACS .xvg files (gmx energy, rms, rmsf, gyrate, ...), shared by plots.py and the notebooks.
+# The whole file is parsed in one pass into a 2D array; header lines starting with @ or # are skipped, so files written with or without -xvg none can be read.
+# The first column is the x axis written by GROMACS (usually the time in ps), so no time axis has to be defined by hand.
+
+import re
+import numpy as np
+
+from bpns.colvar import parse_table
+
+
+def _columns(text):
+    # number of columns from the first data line
+    for line in text.splitlines():
+        words = line.split()
+        if words and not line.lstrip().startswith((b'#', b'@')):
+            return len(words)
+    return 0
+
+
+def read_xvg(path):
+    '''
+    Reads an .xvg file into a 2D array with n rows (frames) and m columns; column 0 is the time (or other x value).
+    Lines after a "&" (set separator) are not read, as only the first data set is used by the scripts.
+    '''
+    with open(path, 'rb') as f:
+        text = f.read()
+    end = text.find(b'\n&')
+    if end >= 0:
+        text = text[:end+1]
+    ncol = _columns(text)
+    if ncol == 0:
+        return np.zeros((0, 2))
+    return parse_table(text, ncol)
+
+
+def read_series(path, column=1):
+    '''Returns the time (first column) and one data column of an .xvg file.'''
+    data = read_xvg(path)
+    return data[:, 0], data[:, column]
+
+
+def read_legends(path):
+    '''Legends of the data columns of an .xvg file (the "@ s0 legend" lines, written without -xvg none), in the order of the columns.'''
+    legends = {}
+    with open(path, errors='replace') as f:
+        for line in f:
+            match = re.match(r'@\s+s(\d+)\s+legend\s+"(.*)"', line)
+            if match:
+                legends[int(match.group(1))] = match.group(2)
+            elif line.strip() and not line.startswith(('#', '@')):
+                break
+    return [legends[i] for i in sorted(legends)]
@@ -9,46 +9,98 @@
 # - carries out umbrella sampling at the CV selected by the Bayesian optimiser
 # - extracts the force from the simulation, using block analysis
 # - returns the force value to the Bayesian optimiser
-# - the cycle is configured to run 3 times - after it is done, you can restart the cycle to get additional 3 points.
+# - the cycle is configured to collect 3 points - after it is done, you can restart the cycle to get additional 3 points.
+# Several points can be simulated at the same time (batch mode, e.g. one per free GPU): set n_parallel below or give it as the second command line argument, e.g. ./optimize.py 8 4 collects 8 points, 4 at a time.
+# While some points are still running, new points are selected with the constant liar strategy: the running points are told to a copy of the optimiser with a fake ("lie") force value, so that new points are not placed on top of them.
+# The results are told to the optimiser as soon as each point finishes.
+# The stages (gen.sh -> put_together.py -> prep_prot_pl.sh -> [prep_pull.sh ->] prep_umb.sh -> get_force.py) run as tasks of a pipeline (scripts/bpns/pipeline.py):
+# finished stages are recorded in pipeline_state.json and points which were still running are saved in PENDING_POINTS, so after a crash the script can simply be started again and it continues where it stopped.
+# Set use_slurm below to run each stage as a SLURM job step (srun) instead of a local process.
+# Set backend below to 'synthetic' to replace the simulations by scripts/bpns/synthetic.py (analytic forces, artificial latency), e.g. to test the loop with many points without GROMACS.
 # The results will be in a folder dedicated to a certain plastic length, they are divided into plastic-only and plastic+protein directory.
-# At the end of each datapoint collection, the optimiser state is saved as optstate_x, where x is the number of colleted points in total.
+# Every collected point is recorded in the results catalogue results.db (scripts/bpns/catalogue.py) with its force, error, block length and run folder;
+# the optimiser is rebuilt from the catalogue at every start, so points flagged in the catalogue (e.g. outliers) are left out. Campaigns which were saved as optstate_x files are imported once.
 # Put this script in your results directory and specify the path to your cloned repo (both here, as well as in the individual scripts inside the cloned repo - proj_path variable, available to you at the top of all scripts that need it).
 # Please remember to also put the input files with the plastic structure in the same directory (see: gen.sh script for more info and examples).
 
 # path to cloned repo
 proj_path='$HOME/project'
 
+# number of points collected in one run of this script, and the number of points that can be simulated at the same time
+n_points = 3
+n_parallel = 1
+
+# constant liar strategy used when asking for points while others are running: cl_min, cl_mean or cl_max
+liar_strategy = 'cl_min'
+
+# surrogate model: 'skopt' (skopt Optimizer, exact GP refitted from scratch at every point) or 'bpns' (scripts/bpns/surrogate.py: warm-started hyperparameters,
+# incremental updates, inducing points above max_exact points and the acquisition function evaluated on a grid, so asking stays fast for campaigns with hundreds of points)
+# the optimiser is rebuilt from the results catalogue at every start, so the surrogate can be changed between runs
+surrogate = 'skopt'
+max_exact = 300
+
+# if True, points are chosen by expected improvement per GPU-hour (scripts/bpns/costs.py): points at new lengths need hours of preparation,
+# points at prepared or cached lengths only the umbrella run; the stage costs are measured by the pipeline. Needs surrogate = 'bpns'
+cost_aware = False
+
+# if True, each plastic length is pulled only once (prep_pull.sh, scripts/bpns/pull.py) and every umbrella window of that length,
+# including the ones asked for later, is seeded from the pull frame closest to its COM separation instead of pulling from md.cpt again
+seed_from_pull = False
+
+# if True, the stages are started with srun (the optimiser itself must run inside a SLURM allocation); otherwise as local processes
+use_slurm = False
+
+# simulation backend: 'gromacs' runs the real stages; 'synthetic' replaces gen.sh, put_together.py, prep_prot_pl.sh, prep_pull.sh and prep_umb.sh
+# by scripts/bpns/synthetic.py, which writes the same outputs (COLVAR files from an analytic force model with noise) after an artificial latency;
+# its settings are read from synthetic.json in this folder if it exists (python3 -m bpns.synthetic init synthetic.json writes the defaults).
+# The forces are extracted by get_force.py with both backends
+backend = 'gromacs'
+
 # import essential libraries
 import numpy as np
 import matplotlib.pyplot as plt
+import json
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from skopt.space import Real, Integer
 from skopt import Optimizer
-from skopt.utils import dump, load
+
+# shared code from the cloned repo
+sys.path.append(os.path.expandvars(proj_path) + '/scripts')
+from bpns.pipeline import Pipeline, Task, LocalExecutor, SlurmExecutor, TaskError
+from bpns.telemetry import Telemetry
+from bpns.surrogate import Surrogate
+from bpns.costs import CostModel
+from bpns.buildcache import entry_path, monomer_key, plastic_key
+from bpns.catalogue import Catalogue, import_optstate, read_final_force
+
+if cost_aware and surrogate != 'bpns':
+    raise ValueError("cost_aware needs surrogate = 'bpns'")
+if backend not in ('gromacs', 'synthetic'):
+    raise ValueError("backend must be 'gromacs' or 'synthetic'")
+
+# the number of points and parallel simulations can also be given as command line arguments
+if len(sys.argv) > 1:
+    n_points = int(sys.argv[1])
+if len(sys.argv) > 2:
+    n_parallel = int(sys.argv[2])
 
 # define the main foler where the main script is executed
 main_folder = os.getcwd()
 
-# cast all the current optimizers in a list, sort versions numerically to determine the newest one to load
-current_optimizers = [int(opt.split('_')[1]) for opt in os.listdir() if opt.startswith('optstate')]
-sorted_optimizers = sorted(current_optimizers)
-
-try:
-    # try to load the most recent optimizer
-    ver = sorted_optimizers[-1]    
-    optimizer = load('optstate_'+str(ver))
-    print(f"Loading version {ver}...")
-
-except IndexError:
-    # if it occurs, it means that it is the initial run and the optimizer must be defined
-    print('There were no optimizers before, initialising...')
-    ver = 0
+def new_optimizer():
+    '''A new optimiser without any points: the skopt Optimizer or the bpns surrogate, depending on surrogate above.'''
     # define the dimensions
     dim1 = Integer(name='Polymer length', low=0, high=40)
     dim2 = Real(name='CV', low=2.1, high=5.6)
 
     # define the optimizer
-    optimizer = Optimizer(dimensions=[dim1, dim2],
+    if surrogate == 'bpns':
+        # xi of the bpns surrogate is in units of the standard deviation of the forces
+        return Surrogate(bounds=[(dim1.low, dim1.high), (dim2.low, dim2.high)], integer=[True, False],
+            acq_func="EI", xi=0.01, max_exact=max_exact, random_state=1999)
+    return Optimizer(dimensions=[dim1, dim2],
         base_estimator="gp",
         n_random_starts=0,
         n_initial_points=0,
@@ -58,154 +110,266 @@ except IndexError:
         random_state=1999,
         acq_func_kwargs={"xi": 10000})
 
-    # load data onto the optimizer
-    ini_points = [[0,2.1],
-                [0,2.6],
-                [0,3.1],
-                [0,3.6],
-                [0,4.1],
-                [0,4.6],
-                [0,5.1],
-                [0,5.6],
-                [10,2.1],
-                [10,2.6],
-                [10,3.1],
-                [10,3.6],
-                [10,4.1],
-                [10,4.6],
-                [10,5.1],
-                [10,5.6],
-                [20,2.1],
-                [20,2.6],
-                [20,3.1],
-                [20,3.6],
-                [20,4.1],
-                [20,4.6],
-                [20,5.1],
-                [20,5.6],
-                [40,2.1],
-                [40,2.6],
-                [40,3.1],
-                [40,3.6],
-                [40,4.1],
-                [40,4.6],
-                [40,5.1],
-                [40,5.6]]
-
-    ini_data=[14.579715052631622, 
-            19.190460644736888, 
-            10.33424946052636, 
-            14.856456881578996, 
-            21.62012953947351, 
-            13.628588289473507, 
-            0.012775631578769259, 
-            0.3406779078945591, 
-            16.960575907894782, 
-            21.57553236842109, 
-            48.089532302631625, 
-            -3.7394148421052193, 
-            0.7589639605261377, 
-            -0.356555881579125, 
-            0.9089245263156126, 
-            0.22910882894719065, 
-            15.544790342105308, 
-            19.071600368421098, 
-            11.658016315789519, 
-            6.284280171052677, 
-            11.020756381578769, 
-            -1.3047369078949158, 
-            25.45458977631561, 
-            0.0019442236840332768, 
-            11.282320578947411, 
-            18.108763013157937, 
-            6.10140898684215, 
-            13.511121144736885, 
-            7.001024342105086, 
-            1.3792392631577166, 
-            0.01062426315771658, 
-            2.9354461578945594]
-
-    # tell the optimiser the initial points
-    optimizer.tell(x=ini_points,y=ini_data)
-
-    # if this is the initial run, gen.sh script needs to be copied to the same directory
-    gen_path = proj_path+'/scripts/plastic/gen.sh'
-    cmd = f"cp ${gen_path} ."
-    os.system(cmd)
+# all the evaluated points are kept in the results catalogue (scripts/bpns/catalogue.py), the optimiser is rebuilt from it at every start
+catalogue = Catalogue(os.path.join(main_folder, 'results.db'))
 
-
-# start the datapoints collection
-for i in range(3):
-    # print out already collected points
-    checked_lengths = set([x[0] for x in optimizer.Xi])
-    p = optimizer.Xi
-    cmd = f'echo "Checked points are: {p}" > POINTS'
-    os.system(cmd)
-
-    # ask the optimiser for the next point
-    x = optimizer.ask()
-    cmd = f'echo "THE FOLLOWING POINT HAS BEEN SELECTED: {x}" >> POINTS'
-    os.system(cmd)
-
-    # check what plastic length needs to be generated and equilibrated
-    # check if plastic was already generated; if no then do the simulation
-    if x[0] in checked_lengths:
-        print(f"length {x[0]} already checked before, proceeding to umbrella...")
-        os.chdir(main_folder)
-
-    # if not true, simulation needs to be carried out: generation and equilibration taken care of by gen.sh script
-    # then, the protein and plastic are put together and equilibrated
+if catalogue.count() == 0:
+    # cast all the saved optimizers in a list, sort versions numerically to determine the newest one
+    saved_optimizers = sorted(int(opt.split('_')[1]) for opt in os.listdir() if opt.startswith('optstate'))
+    if saved_optimizers:
+        # a campaign started before the catalogue: the points of the newest saved optimizer are imported once
+        print(f"Importing version {saved_optimizers[-1]} into the results catalogue...")
+        import_optstate(catalogue, os.path.join(main_folder, f"optstate_{saved_optimizers[-1]}"))
     else:
-        print(f"point {x[0]} will be checked!")
-        cmd = f"./gen.sh -p ps -l {x[0]} &> gen{x[0]}.log"
-        print("Generating plastic structure...")
-        os.system(cmd)
-        print("Plastic structure generated and equilibrated!")
-        cmd = f"cp ps{x[0]}/plastic/md/plastic.pdb ps{x[0]}/prot_pl/"
-        os.system(cmd)
-        print("Plastic structure copied")
-        print(os.getcwd())
-        # go to the prot_pl folder
-        prot_pl = f"ps{x[0]}/prot_pl/"
-        os.chdir(prot_pl)
-        os.system('./put_together.py')
-        print('Structures combined!')
-        print(f'Preparation + simulation of ps{x[0]}...')
-        cmd = f"./prep_prot_pl.sh -p ps -l {x[0]}"
+        # it is the initial run, the initial points are recorded in the catalogue
+        print('There were no optimizers before, initialising...')
+
+        # initial data
+        ini_points = [[0,2.1],
+                    [0,2.6],
+                    [0,3.1],
+                    [0,3.6],
+                    [0,4.1],
+                    [0,4.6],
+                    [0,5.1],
+                    [0,5.6],
+                    [10,2.1],
+                    [10,2.6],
+                    [10,3.1],
+                    [10,3.6],
+                    [10,4.1],
+                    [10,4.6],
+                    [10,5.1],
+                    [10,5.6],
+                    [20,2.1],
+                    [20,2.6],
+                    [20,3.1],
+                    [20,3.6],
+                    [20,4.1],
+                    [20,4.6],
+                    [20,5.1],
+                    [20,5.6],
+                    [40,2.1],
+                    [40,2.6],
+                    [40,3.1],
+                    [40,3.6],
+                    [40,4.1],
+                    [40,4.6],
+                    [40,5.1],
+                    [40,5.6]]
+
+        ini_data=[14.579715052631622, 
+                19.190460644736888, 
+                10.33424946052636, 
+                14.856456881578996, 
+                21.62012953947351, 
+                13.628588289473507, 
+                0.012775631578769259, 
+                0.3406779078945591, 
+                16.960575907894782, 
+                21.57553236842109, 
+                48.089532302631625, 
+                -3.7394148421052193, 
+                0.7589639605261377, 
+                -0.356555881579125, 
+                0.9089245263156126, 
+                0.22910882894719065, 
+                15.544790342105308, 
+                19.071600368421098, 
+                11.658016315789519, 
+                6.284280171052677, 
+                11.020756381578769, 
+                -1.3047369078949158, 
+                25.45458977631561, 
+                0.0019442236840332768, 
+                11.282320578947411, 
+                18.108763013157937, 
+                6.10140898684215, 
+                13.511121144736885, 
+                7.001024342105086, 
+                1.3792392631577166, 
+                0.01062426315771658, 
+                2.9354461578945594]
+
+        catalogue.add_many(ini_points, ini_data, source='initial')
+
+        # if this is the initial run, gen.sh script needs to be copied to the same directory
+        gen_path = proj_path+'/scripts/plastic/gen.sh'
+        cmd = f"cp ${gen_path} ."
         os.system(cmd)
-        print('Equilibration complete!')
-        os.chdir(main_folder)
-
-    # start biased sampling run in plumed folder
-    fold = f"ps{x[0]}/prot_pl/plumed/"
-    os.chdir(fold)
-
-    # approximate COM separation to 2 decimal places
-    com = round(x[1],2)
-
-    # prepare the system and run the simulation
-    cmd = f"./prep_umb.sh {com}"
-    print('Preparing for umbrella...')
-    os.system(cmd)
-
-    # extract the force from the biased sampling run
-    path = f"{com}/"
-    os.chdir(path)
-    os.system('cp ../get_force.py .')
-
-    cmd = f"./get_force.py {com} > FINAL_FORCE"
-    print("Extracting the force...")
-    y = os.system(cmd)
-
-    with open('FINAL_FORCE') as f:
-        y = float(f.readline().strip())
-
-    print('THE FINAL VALUE OF THE FORCE:')
-    print(y)
-    optimizer.tell(x, y)
-
-    # tell the solution and save the updated optimizer
-    os.chdir(main_folder)
-    ver = ver+1
-    print(f"Saving version{ver}...")
-    dump(res=optimizer, filename=f"optstate_{ver}")
+
+# tell the optimiser all the points of the catalogue except the flagged ones (see: python3 -m bpns.catalogue flag)
+optimizer = new_optimizer()
+points, data = catalogue.training_data()
+print(f"Rebuilding the optimiser from {len(points)} points of the results catalogue...")
+optimizer.tell(points, data)
+
+
+# the pipeline running all the stages, shared by all the points
+if use_slurm:
+    executor = SlurmExecutor(launcher='srun', max_workers=n_parallel)
+else:
+    executor = LocalExecutor(max_workers=n_parallel)
+# the resources used by every stage are recorded in telemetry.jsonl, see: python3 -m bpns.telemetry summary
+pipeline = Pipeline(executor, state_file=os.path.join(main_folder, 'pipeline_state.json'),
+                    telemetry=Telemetry(os.path.join(main_folder, 'telemetry.jsonl')))
+
+# lengths which were already prepared before the pipeline was used (e.g. the initial points), they do not get preparation tasks
+prepared_lengths = set([x[0] for x in optimizer.Xi])
+if backend == 'synthetic':
+    # the synthetic backend prepares every length itself, except the ones it has already prepared in this folder
+    prepared_lengths = set(l for l in prepared_lengths if os.path.isdir(os.path.join(main_folder, f"ps{l}/prot_pl/md")))
+
+def stage_commands(length, com):
+    '''Commands of the stages of the point (length, com) for the selected backend, and the input files they need.'''
+    if backend == 'synthetic':
+        config = os.path.join(main_folder, 'synthetic.json')
+        synthetic = f"PYTHONPATH={os.path.expandvars(proj_path)}/scripts python3 -m bpns.synthetic" + (f" --config {config}" if os.path.exists(config) else '')
+        commands = {'gen': f"{synthetic} gen -p ps -l {length} > gen{length}.log 2>&1", 'place': f"{synthetic} place", 'equil': f"{synthetic} equil",
+                    'pull': f"{synthetic} pull", 'umbrella': f"{synthetic} umbrella -l {length} {com}"}
+        return commands, {'gen': [], 'place': []}
+    commands = {'gen': f"./gen.sh -p ps -l {length} &> gen{length}.log", 'place': "cp ../plastic/md/plastic.pdb . && ./put_together.py",
+                'equil': f"./prep_prot_pl.sh -p ps -l {length}", 'pull': "./prep_pull.sh", 'umbrella': f"./prep_umb.sh {com}"}
+    return commands, {'gen': ['gen.sh'], 'place': ['put_together.py']}
+
+def add_point_tasks(x):
+    '''
+    Adds the tasks needed to evaluate the point x = [length, COM separation] to the pipeline and returns the name of the last one (force extraction).
+    The preparation tasks of a length are shared by all the points with that length.
+    '''
+    length = x[0]
+    # the COM separation was rounded to 2 decimal places when the point was asked
+    com = x[1]
+    prot_pl = os.path.join(main_folder, f"ps{length}/prot_pl")
+    plumed = os.path.join(prot_pl, "plumed")
+    deps = []
+    commands, inputs = stage_commands(length, com)
+
+    # generation and equilibration of the plastic taken care of by gen.sh script
+    # then, the protein and plastic are put together and equilibrated
+    if length not in prepared_lengths:
+        pipeline.add(Task(f"gen/ps{length}", commands['gen'], cwd=main_folder,
+                          inputs=inputs['gen'], outputs=[f"ps{length}/plastic/md/plastic.pdb"], gpus=1, scan=[f"ps{length}"]))
+        pipeline.add(Task(f"place/ps{length}", commands['place'], cwd=prot_pl,
+                          inputs=inputs['place'], outputs=['conf.pdb'], deps=[f"gen/ps{length}"]))
+        pipeline.add(Task(f"equil/ps{length}", commands['equil'], cwd=prot_pl,
+                          inputs=['conf.pdb'], outputs=['md/md.tpr', 'md/md.cpt'], deps=[f"place/ps{length}"], gpus=1, scan=['.']))
+        deps = [f"equil/ps{length}"]
+
+    # a single pull per length, shared by all its windows
+    umb_cmd = commands['umbrella']
+    if seed_from_pull:
+        pipeline.add(Task(f"pull/ps{length}", commands['pull'], cwd=plumed,
+                          outputs=['pull/frames.json'], deps=deps, gpus=1, scan=['pull']))
+        deps = [f"pull/ps{length}"]
+        umb_cmd += " seed"
+
+    # biased sampling run in plumed folder, then force extraction in the results folder
+    pipeline.add(Task(f"umbrella/ps{length}/{com}", umb_cmd, cwd=plumed,
+                      outputs=[f"{com}/COLVAR"], deps=deps, gpus=1, scan=[str(com)]))
+    pipeline.add(Task(f"force/ps{length}/{com}", f"cp ../get_force.py . && ./get_force.py {com} > FINAL_FORCE", cwd=os.path.join(plumed, str(com)),
+                      outputs=['FINAL_FORCE'], deps=[f"umbrella/ps{length}/{com}"]))
+    return f"force/ps{length}/{com}"
+
+def evaluate(x, task):
+    '''Runs the tasks of the point x (skipping the ones finished before) and returns the extracted force with its error, block length and run folder.'''
+    print(f"Evaluating point {x}...")
+    pipeline.run(task)
+    result = read_final_force(pipeline.tasks[task].cwd)
+    result.update(run_path=pipeline.tasks[task].cwd, task=task)
+    return result
+
+def save_pending(points):
+    '''Saves the points which are still running or waiting, so that they are continued (not asked again) after a restart.'''
+    with open(os.path.join(main_folder, 'PENDING_POINTS'), 'w') as f:
+        json.dump([[int(x[0]), float(x[1])] for x in points], f)
+
+def cached_lengths():
+    '''Lengths whose plastic is in the build cache with the gen.sh defaults used by the optimiser (see scripts/bpns/buildcache.py).'''
+    try:
+        monomers = monomer_key('ps', main_folder)
+    except FileNotFoundError:
+        return set()
+    mdps = [os.path.join(os.path.expandvars(proj_path), 'mdps/plastic', f) for f in os.listdir(os.path.expandvars(proj_path) + '/mdps/plastic')]
+    return set(l for l in range(41) if os.path.exists(entry_path('plastic', plastic_key('ps', l, monomers, files=mdps))))
+
+def update_costs(optimizer):
+    '''Gives the optimiser the current cost model: measured stage costs, prepared lengths (including the ones being prepared now) and cached plastics.'''
+    prepared = set(prepared_lengths) | set(int(name.split('/ps')[1]) for name in list(pipeline.tasks) if name.startswith('equil/'))
+    optimizer.cost = CostModel.from_state(pipeline.state, prepared=prepared, cached=cached_lengths())
+    print(f"Stage costs: {optimizer.cost.summary()}")
+
+def ask_points(optimizer, running, n):
+    '''
+    Asks the optimiser for n new points while the points in running are still being simulated.
+    The running points are told to a copy of the optimiser with a constant "lie" value (min, mean or max of the forces so far, depending on liar_strategy), so the new points are chosen away from them.
+    '''
+    if running:
+        lie = {'cl_min': np.min, 'cl_mean': np.mean, 'cl_max': np.max}[liar_strategy](optimizer.yi)
+        optimizer = optimizer.copy(random_state=optimizer.rng.randint(0, np.iinfo(np.int32).max))
+        optimizer.tell(running, [lie]*len(running))
+    return optimizer.ask(n_points=n, strategy=liar_strategy)
+
+
+# start the datapoints collection
+# running maps the submitted simulations to their points
+running = {}
+n_asked = 0
+
+# points which were running when the script stopped last time are continued first
+try:
+    with open(os.path.join(main_folder, 'PENDING_POINTS')) as f:
+        pending = json.load(f)
+except FileNotFoundError:
+    pending = []
+
+with ThreadPoolExecutor(max_workers=n_parallel) as pool:
+    while n_asked < n_points or running:
+        # fill all free slots with new points
+        n_new = min(n_parallel - len(running), n_points - n_asked)
+        if n_new > 0:
+            # print out already collected points
+            with open(os.path.join(main_folder, 'POINTS'), 'w') as f:
+                f.write(f"Checked points are: {optimizer.Xi}\n")
+
+            # continue pending points, ask the optimiser for the rest
+            new_points = pending[:n_new]
+            pending = pending[n_new:]
+            if len(new_points) < n_new:
+                if cost_aware:
+                    update_costs(optimizer)
+                new_points += ask_points(optimizer, list(running.values()), n_new - len(new_points))
+            # approximate COM separation to 2 decimal places (the names of the umbrella folders), here only, so that the optimiser,
+            # the results catalogue and the tasks all get the same point and a point rebuilt from the catalogue matches the one asked
+            new_points = [[int(x[0]), round(float(x[1]), 2)] for x in new_points]
+
+            for x in new_points:
+                with open(os.path.join(main_folder, 'POINTS'), 'a') as f:
+                    f.write(f"THE FOLLOWING POINT HAS BEEN SELECTED: {x}\n")
+                    if cost_aware:
+                        f.write(f"Estimated cost: {optimizer.cost.point_cost(x[0]):.1f} GPU-h\n")
+                running[pool.submit(evaluate, x, add_point_tasks(x))] = x
+            n_asked += n_new
+            save_pending(list(running.values()) + pending)
+
+        # tell the results as soon as any of the running points finishes
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            x = running.pop(future)
+            save_pending(list(running.values()) + pending)
+            try:
+                result = future.result()
+            except (TaskError, OSError, ValueError) as e:
+                print(f"Point {x} failed, it is not told to the optimiser: {e}")
+                continue
+
+            # tell the solution and record it in the catalogue
+            y = result.pop('force')
+            print(f'THE FINAL VALUE OF THE FORCE AT {x}:')
+            print(y)
+            optimizer.tell(x, y)
+            prepared_lengths.add(x[0])
+            point_id = catalogue.add(x[0], x[1], y, source='optimiser', **result)
+            print(f"Recorded as point {point_id} in the results catalogue")
+
+executor.shutdown()
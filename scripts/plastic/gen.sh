@@ -10,7 +10,12 @@
 # -d: distance between the molecule and the edge of the box, 1.5 nm by default
 # -c: concentration of NaCl, by default 150 mM
 # -r: molecules which are replaced with ions during GROMACS pre-processing, by default SOL
+# -t: assemble the topology from residue templates (scripts/bpns/topology.py) instead of running tleap and acpype for this length; useful for long chains.
+#     The templates are made once (tleap and acpype of chains with 6 and 7 residues) and cached. Chains shorter than 6 residues are built with tleap
+#     also with -t, and so is a chain whose assembly fails. The plastic is cached separately for each way of building it.
 # this sctipt generated a prep.log file which contains the outputs and potential error messages of GROMACS commands
+# The parametrised monomers (.prepi files) and the built plastic (plastic.itp and the equilibrated plastic.pdb) are kept in a cache shared by all campaigns (scripts/bpns/buildcache.py, by default in ~/.cache/bpns).
+# The cache entries are keyed by the input files and parameters, so the charge calculation and the plastic equilibration only run once for the same inputs.
 
 # path to the cloned repo
 # change according to your placement of the folder!
@@ -20,6 +25,7 @@ proj_path="$HOME/project/"
 dist=1.5
 ion_conc=0.15
 ion_repl='SOL'
+assemble=0
 plast=""
 len=0
 
@@ -27,13 +33,14 @@ len=0
 gmx_mpi="/home/spack-user/spack/opt/spack/linux-centos7-zen3/aocc-3.1.0/gromacs-2020.4-z7lmmyeup2uhxfy2mr3bwi2dt6k4grzy/bin/gmx_mpi"
 
 # get script parameters
-while getopts "p:l:d:c:r:" opt; do
+while getopts "p:l:d:c:r:t" opt; do
 case $opt in
 	p) plast="$OPTARG" ;;
 	l) len=$OPTARG ;;
 	d) dist=$OPTARG ;;
 	c) ion_conc=$OPTARG ;;
 	r) ion_repl=$OPTARG ;;
+	t) assemble=1 ;;
 	?) echo "Invalid option: -$OPTARG" ;;
 	:) echo "Arguments -p and -l must be given"; exit 1 ;;
 esac
@@ -61,26 +68,14 @@ head2="h${plast:1:1}c"
 tail2="t${plast:1:1}c"
 norm2="${plast}c"
 
-# prepare standard residues
-antechamber -fi mol2 -fo ac -i ${struct1}.mol2 -o ${struct1}.ac -c bcc -pf y
-prepgen -i ${struct1}.ac -o ${norm1}.prepi -f prepi -m mainchain.${norm1} -rn ${norm1^^} -rf ${norm1}.res
-prepgen -i ${struct1}.ac -o ${head1}.prepi -f prepi -m mainchain.${head1} -rn ${head1^^} -rf ${head1}.res
-prepgen -i ${struct1}.ac -o ${tail1}.prepi -f prepi -m mainchain.${tail1} -rn ${tail1^^} -rf ${tail1}.res
-rm ${struct1}.ac
-
-# prepare carboxylated residues
-antechamber -fi mol2 -fo ac -i ${struct2}.mol2 -o ${struct2}.ac -c bcc -pf y
-prepgen -i ${struct2}.ac -o ${norm2}.prepi -f prepi -m mainchain.${norm2} -rn ${norm2^^} -rf ${norm2}.res
-prepgen -i ${struct2}.ac -o ${head2}.prepi -f prepi -m mainchain.${head2} -rn ${head2^^} -rf ${head2}.res
-prepgen -i ${struct2}.ac -o ${tail2}.prepi -f prepi -m mainchain.${tail2} -rn ${tail2^^} -rf ${tail2}.res
-rm ${struct2}.ac
-
+# build a chain of length $1 with tleap and convert it with acpype, the output goes to the folder $2
+tleap_build() {
 # generate the sequence
 # start with the normal head
 echo "{ ${head1^^}" > poly
 
 # middle residues
-(( mid=(${len}-2) ))
+(( mid=(${1}-2) ))
 echo ${mid}
 for ((res=1; res<=${mid}; res++))
 do
@@ -124,8 +119,82 @@ echo "quit" >> tleap.in
 # polymerize the monomers
 tleap -s -f tleap.in > tleap.out
 
-acpype -p poly.top -x poly.crd -b ${struct1}${len}
-mv ${struct1}${len}.amb2gmx ${struct1}${len}
+acpype -p poly.top -x poly.crd -b ${2}
+mv ${2}.amb2gmx ${2}
+}
+
+# assemble the topology from residue templates (scripts/bpns/topology.py) instead of running tleap and acpype for this length
+# the templates are made once per set of monomers from two short chains, one of each parity, and kept in the cache
+assemble_plastic() {
+if ! $cache get templates $monomer_key . templates.json; then
+tleap_build 6 ref6 && tleap_build 7 ref7 || return 1
+python3 -m bpns.topology templates ref6 ref7 -o templates.json || return 1
+$cache put templates $monomer_key . templates.json
+rm -r ref6 ref7
+fi
+python3 -m bpns.topology build templates.json -p $plast -l $len -o ${struct1}${len}
+status=$?
+rm templates.json
+# a failed build must not leave a partial folder, tleap_build moves its output to the same folder name
+if [ $status -ne 0 ]; then
+rm -rf ${struct1}${len}
+fi
+return $status
+}
+
+# cache keys of the monomers and of the plastic
+cache="python3 -m bpns.buildcache"
+export PYTHONPATH=$proj_path/scripts:$PYTHONPATH
+prepi_files="${norm1}.prepi ${head1}.prepi ${tail1}.prepi ${norm2}.prepi ${head2}.prepi ${tail2}.prepi"
+monomer_key=$($cache key monomers -p $plast) || exit 1
+# the build mode is part of the plastic key: a plastic built by tleap is not reused for an assembled one, and vice versa
+build=tleap
+if [ $assemble -eq 1 ] && [ $len -ge 6 ]; then
+build=assembled
+fi
+plastic_cache_key() {
+$cache key plastic -p $plast -l $len -d $dist -c $ion_conc -r $ion_repl --build $1 --monomers $monomer_key --files $proj_path/mdps/plastic/*
+}
+plastic_key=$(plastic_cache_key $build) || exit 1
+
+# if this plastic was built before (in any campaign), only the folders are set up
+if $cache get plastic $plastic_key ${struct1}${len}/plastic plastic.itp md/plastic.pdb; then
+cached_plastic=1
+cd ${struct1}${len}
+else
+cached_plastic=0
+
+# the monomers are parametrised only if they are not in the cache
+if ! $cache get monomers $monomer_key . $prepi_files; then
+
+# prepare standard residues
+antechamber -fi mol2 -fo ac -i ${struct1}.mol2 -o ${struct1}.ac -c bcc -pf y
+prepgen -i ${struct1}.ac -o ${norm1}.prepi -f prepi -m mainchain.${norm1} -rn ${norm1^^} -rf ${norm1}.res
+prepgen -i ${struct1}.ac -o ${head1}.prepi -f prepi -m mainchain.${head1} -rn ${head1^^} -rf ${head1}.res
+prepgen -i ${struct1}.ac -o ${tail1}.prepi -f prepi -m mainchain.${tail1} -rn ${tail1^^} -rf ${tail1}.res
+rm ${struct1}.ac
+
+# prepare carboxylated residues
+antechamber -fi mol2 -fo ac -i ${struct2}.mol2 -o ${struct2}.ac -c bcc -pf y
+prepgen -i ${struct2}.ac -o ${norm2}.prepi -f prepi -m mainchain.${norm2} -rn ${norm2^^} -rf ${norm2}.res
+prepgen -i ${struct2}.ac -o ${head2}.prepi -f prepi -m mainchain.${head2} -rn ${head2^^} -rf ${head2}.res
+prepgen -i ${struct2}.ac -o ${tail2}.prepi -f prepi -m mainchain.${tail2} -rn ${tail2^^} -rf ${tail2}.res
+rm ${struct2}.ac
+$cache put monomers $monomer_key . $prepi_files
+fi
+
+# build the topology: assembled from the residue templates (-t), or with tleap and acpype
+# the assembler is only used for chains of at least 6 residues, like the reference chains of the templates
+if [ $build = assembled ] && assemble_plastic; then
+echo "Topology of ${struct1}${len} assembled from the residue templates"
+else
+tleap_build ${len} ${struct1}${len}
+# a failed assembly falls back to tleap, the plastic is cached as built by tleap
+if [ $build = assembled ]; then
+build=tleap
+plastic_key=$(plastic_cache_key $build) || exit 1
+fi
+fi
 cd ${struct1}${len}
 
 # GROMACS PREPARATION PART
@@ -133,6 +202,8 @@ cd ${struct1}${len}
 # create the directories for future computations
 mkdir plastic
 mv * plastic/
+fi
+
 mkdir prot_pl
 cd prot_pl
 mkdir md
@@ -140,15 +211,25 @@ mkdir plumed
 
 # put all other required files here
 # set up systems for the next steps
-cp $proj_path/protein/* .
+# topol.top is changed in the next steps, so it is copied; the large protein .itp files are links to the shared asset store (scripts/bpns/assets.py)
+cp $proj_path/protein/topol.top $proj_path/protein/protein.pdb .
+python3 -m bpns.assets link $proj_path/protein/*.itp . || exit 1
 cp $proj_path/scripts/prot_plastic/put_together.py .
 cp $proj_path/scripts/prot_plastic/prep_prot_pl.sh .
 cp $proj_path/scripts/prot_plastic/prep_umb.sh plumed/.
+cp $proj_path/scripts/prot_plastic/prep_pull.sh plumed/.
 cp $proj_path/scripts/prot_plastic/get_force.py plumed/.
 
 cd ../plastic/
+
+# a cached plastic is already equilibrated
+if [ $cached_plastic -eq 1 ]; then
+echo "Plastic ${struct1}${len} taken from the cache"
+exit 0
+fi
+
 cp $proj_path/mdps/plastic/* .
-cp -r $proj_path/charmm27.ff .
+python3 -m bpns.assets link $proj_path/charmm27.ff . || exit 1
 mkdir md
 mv simulate_plastic.sh md.mdp md/.
 
@@ -200,3 +281,6 @@ srun --mpi=pmix $gmx_mpi mdrun -deffnm md -v >& md.out
 echo 'q' | srun --mpi=pmix $gmx_mpi make_ndx -f md.tpr -o index.ndx
 echo 'Other' | srun --mpi=pmix $gmx_mpi editconf -f md.gro -n index.ndx -o plastic.pdb
 
+# save the plastic for other campaigns
+cd ..
+$cache put plastic $plastic_key . plastic.itp md/plastic.pdb
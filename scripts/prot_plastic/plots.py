@@ -10,133 +10,72 @@
 # - radius of gyration of the protein
 # - COM separation of the protein
 # The plot is saved as param_check.png file.
-# Adjust the times below (t, t2 parameter), depending on your simulation settings.
+# The times are taken from the .xvg files, so nothing needs to be adjusted for different simulation settings.
+# The COM separation is read from com.xvg (written by simulate.sh, see scripts/bpns/trajectory.py); for older runs it is computed from dry.xtc,
+# streamed in chunks, with the protein chains taken from the topology.
+# Usage:
+# - ./plots.py: plots the simulation in the current folder (as before)
+# - ./plots.py run1 run2 ... -j 8: plots several simulation folders at the same time (8 processes), each param_check.png is saved in its folder
 
 # libraries
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import numpy as np
-import mdtraj as md
 
-# time definition, second one for RMSD, gyr and COM because based on xtc
-# please adjust according to your simulation settings
-t = np.arange(0, 200002, 2)
-t2 = np.arange(0, 200002, 500)
-
-# PE
-xvg_pe = open('pe.xvg', 'r')
-pe = np.empty(0)
-
-for line in xvg_pe:
-    datapoints = line.strip().split()
-    pe = np.append(pe, float(datapoints[1]))
-
-xvg_pe.close()
-
-# KE
-xvg_ke = open('ke.xvg', 'r')
-ke = np.empty(0)
-
-for line in xvg_ke:
-    datapoints = line.strip().split()
-    ke = np.append(ke, float(datapoints[1]))
-
-xvg_ke.close()
-
-# RMSD protein
-xvg_rmsd_prot = open('rmsd_prot.xvg', 'r')
-rmsd_prot = np.empty(0)
-
-for line in xvg_rmsd_prot:
-    datapoints = line.strip().split()
-    rmsd_prot = np.append(rmsd_prot, float(datapoints[1]))
-
-xvg_rmsd_prot.close()
-
-# RMSD plastic
-xvg_rmsd_pl = open('rmsd_pl.xvg', 'r')
-rmsd_pl = np.empty(0)
-
-for line in xvg_rmsd_pl:
-    datapoints = line.strip().split()
-    rmsd_pl = np.append(rmsd_pl, float(datapoints[1]))
-
-xvg_rmsd_pl.close()
-
-# radius of gyration
-xvg_gyr = open('gyr.xvg', 'r')
-gyr = np.empty(0)
-
-for line in xvg_gyr:
-    datapoints = line.strip().split()
-    gyr = np.append(gyr, float(datapoints[1]))
-
-xvg_gyr.close()
-
-# COM separation
-traj = md.load('dry.xtc',top='dry.gro')
-ch1 = 'index 1 to 1689'
-ch2 = 'index 1690 to 3378'
-com1 = md.compute_center_of_mass(traj, select=ch1)
-com2 = md.compute_center_of_mass(traj, select=ch2)
-com_sep = np.sqrt(np.sum((com2-com1)**2, axis=1))
-
-# Temperature
-xvg_temp = open('temp.xvg', 'r')
-temp = np.empty(0)
-
-for line in xvg_temp:
-    datapoints = line.strip().split()
-    temp = np.append(temp, float(datapoints[1]))
-
-xvg_temp.close()
-
-# pressure
-xvg_pres = open('pres.xvg', 'r')
-pres = np.empty(0)
-
-for line in xvg_pres:
-    datapoints = line.strip().split()
-    pres = np.append(pres, float(datapoints[1]))
-
-xvg_pres.close()
-
-
-
-# plotting everything
-
-fig, axs = plt.subplots(4, 2, figsize=(14,28))
-ax = axs.flat
-
-ax[0].set_xlabel('Simulation time / ps')
-ax[0].set_ylabel('Potential energy / kJ mol-1')
-ax[0].plot(t, pe, color='black', linewidth=0.4) 
-
-ax[1].set_xlabel('Simulation time / ps')
-ax[1].set_ylabel('Kinetic energy / kJ mol-1')
-ax[1].plot(t, ke, color='black', linewidth=0.4) 
-
-ax[2].set_xlabel('Simulation time / ps')
-ax[2].set_ylabel('Temperature / K')
-ax[2].plot(t, temp, color='black', linewidth=0.4)
-
-ax[3].set_xlabel('Simulation time / ps')
-ax[3].set_ylabel('Pressure / bar')
-ax[3].plot(t, pres, color='black', linewidth=0.4)
-
-ax[4].set_xlabel('Simulation time / ps')
-ax[4].set_ylabel("Protein C_alpha RMSD / nm")
-ax[4].plot(t2, rmsd_prot, color='black', linewidth=0.4)
-
-ax[5].set_xlabel('Simulation time / ps')
-ax[5].set_ylabel("Plastic RMSD / nm")
-ax[5].plot(t2, rmsd_pl, color='black', linewidth=0.4)
-
-ax[6].set_xlabel('Simulation time / ps')
-ax[6].set_ylabel('Radius of gyration / nm')
-ax[6].plot(t2, gyr, color='black', linewidth=0.4)
-
-ax[7].set_xlabel('Simulation time / ps')
-ax[7].set_ylabel('COM separation / nm')
-ax[7].plot(t2, com_sep, color='black', linewidth=0.4)
-
-plt.savefig('param_check.png')
+# path to cloned repo, needed for the shared .xvg reader and trajectory analysis in scripts/bpns
+proj_path = os.path.expandvars('$HOME/project')
+sys.path.append(proj_path + '/scripts')
+from bpns.xvg import read_series
+from bpns.trajectory import com_separation
+
+# .xvg files written by simulate.sh and the axis labels of their plots, in the order of the panels
+xvg_panels = [('pe.xvg', 'Potential energy / kJ mol-1'),
+              ('ke.xvg', 'Kinetic energy / kJ mol-1'),
+              ('temp.xvg', 'Temperature / K'),
+              ('pres.xvg', 'Pressure / bar'),
+              ('rmsd_prot.xvg', 'Protein C_alpha RMSD / nm'),
+              ('rmsd_pl.xvg', 'Plastic RMSD / nm'),
+              ('gyr.xvg', 'Radius of gyration / nm')]
+
+def param_check(folder='.', output='param_check.png'):
+    '''Creates the plots for the simulation in folder and saves them to folder/output; returns the path of the figure.'''
+    series = [read_series(os.path.join(folder, name)) for name, _ in xvg_panels]
+    if os.path.exists(os.path.join(folder, 'com.xvg')):
+        series.append(read_series(os.path.join(folder, 'com.xvg')))
+    else:
+        series.append(com_separation(folder))
+    labels = [label for _, label in xvg_panels] + ['COM separation / nm']
+
+    # plotting everything
+    fig, axs = plt.subplots(4, 2, figsize=(14,28))
+    for ax, (t, y), label in zip(axs.flat, series, labels):
+        ax.set_xlabel('Simulation time / ps')
+        ax.set_ylabel(label)
+        ax.plot(t, y, color='black', linewidth=0.4)
+
+    path = os.path.join(folder, output)
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plots energies, RMSDs, radius of gyration and COM separation of finished simulations.')
+    parser.add_argument('folders', nargs='*', default=['.'], help='simulation folders (default: current folder)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of folders plotted at the same time')
+    args = parser.parse_args()
+
+    if len(args.folders) == 1:
+        print(param_check(args.folders[0]))
+    else:
+        # one process per folder, a failed folder does not stop the others
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = {folder: pool.submit(param_check, folder) for folder in args.folders}
+            for folder, future in futures.items():
+                try:
+                    print(future.result())
+                except Exception as err:
+                    print(f"{folder}: {err}")
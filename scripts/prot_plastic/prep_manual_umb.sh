@@ -4,6 +4,12 @@
 # It is not included in the optimiser and should be used manually.
 # Important! Remember to change the project path, otherwise required wiles will not be copied
 # Time-related parameters will be saved in params.log file
+# The windows can be given as arguments instead of the default 1.6, 2.1, ..., 6.6, e.g. to add windows chosen by the adaptive driver (scripts/bpns/adaptive.py)
+# With -e <ns>, the given windows (already run) are extended by <ns> ns instead: the run continues from its state.cpt and PLUMED appends to COLVAR
+# Usage:
+# ./prep_manual_umb.sh
+# ./prep_manual_umb.sh 2.35 4.85
+# ./prep_manual_umb.sh -e 25 3.1 4.6
 
 # path to cloned repo
 proj_path="$HOME/project"
@@ -17,6 +23,31 @@ timestep_ns=0.000002
 # step at which equilibration is completed and restarted for umbrella sampling
 restart_step=50000000
 
+# windows to extend (-e) or to prepare (arguments, by default every 0.5 nm)
+extend_ns=""
+while getopts "e:" opt; do
+case $opt in
+	e) extend_ns=$OPTARG ;;
+esac
+done
+shift $((OPTIND-1))
+windows=${@:-$(seq 1.6 0.5 6.6)}
+
+if [ -n "$extend_ns" ]; then
+for i in $windows; do
+cd $i
+gmx convert-tpr -s 75ns.tpr -extend $(echo "${extend_ns} * 1000 / 1" | bc) -o extended.tpr
+mv extended.tpr 75ns.tpr
+cp state.cpt md.cpt
+grep -q "^RESTART" plumed.dat || sed -i "1i RESTART" plumed.dat
+# COLVAR is continued, so it must also be copied to the node (scripts/bpns/assets.py)
+grep -q '"COLVAR"' umbrella_manifest.json || sed -i 's/"inputs": \[/"inputs": ["COLVAR", /' umbrella_manifest.json
+echo "extended by ${extend_ns} ns" >> params.log
+cd ../
+done
+exit 0
+fi
+
 # copy the tpr file
 cp ../md/md.tpr .
 cp ../md/md.cpt .
@@ -25,12 +56,12 @@ cp ../md/md.cpt .
 gmx convert-tpr -s md.tpr -extend 75000 -o 75ns.tpr
 
 # loop over umbrellas and prepare each system
-for i in $(seq 1.6 0.5 6.6); do
+for i in $windows; do
 mkdir $i
 cd $i
 cp ../75ns.tpr .
 cp ../md.cpt . 
-cp $proj_path/plumed_files/* .
+cp $proj_path/plumed_files/{plumed.dat,simulate_plumed.sh,umbrella_manifest.json,*gpu_umbrella} .
 
 # set plumed.dat
 # save calculated params for debugging
@@ -46,9 +46,9 @@ fi
 # set up the structure
 cp $proj_path/mdps/prot_plastic/* .
 
-# Copy a correct set of input files and the modified forcefield
+# Copy a correct set of input files, the modified forcefield is a link to the shared asset store (scripts/bpns/assets.py)
 cp ../plastic/plastic.itp .
-cp -r $proj_path/charmm27.ff .
+PYTHONPATH=$proj_path/scripts python3 -m bpns.assets link $proj_path/charmm27.ff . || exit 1
 
 # change the topol.top file so that the plastic molecule is added
 # the plastic needs to be added to the [molecules] section to the last line
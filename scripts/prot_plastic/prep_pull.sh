@@ -0,0 +1,26 @@
+#!/bin/bash
+
+# Script running a single steered pull for one plastic length, from which all umbrella windows of that length are seeded (prep_umb.sh <COM> seed)
+# Runs in the optimiser (in the plumed folder of the length) if seed_from_pull is set in optimize.py, can also be used manually
+# The pull goes from 1.6 nm to max_cv once; coordinates and velocities are saved every frame_ps and indexed by COM separation in pull/frames.json (see scripts/bpns/pull.py)
+# Windows beyond max_cv cannot be seeded, so max_cv should cover the COM range of the optimiser
+# Important! Change the path to the cloned repo
+
+# path to cloned repo
+proj_path="$HOME/project"
+
+# pulling velocity (nm/ns)
+vel=0.35
+
+# COM separation at the end of the pull (nm)
+max_cv=6.6
+
+# time between saved frames (ps)
+frame_ps=10
+
+# load the gromacs executable, used by bpns.pull through the GMX variable
+gmx_mpi="/home/spack-user/spack/opt/spack/linux-centos7-zen3/aocc-3.1.0/gromacs-2020.4-z7lmmyeup2uhxfy2mr3bwi2dt6k4grzy/bin/gmx_mpi"
+export GMX="srun --mpi=pmix $gmx_mpi"
+
+# the protein-plastic folder is one level up, the pull is run in pull/
+PYTHONPATH=$proj_path/scripts python3 -m bpns.pull pull .. --folder pull --max-cv $max_cv --vel $vel --frame-ps $frame_ps --template $proj_path/plumed_files/plumed.dat
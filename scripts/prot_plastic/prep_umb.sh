@@ -3,7 +3,9 @@
 # Script preparing the system for umbrella sampling and running it
 # Runs in the optimiser
 # Assumes that umbrella sampling is intended to last 50 ns
+# The run is followed by the force monitor (scripts/bpns/monitor.py), which stops it early once the standard error of the force drops below max_err; the estimate is saved in FORCE_MONITOR
 # Requires one command line parameter which defines the value of COM separation to sample, taken care of by the optimiser
+# With a second parameter "seed" (./prep_umb.sh 3.35 seed), the window is not pulled from md.cpt but seeded from the closest frame of the single pull of this length (prep_pull.sh, scripts/bpns/pull.py) and sampled with a static restraint for the whole 50 ns
 # Important! Change the path to the cloned repo
 
 # path to cloned repo
@@ -18,22 +20,36 @@ timestep_ns=0.000002
 # step at which equilibration is completed and restarted for umbrella sampling
 restart_step=50000000
 
-# copy the tpr and cpt file
-cp ../md/md.tpr .
-cp ../md/md.cpt .
+# standard error of the force (kcal/mol/nm) at which the run is stopped early, set to 0 to always run the full 50 ns
+max_err=0.5
+
+# time (ns) after pulling during which the system equilibrates at the umbrella centre, forces are only collected afterwards
+equil_ns=10
 
 # load the gromacs executable
 gmx_mpi="/home/spack-user/spack/opt/spack/linux-centos7-zen3/aocc-3.1.0/gromacs-2020.4-z7lmmyeup2uhxfy2mr3bwi2dt6k4grzy/bin/gmx_mpi"
 
-# prepare the tpr file, extending the simulation by 50 ns
-srun --mpi=pmix $gmx_mpi convert-tpr -s md.tpr -extend 50000 -o 50ns.tpr
+if [ "$2" == "seed" ]; then
+# prepare the window from the pull frame closest to the COM separation (umbrella.tpr and plumed.dat with a static restraint)
+export GMX="srun --mpi=pmix $gmx_mpi"
+PYTHONPATH=$proj_path/scripts python3 -m bpns.pull seed .. $1 --folder $1 --pull-folder pull --template $proj_path/plumed_files/plumed.dat || exit 1
+cd $1
+time_ns=0
 
+# perform the biased simulation
+srun --mpi=pmix $gmx_mpi mdrun -s umbrella.tpr -plumed plumed.dat -noappend >& plumed.out &
+mdrun_pid=$!
+else
 # prepare the results folder, copy required files
-mkdir $1
+# everything is done inside the results folder, so that several umbrellas of the same length can be prepared at the same time
+mkdir -p $1
 cd $1
-cp ../50ns.tpr .
-cp ../md.cpt . 
-cp $proj_path/plumed_files/* .
+cp ../../md/md.tpr .
+cp ../../md/md.cpt .
+cp $proj_path/plumed_files/plumed.dat .
+
+# prepare the tpr file, extending the simulation by 50 ns
+srun --mpi=pmix $gmx_mpi convert-tpr -s md.tpr -extend 50000 -o 50ns.tpr
 
 # set plumed.dat
 # save calculated params for debugging
@@ -46,7 +62,17 @@ echo "step: ${step}" >> params.log
 sed -i "15s/.*/   STEP1=${step}  AT1=$1/" plumed.dat
 
 # perform the biased simulation
-srun --mpi=pmix $gmx_mpi mdrun -s 50ns.tpr -cpi md.cpt -plumed plumed.dat -noappend >& plumed.out
+srun --mpi=pmix $gmx_mpi mdrun -s 50ns.tpr -cpi md.cpt -plumed plumed.dat -noappend >& plumed.out &
+mdrun_pid=$!
+fi
+
+# follow the force while the simulation runs and stop it once converged
+if (( $(echo "${max_err} > 0" | bc) )); then
+start=$(echo "(${time_ns} + ${equil_ns}) * 1000 / 1" | bc)
+echo "force monitor starts at sample: ${start}" >> params.log
+PYTHONPATH=$proj_path/scripts python3 -m bpns.monitor COLVAR --pid $mdrun_pid --threshold $max_err --start $start &> monitor.log
+fi
+wait $mdrun_pid
 
 # clean up
-rm 50ns.tpr md.cpt md.tpr
+rm -f 50ns.tpr md.cpt md.tpr umbrella.tpr
@@ -1,33 +1,29 @@
 #!/usr/bin/env python3
 
 # This script puts the plastic and the protein together in an optimal non-overlapping position, applying translations and random rotations of the plastic.
+# Everything is done in memory: the protein heavy atoms are put in a spatial index (k-d tree) once, and for each tested distance a whole batch of random rotations of the plastic is checked at the same time.
+# The smallest distance at which a non-overlapping rotation exists is searched by bisection (to 0.001 nm), and only the final structure is written to conf.pdb.
 
 # import all the libraries
 import mdtraj as md
 import numpy as np
 import os
+import tempfile
+from scipy.spatial import cKDTree
 
-def move_plastic(prot_struct="protein.pdb", pl_struct="plastic.pdb", output="moved_plastic.pdb", length=3):
-
-    ''' 
-    Translates the plastic so that it is positioned near the protein and the binding spot within a specified distance from the protein. 
-    - prot_struct, pl_struct: names of the protein and plastic coordinate files (allowed format: .pdb / .gro), respectively. They must be placed in the same directory.
-    - output: the name of the moved output structure (.pdb).
-    - length: distance (in nm) from the geometric centres of proteins.
+def placement_axis(protein):
+    '''
+    Defines where the plastic is placed: returns the geometric centre of chain B and the unit vector perpendicular to the plane above which the plastic should be placed.
+    - protein: mdtraj trajectory of the protein
     '''
-    
-    # load the structures
-    protein = md.load(prot_struct)
-    plastic = md.load(pl_struct)
     top_protein = protein.top
     chainA = top_protein.select("chainid == 0")
     chainB = top_protein.select("chainid == 1")
 
     # compute the geometric centres
-    center_plastic = md.compute_center_of_geometry(plastic)
     centerA = md.compute_center_of_geometry(protein.atom_slice(chainA))
     centerB = md.compute_center_of_geometry(protein.atom_slice(chainB))
-    
+
     # vectors defining the plane above which the plastic should be placed
     end1 = top_protein.select("resid 17 and name CA")
     coord1 = protein.xyz[-1:, end1, :]
@@ -36,58 +32,86 @@ def move_plastic(prot_struct="protein.pdb", pl_struct="plastic.pdb", output="mov
     prot_vec1 = centerA - centerB
     prot_vec2 = coord2 - coord1
 
-    # cross product with z unit vector to define a perpendicular vector, then make it an appropriate length
-    perp = np.cross(prot_vec1, prot_vec2)
-    perp_scaled = (perp * length) / np.linalg.norm(perp)
+    # cross product to define a perpendicular vector, scaled to unit length
+    perp = np.cross(prot_vec1, prot_vec2).reshape(3)
+    return centerB.reshape(3), perp / np.linalg.norm(perp)
 
-    # define the coordinates of the new center of geometry of the plastic 
-    new_center = centerB + perp_scaled
+def random_rotations(n, rng):
+    '''
+    Returns n random rotation matrices (n x 3 x 3): rotations around x, then y, then z by random integer angles in degrees.
+    '''
+    ax, ay, az = np.radians(rng.integers(0, 360, size=(3, n)))
+    c, s = np.cos, np.sin
+    one, zero = np.ones(n), np.zeros(n)
 
-    # calculate by how much the plastic center of geometry needs to move to get to the new one defined by the cross product
-    move_vec = new_center - center_plastic
+    # define rotation matrices
+    rot_x = np.stack([one, zero, zero, zero, c(ax), -s(ax), zero, s(ax), c(ax)], axis=1).reshape(n, 3, 3)
+    rot_y = np.stack([c(ay), zero, s(ay), zero, one, zero, -s(ay), zero, c(ay)], axis=1).reshape(n, 3, 3)
+    rot_z = np.stack([c(az), -s(az), zero, s(az), c(az), zero, zero, zero, one], axis=1).reshape(n, 3, 3)
+    return rot_z @ rot_y @ rot_x
 
-    # move plastic
-    plastic.xyz += move_vec
-    plastic.save_pdb(output)
+def free_rotation(tree, plastic_xyz, center, rotations, cutoff_d=0.5):
+    '''
+    Checks a batch of rotations of the plastic placed at a given centre. Returns the coordinates of the first rotation which does not overlap with the protein, or None.
+    - tree: k-d tree of the protein heavy atoms
+    - plastic_xyz: plastic coordinates with the geometric centre at the origin (n_atoms x 3)
+    - center: new geometric centre of the plastic
+    - rotations: rotation matrices (n_rotations x 3 x 3)
+    - cutoff_d: the structures overlap if any plastic atom is closer than this to a protein heavy atom (nm)
+    '''
+    coords = np.einsum('rij,aj->rai', rotations, plastic_xyz) + center
 
-    return perp, perp_scaled, move_vec
+    # distance of each plastic atom to its nearest protein heavy atom, infinite if further than the cutoff
+    dist, _ = tree.query(coords.reshape(-1, 3), distance_upper_bound=cutoff_d)
+    overlap = np.isfinite(dist).reshape(len(rotations), -1).any(axis=1)
+    free = np.nonzero(~overlap)[0]
+    return coords[free[0]] if free.size else None
 
-def rotate_plastic(pl_struct="moved_plastic.pdb", axis="x", angle=90, output="rotated.pdb"):
+def place_plastic(protein, plastic, start=2.5, tol=0.001, n_rot=64, cutoff_d=0.5, rng=None):
     '''
-    Rotates the plastic along a specified axis (x, y, z) by a specified angle in degrees.
+    Finds the smallest distance (from the centre of chain B along the placement axis, starting at start nm) at which some random rotation of the plastic does not overlap with the protein.
+    The distance is first increased in growing steps until a free rotation is found, then refined by bisection to tol nm.
+    For each tested distance, n_rot random rotations are checked at once.
+    Returns the distance and the plastic coordinates (n_atoms x 3).
     '''
-    # load everything
-    plastic = md.load(pl_struct)
-    angle_rad = np.radians(angle)
-
-    # bring the geometrical center of the plastic molecule to the origin so that the rotations don't happen together with large translations
-    center_plastic = md.compute_center_of_geometry(plastic)
-    plastic.xyz -= center_plastic
-    
-    # define rotation matrices
-    if axis == "x":
-        rot_mat = np.array([[1, 0, 0], [0, np.cos(angle_rad), -np.sin(angle_rad)], [0, np.sin(angle_rad), np.cos(angle_rad)]])
-    elif axis == "y":
-        rot_mat = np.array([[np.cos(angle_rad), 0, np.sin(angle_rad)], [0, 1, 0], [-np.sin(angle_rad), 0, np.cos(angle_rad)]])
-    elif axis == "z":
-        rot_mat = np.array([[np.cos(angle_rad), -np.sin(angle_rad), 0], [np.sin(angle_rad), np.cos(angle_rad), 0], [0, 0, 1]])
-    else:
-        print("Wrong axis specified: x, y or z.")
-        exit(1)
-
-    # iterate over all coordinates and multiply them by an appropriate rotation matrix
-    rot_coord = np.zeros(np.shape(plastic.xyz))
-    for i, coord in enumerate(plastic.xyz[0]):
-        rot_coord[0][i] = np.matmul(rot_mat, coord)
-
-    # replace the coordinates with the rotated ones and move the geometrical centre to the same point as before
-    plastic.xyz = rot_coord
-    plastic.xyz += center_plastic
-    plastic.save_pdb(output)
+    rng = rng or np.random.default_rng()
+
+    # spatial index of the protein heavy atoms, built only once
+    prot = protein.top.select('protein and symbol !="H"')
+    tree = cKDTree(protein.xyz[0, prot])
+
+    # plastic centred at the origin so that rotations don't happen together with large translations
+    plastic_xyz = plastic.xyz[0] - md.compute_center_of_geometry(plastic)[0]
+    centerB, axis = placement_axis(protein)
+
+    def try_length(length):
+        return free_rotation(tree, plastic_xyz, centerB + length*axis, random_rotations(n_rot, rng), cutoff_d)
+
+    # bracket the distance: lo overlaps, hi has a free rotation
+    best = try_length(start)
+    if best is not None:
+        return start, best
+    lo, step = start, 0.1
+    while True:
+        hi = lo + step
+        best = try_length(hi)
+        if best is not None:
+            break
+        lo, step = hi, step*2
+
+    # bisection between the two
+    while hi - lo > tol:
+        mid = 0.5*(lo + hi)
+        coords = try_length(mid)
+        if coords is None:
+            lo = mid
+        else:
+            hi, best = mid, coords
+    return hi, best
 
 def combine_pdbs(prot="protein.pdb", plast="rot_xyz.pdb", out="conf.pdb"):
     '''Combines the protein and plastic pdbs. Puts the protein coordinates first in the output pdb, then the plastic.'''
-    
+
     with open(prot) as protein:
         lines_protein = protein.readlines()
 
@@ -105,56 +129,19 @@ def combine_pdbs(prot="protein.pdb", plast="rot_xyz.pdb", out="conf.pdb"):
 
     plastic.close()
     new_pdb.close()
-        
-def check_overlap(struct="conf.pdb", cutoff_d=0.5):
-    '''
-    This function checks if the structures overlap, it helps to arrange the molecules in an iterative way. If molecules overlap, returns True; otherwise False.
-    '''
-    # load everything
-    comb_struct = md.load(struct)
-    top = comb_struct.top
-
-    # select protein and plastic
-    prot = top.select('protein and symbol !="H"')
-    plast = top.select('not protein')
-
-    # calculate neighbours
-    neigh = md.compute_neighbors(comb_struct, query_indices=plast, haystack_indices=prot, cutoff=cutoff_d)
-    if neigh[0].size == 0:
-        return False
-    else:
-        return True
-    
-# copy the plastic pdb from the equilibration
-os.system('cp ../plastic/md/plastic.pdb .')
-
-# iterate through different distances of the plastic geometrical centre and COM of the protein, starting from 2.5 nm and slowly increasing by 0.001 nm
-length = 2.5
-while True:
-    move_plastic(length=length)
-    rand_ang = np.random.randint(0,360)
-    rotate_plastic(pl_struct="moved_plastic.pdb",axis="x",angle=rand_ang,output="rot_x.pdb")
-    rand_ang = np.random.randint(0,360)
-    rotate_plastic(pl_struct="rot_x.pdb",axis="y",angle=rand_ang,output="rot_xy.pdb")
-    rand_ang = np.random.randint(0,360)
-    rotate_plastic(pl_struct="rot_xy.pdb",axis="z",angle=rand_ang,output="rot_xyz.pdb")
-    combine_pdbs()
-
-    # check for overlap
-    if check_overlap(cutoff_d=0.5):
-
-        # try again, as for more linear molecules we can end up with unfortunate rotations for an optimal distance
-        rand_ang = np.random.randint(0,360)
-        rotate_plastic(pl_struct="moved_plastic.pdb",axis="x",angle=rand_ang,output="rot_x.pdb")
-        rand_ang = np.random.randint(0,360)
-        rotate_plastic(pl_struct="rot_x.pdb",axis="y",angle=rand_ang,output="rot_xy.pdb")
-        rand_ang = np.random.randint(0,360)
-        rotate_plastic(pl_struct="rot_xy.pdb",axis="z",angle=rand_ang,output="rot_xyz.pdb")
-        combine_pdbs()
-        if check_overlap(cutoff_d=0.5):
-            length += 0.001
-        else:
-            break
 
-    else:
-        break
+if __name__ == '__main__':
+    # copy the plastic pdb from the equilibration
+    os.system('cp ../plastic/md/plastic.pdb .')
+
+    # find the position of the plastic, starting from 2.5 nm from the protein
+    protein = md.load("protein.pdb")
+    plastic = md.load("plastic.pdb")
+    length, coords = place_plastic(protein, plastic, start=2.5)
+    print(f"Plastic placed at {length:.3f} nm")
+
+    # write the final structure only
+    plastic.xyz[0] = coords
+    with tempfile.TemporaryDirectory() as tmp:
+        plastic.save_pdb(os.path.join(tmp, "placed_plastic.pdb"))
+        combine_pdbs(prot="protein.pdb", plast=os.path.join(tmp, "placed_plastic.pdb"), out="conf.pdb")
@@ -3,31 +3,27 @@
 # Script to run for manual calculations without the optimiser (e.g. when full free-energy profiles are determined for a plastic length)
 # Yields the trajectory and parameters helpful to analyse the simulation, exported as .xvg files
 # Also gives a post_proc.log file where any potential errors are gathered
+# GROMACS only removes the PBC (one trjconv) and writes the energies (one gmx energy call); the fitting, RMSD, RMSF, radius of gyration
+# and COM separation of the chains are computed in one pass over the dry trajectory by scripts/bpns/trajectory.py
+
+# path to the cloned repo
+proj_path="$HOME/project/"
 
 # run the simulation
 srun --mpi=pmix gmx_mpi mdrun -deffnm md >& md.out
 
-# convert trajectory to remove PBC, rotations and translations
+# remove PBC from the protein, ions and plastic (dry part of the system), one frame every 100 ps
 echo -e '"Protein" | 13 | "Other" \nq ' | srun --mpi=pmix gmx_mpi make_ndx -f md.tpr -o dry.ndx &> post_proc.log
-echo "Protein_CAL_Other Protein System" | srun --mpi=pmix gmx_mpi trjconv -f md.xtc -s md.tpr -dt 100 -pbc cluster -center -o cluster.xtc -n dry.ndx &>> post_proc.log
-echo "Protein Protein_CAL_Other" | srun --mpi=pmix gmx_mpi trjconv -f cluster.xtc -n dry.ndx -s md.tpr -o dry.xtc -fit rot+trans &>> post_proc.log
-
-# create first snapshot for VMD
-echo "Protein_CAL_Other " | srun --mpi=pmix gmx_mpi trjconv -f cluster.xtc -s md.tpr -o dry.gro -dump 0 -n dry.ndx &>> post_proc.log
+echo "Protein_CAL_Other Protein Protein_CAL_Other" | srun --mpi=pmix gmx_mpi trjconv -f md.xtc -s md.tpr -dt 100 -pbc cluster -center -o cluster.xtc -n dry.ndx &>> post_proc.log
 
-# calculate RMSD and RMSF
-echo -e '3\n3' | srun --mpi=pmix gmx_mpi rms -f cluster.xtc -s md.tpr -o rmsd_prot.xvg -xvg none &>> post_proc.log
-echo -e 'Other\nOther' | srun --mpi=pmix gmx_mpi rms -f cluster.xtc -s md.tpr -o rmsd_pl.xvg -xvg none &>> post_proc.log
-echo 'Protein' | srun --mpi=pmix gmx_mpi rmsf -f cluster.xtc -s md.tpr -o rmsf_prot.xvg -xvg none &>> post_proc.log
-echo 'Other' | srun --mpi=pmix gmx_mpi rmsf -f md.xtc -s md.tpr -o rmsf_pl.xvg -xvg none &>> post_proc.log
+# create first snapshot for VMD (also the structure file of the dry trajectory)
+echo "Protein_CAL_Other" | srun --mpi=pmix gmx_mpi convert-tpr -s md.tpr -n dry.ndx -o dry.tpr &>> post_proc.log
+echo "System" | srun --mpi=pmix gmx_mpi trjconv -f cluster.xtc -s dry.tpr -o dry.gro -dump 0 &>> post_proc.log
 
-# calculate radius of gyration
-echo -e 'Protein\n' | srun --mpi=pmix gmx_mpi gyrate -f cluster.xtc -s md.tpr -o gyr.xvg -xvg none &>> post_proc.log
+# p, T, pe, ke in one pass over the energy file (split into pres.xvg, temp.xvg, pe.xvg and ke.xvg by the analysis below)
+echo -e 'Potential\nKinetic-En.\nTemperature\nPressure\n\n' | srun --mpi=pmix gmx_mpi energy -f md.edr -o energy.xvg &>> post_proc.log
 
-# calculate p, T, pe, ke
-echo 'Pressure' | srun --mpi=pmix gmx_mpi energy -f md.edr -o pres.xvg -xvg none &>> post_proc.log
-echo 'Temperature' | srun --mpi=pmix gmx_mpi energy -f md.edr -o temp.xvg -xvg none &>> post_proc.log
-echo 'Potential' | srun --mpi=pmix gmx_mpi energy -f md.edr -o pe.xvg -xvg none &>> post_proc.log
-echo 'Kinetic-En.' | srun --mpi=pmix gmx_mpi energy -f md.edr -o ke.xvg -xvg none &>> post_proc.log
+# fitted trajectory (dry.xtc), RMSD, RMSF, radius of gyration and COM separation of the chains, in one pass
+PYTHONPATH=$proj_path/scripts python3 -m bpns.trajectory . &>> post_proc.log
 
-rm cluster.xtc
+rm cluster.xtc dry.tpr
@@ -0,0 +1,21 @@
+# Tests of the shared code in scripts/bpns, run from the repo folder with: python3 -m pytest tests
+# The inputs are the data of the repo itself (initial points of scripts/optimize.py, protein/topol.top) or small synthetic sets.
+
+import ast
+import os
+import sys
+
+# the scripts of this repo (bpns package) are imported from the repo itself
+repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(repo_path, 'scripts'))
+
+
+def initial_data():
+    '''The initial points and forces of scripts/optimize.py (ini_points, ini_data), read from its source without running it.'''
+    with open(os.path.join(repo_path, 'scripts', 'optimize.py')) as f:
+        tree = ast.parse(f.read())
+    values = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name) and node.targets[0].id in ('ini_points', 'ini_data'):
+            values[node.targets[0].id] = ast.literal_eval(node.value)
+    return values['ini_points'], values['ini_data']
@@ -0,0 +1,106 @@
+# Single pull per length and windows seeded from it (bpns.pull), run with a stand-in gmx given through GMX.
+
+import json
+import os
+import stat
+import sys
+import numpy as np
+import pytest
+
+from bpns.pull import pull, closest_frame, load_frames, seed
+
+# stand-in gmx: records its arguments; grompp writes the -o file, mdrun -deffnm pull writes pull.gro, pull.trr and a COLVAR
+# with the CV 0.01 nm behind the centre of the restraint, printed every ps
+fake_gmx = '''#!{python}
+import json, os, sys
+import numpy as np
+args = sys.argv[1:]
+with open({calls!r}, 'a') as f:
+    f.write(json.dumps(args) + '\\n')
+if args[0] == 'grompp':
+    open(args[args.index('-o') + 1], 'w').close()
+elif args[0] == 'mdrun':
+    name = args[args.index('-deffnm') + 1]
+    for ext in ('gro', 'trr'):
+        open(name + '.' + ext, 'w').close()
+    with open('pull.json') as f:
+        meta = json.load(f)
+    time = np.arange(0, meta['n_steps'] * meta['dt'] + 1e-6, 1.0)
+    cntr = meta['start_cv'] + (meta['max_cv'] - meta['start_cv']) * time / time[-1]
+    with open('COLVAR', 'w') as f:
+        f.write('#! FIELDS time d1 steer.bias steer.d1_cntr\\n')
+        np.savetxt(f, np.column_stack([time, cntr - 0.01, np.zeros_like(time), cntr]), fmt='%.6f')
+'''
+
+
+@pytest.fixture
+def prot_pl(tmp_path, monkeypatch):
+    # protein-plastic folder with the inputs of the pull, and GMX pointing at the stand-in
+    calls = tmp_path / 'calls.jsonl'
+    gmx = tmp_path / 'gmx'
+    gmx.write_text(fake_gmx.format(python=sys.executable, calls=str(calls)))
+    gmx.chmod(gmx.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('GMX', str(gmx))
+    folder = tmp_path / 'prot_pl'
+    (folder / 'md').mkdir(parents=True)
+    (folder / 'md.mdp').write_text('integrator = md\ndt = 0.002\nnsteps = 1000\n')
+    for name in ('topol.top', 'md/md.gro', 'md/md.cpt'):
+        (folder / name).write_text('')
+    return str(folder), calls
+
+
+def gmx_calls(calls):
+    with open(calls) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_pull_frames(prot_pl):
+    folder, calls = prot_pl
+    frames = pull(folder, max_cv=2.6, start_cv=1.6, vel=0.35, frame_ps=10)
+    n_steps = int(round(1.0 / 0.35 * 1000 / 0.002))
+    # one frame every 10 ps over the whole pull, indexed by the CV at its time
+    assert np.allclose(frames['time'], np.arange(0, n_steps * 0.002 + 1e-6, 10))
+    assert np.allclose(frames['centre'], 1.6 + 0.35 * frames['time'] / 1000, atol=1e-3)
+    assert np.allclose(frames['com'], frames['centre'] - 0.01, atol=1e-5)
+    saved = load_frames(os.path.join(folder, 'plumed', 'pull'))
+    assert all(np.allclose(saved[k], frames[k]) for k in frames)
+    assert [c[0] for c in gmx_calls(calls)] == ['grompp', 'mdrun']
+    # an indexed pull is not run again
+    pull(folder, max_cv=2.6)
+    assert len(gmx_calls(calls)) == 2
+
+
+def test_closest_frame(prot_pl):
+    folder, _ = prot_pl
+    frames = pull(folder, max_cv=2.6, frame_ps=10)
+    time, com = closest_frame(frames, 2.1)
+    assert abs(com - 2.1) <= 0.35 * 10 / 1000
+    with pytest.raises(ValueError, match='No frame of the pull within 0.05 nm'):
+        closest_frame(frames, 3.1)
+
+
+def test_seed(prot_pl):
+    folder, calls = prot_pl
+    frames = pull(folder, max_cv=2.6, frame_ps=10)
+    time, com = seed(folder, '2.1', ns=5)
+    window = os.path.join(folder, 'plumed', '2.1')
+
+    # static restraint: a MOVINGRESTRAINT with a single step at the centre of the window, with the force constant of plumed.dat
+    with open(os.path.join(window, 'plumed.dat')) as f:
+        plumed = f.read()
+    block = plumed[plumed.index('MOVINGRESTRAINT'):]
+    block = block[:block.index('\n...')]
+    steps = [line.split() for line in block.splitlines() if line.strip().startswith('STEP')]
+    assert steps == [['STEP0=0', 'AT0=2.1', 'KAPPA0=500.0']]
+
+    # grompp continues from the coordinates and velocities of the pull frame
+    grompp = gmx_calls(calls)[-1]
+    assert grompp[0] == 'grompp'
+    assert grompp[grompp.index('-c') + 1] == 'plumed/pull/pull.gro'
+    assert grompp[grompp.index('-t') + 1] == 'plumed/pull/pull.trr'
+    assert float(grompp[grompp.index('-time') + 1]) == time
+    assert time in frames['time'].tolist() and os.path.exists(os.path.join(window, 'umbrella.tpr'))
+
+    # a window beyond the end of the pull is not seeded
+    with pytest.raises(ValueError):
+        seed(folder, '3.1')
@@ -0,0 +1,69 @@
+# Batches asked from the bpns surrogate on the initial data of the optimiser.
+
+import numpy as np
+import pytest
+
+from conftest import initial_data
+from bpns.surrogate import Surrogate
+
+bounds = [(0, 40), (2.1, 5.6)]
+
+
+def check_batch(points, evaluated, n):
+    # n distinct points, none of them already evaluated, inside the bounds
+    assert len(points) == n
+    keys = [(int(x[0]), round(float(x[1]), 2)) for x in points]
+    assert len(set(keys)) == n
+    assert not set(keys) & set((int(x[0]), round(float(x[1]), 2)) for x in evaluated)
+    for x in points:
+        assert bounds[0][0] <= x[0] <= bounds[0][1] and bounds[1][0] <= x[1] <= bounds[1][1]
+
+
+@pytest.mark.parametrize('n', [1, 4, 8])
+def test_ask_new_points(n):
+    points, data = initial_data()
+    opt = Surrogate(bounds, integer=[True, False], acq_func='EI', xi=0.01, random_state=1999)
+    opt.tell(points, data)
+    check_batch(opt.ask(n), points, n)
+    # asking does not change the optimiser
+    assert len(opt.Xi) == len(points)
+
+
+def test_ask_matches_skopt():
+    # the same property as the skopt Optimizer of optimize.py on the same data
+    skopt = pytest.importorskip('skopt')
+    from skopt.space import Integer, Real
+    points, data = initial_data()
+    ref = skopt.Optimizer([Integer(*bounds[0]), Real(*bounds[1])], base_estimator='gp', n_initial_points=0, acq_func='EI',
+                          acq_optimizer='lbfgs', random_state=1999, acq_func_kwargs={'xi': 10000})
+    ref.tell(points, data)
+    check_batch(ref.ask(4), points, 4)
+    opt = Surrogate(bounds, integer=[True, False], acq_func='EI', xi=0.01, random_state=1999)
+    opt.tell(points, data)
+    check_batch(opt.ask(4), points, 4)
+
+
+def test_ask_excludes_off_grid_points():
+    # points told with more decimals than the grid are still excluded
+    points, data = initial_data()
+    opt = Surrogate(bounds, integer=[True, False], random_state=1999)
+    opt.tell(points, data)
+    first = opt.ask()
+    opt.tell([first[0], first[1] + 0.001], float(np.mean(data)))
+    assert opt.ask() != first
+
+
+def test_cost_changes_choice():
+    # the best point without a cost model is at a length which is not prepared; with the preparation costs,
+    # the points are chosen at the prepared lengths of the initial data
+    from bpns.costs import CostModel
+    points, data = initial_data()
+    opt = Surrogate(bounds, integer=[True, False], acq_func='EI', xi=0.01, random_state=1999)
+    opt.tell(points, data)
+    prepared = set(int(x[0]) for x in points)
+    free = opt.ask()
+    assert free[0] not in prepared
+    opt.cost = CostModel(prepared=prepared)
+    costly = opt.ask()
+    assert costly != free and costly[0] in prepared
+    check_batch(opt.ask(4), points, 4)
@@ -0,0 +1,56 @@
+# Atom selections of the dry trajectory from the topology of the repo (protein/topol.top).
+
+import glob
+import os
+import shutil
+import numpy as np
+
+from conftest import repo_path
+from bpns.trajectory import dry_selection, read_molecules
+
+plastic_itp = '''[ moleculetype ]
+; name  nrexcl
+PLA  3
+
+[ atoms ]
+  1  c3  1  STY  C1  1  -0.1  12.01
+  2  ca  1  STY  C2  2  0.1  12.01
+  3  c3  2  STY  C1  3  -0.1  12.01
+  4  ca  2  STY  C2  4  0.1  12.01
+'''
+
+
+def protein_system(folder, plastic=True):
+    # protein/topol.top (2 protein chains and 2 chains of 2 Ca2+ ions) with the plastic, and a dry group of all the atoms
+    for path in glob.glob(os.path.join(repo_path, 'protein', '*.itp')):
+        shutil.copy(path, folder)
+    with open(os.path.join(repo_path, 'protein', 'topol.top')) as f:
+        top = f.read()
+    if plastic:
+        with open(os.path.join(folder, 'plastic.itp'), 'w') as f:
+            f.write(plastic_itp)
+        top = top.rstrip() + '\nPLA                 1\n'
+    with open(os.path.join(folder, 'topol.top'), 'w') as f:
+        f.write(top)
+    types, molecules = read_molecules(os.path.join(folder, 'topol.top'))
+    n_atoms = sum(len(types[name]) * count for name, count in molecules)
+    with open(os.path.join(folder, 'dry.ndx'), 'w') as f:
+        f.write('[ dry ]\n' + ' '.join(str(a) for a in range(1, n_atoms + 1)) + '\n')
+    atoms = [atom for name, count in molecules for _ in range(count) for atom in types[name]]
+    return np.array([a[1] for a in atoms])
+
+
+def test_plastic_without_ions(tmp_path):
+    residues = protein_system(str(tmp_path))
+    sel = dry_selection(str(tmp_path))
+    assert (residues == 'CAL').sum() == 4
+    assert not np.any(residues[sel['plastic']] == 'CAL')
+    assert sel['plastic'].size == 4 and np.all(residues[sel['plastic']] == 'STY')
+    assert len(sel['chains']) == 2
+
+
+def test_plastic_without_itp(tmp_path):
+    # without plastic.itp there is no plastic, the Ca2+ ions are still left out
+    protein_system(str(tmp_path), plastic=False)
+    sel = dry_selection(str(tmp_path))
+    assert sel['plastic'].size == 0